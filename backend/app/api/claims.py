@@ -1,10 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from typing import List, Literal
-from app.database import get_db
+from typing import List, Literal, Optional
+import os
+from app.database import AsyncSessionLocal
 from app.models import Study as StudyModel
+from app.services.admission import AdmissionRejected, client_key, llm_admission
 from app.services.claim_validator import validate_claim_against_studies
+from app.services.llm_client import UpstreamOverloadedError
+from app.services.retrieval import reciprocal_rank_fusion, refresh_study_index, study_index
+from app.services.validation_cache import cache_key, validation_cache
+from app.services.vector_index import refresh_vector_index, vector_index
+
+# Evidence retrieval backend: "bm25", "semantic" or "hybrid" (both, fused)
+CLAIM_RETRIEVAL = os.getenv("CLAIM_RETRIEVAL", "hybrid")
+# Semantic matches below this cosine similarity don't count as evidence
+CLAIM_SEMANTIC_MIN_SCORE = float(os.getenv("CLAIM_SEMANTIC_MIN_SCORE", "0.3"))
+# Studies retrieved as evidence. Raising this above
+# CLAIM_MAP_REDUCE_THRESHOLD (15) opts into map-reduce validation for
+# claims that match more studies (see claim_validator): about one model
+# call per CLAIM_MAP_CHUNK_SIZE studies plus one, instead of a single call
+CLAIM_EVIDENCE_LIMIT = int(os.getenv("CLAIM_EVIDENCE_LIMIT", "15"))
 
 router = APIRouter()
 
@@ -21,6 +39,18 @@ class EvidenceBreakdown(BaseModel):
     mixed: int
     refuting: int
 
+class TokenUsage(BaseModel):
+    # Estimated tokens of the packed evidence, and of the full abstracts
+    evidence_tokens: int
+    unpacked_evidence_tokens: int
+    # As reported by the API, summed over the model calls
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cache_read_input_tokens: Optional[int] = None
+    cache_creation_input_tokens: Optional[int] = None
+    llm_calls: int = 1
+    latency_ms: Optional[int] = None
+
 class ValidationResponse(BaseModel):
     verdict: Literal["SUPPORTED", "PARTIALLY_SUPPORTED", "NOT_SUPPORTED", "INSUFFICIENT_EVIDENCE"]
     confidence: Literal["high", "moderate", "low"]
@@ -28,12 +58,11 @@ class ValidationResponse(BaseModel):
     evidence: EvidenceBreakdown
     key_studies: List[KeyStudy]
     bottom_line: str
+    # Tokens sent for this request; None when no model call was made
+    usage: Optional[TokenUsage] = None
 
 @router.post("/validate", response_model=ValidationResponse)
-async def validate_fitness_claim(
-    request: ClaimRequest,
-    db: Session = Depends(get_db)
-):
+async def validate_fitness_claim(request: ClaimRequest, http_request: Request):
     """
     Validate a fitness claim against scientific research
     """
@@ -46,8 +75,13 @@ async def validate_fitness_claim(
     # Extract keywords from claim for searching
     keywords = extract_keywords(request.claim)
     
-    # Search for relevant studies
-    relevant_studies = search_relevant_studies(db, keywords)
+    # Search for relevant studies. The session is closed again before the
+    # model call, so queued and in-flight validations don't hold connections
+    async with AsyncSessionLocal() as db:
+        relevant_studies = await search_relevant_studies(db, keywords, CLAIM_EVIDENCE_LIMIT)
+        key = cache_key(request.claim, relevant_studies)
+        # Same claim against the same (unchanged) evidence: reuse the verdict
+        cached = await validation_cache.get(db, key) if relevant_studies else None
     
     if len(relevant_studies) == 0:
         return ValidationResponse(
@@ -59,18 +93,36 @@ async def validate_fitness_claim(
             bottom_line="More research needed. Try rephrasing your claim or check back as we add more studies."
         )
     
+    if cached is not None:
+        return cached
+    
     # Use AI to validate claim against studies
     try:
-        result = await validate_claim_against_studies(
-            claim=request.claim,
-            studies=relevant_studies
-        )
-        return result
+        async with llm_admission.admit(client_key(http_request)):
+            result = await validate_claim_against_studies(
+                claim=request.claim,
+                studies=relevant_studies
+            )
+        usage = result.pop("usage", None)
+        result = ValidationResponse(**result).model_dump(exclude={"usage"})
+    except (AdmissionRejected, UpstreamOverloadedError):
+        # Turned into 429/503 with Retry-After by the app's exception handlers
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Failed to validate claim: {str(e)}"
         )
+    
+    # Cached copies are replayed without a model call, so they carry no usage
+    async with AsyncSessionLocal() as db:
+        await validation_cache.set(db, key, request.claim, result, usage)
+    return {**result, "usage": usage}
+
+@router.get("/cache/stats")
+async def validation_cache_stats():
+    """Hit/miss counters for the claim validation cache"""
+    return validation_cache.stats()
 
 def extract_keywords(claim: str) -> List[str]:
     """
@@ -96,30 +148,33 @@ def extract_keywords(claim: str) -> List[str]:
     # Return unique keywords
     return list(set(keywords))
 
-def search_relevant_studies(db: Session, keywords: List[str], limit: int = 15) -> List[StudyModel]:
+async def search_relevant_studies(db: AsyncSession, keywords: List[str], limit: int = 15) -> List[StudyModel]:
     """
-    Search database for studies relevant to the keywords
+    Return the `limit` studies most relevant to the keywords, best first,
+    ranked by BM25 over title, abstract and MeSH keywords, by semantic
+    similarity, or by both fused (see CLAIM_RETRIEVAL)
     """
     if not keywords:
         return []
     
-    # Build search query
-    query = db.query(StudyModel)
-    
-    # Search across title, abstract, and keywords fields
-    search_conditions = []
-    for keyword in keywords:
-        search_term = f"%{keyword}%"
-        search_conditions.append(
-            (StudyModel.title.ilike(search_term)) |
-            (StudyModel.abstract.ilike(search_term)) |
-            (StudyModel.keywords.ilike(search_term))
-        )
-    
-    # Combine with OR logic
-    if search_conditions:
-        from sqlalchemy import or_
-        query = query.filter(or_(*search_conditions))
+    query = " ".join(keywords)
+    rankings = []
+    # The indexes may be mid-build on another thread; keep the event loop free
+    if CLAIM_RETRIEVAL in ("bm25", "hybrid"):
+        await run_in_threadpool(refresh_study_index)
+        rankings.append(await run_in_threadpool(study_index.search, query, limit))
+    if CLAIM_RETRIEVAL in ("semantic", "hybrid"):
+        await run_in_threadpool(refresh_vector_index)
+        rankings.append(await run_in_threadpool(
+            vector_index.search, query, limit, CLAIM_SEMANTIC_MIN_SCORE
+        ))
+    ranked_ids = [study_id for study_id, _ in reciprocal_rank_fusion(rankings, limit=limit)]
+    if not ranked_ids:
+        return []
     
-    # Return limited results
-    return query.limit(limit).all()
\ No newline at end of file
+    # Rows deleted since they were indexed simply drop out here
+    studies = (await db.execute(
+        select(StudyModel).filter(StudyModel.id.in_(ranked_ids))
+    )).scalars().all()
+    by_id = {study.id: study for study in studies}
+    return [by_id[study_id] for study_id in ranked_ids if study_id in by_id]
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app.models import ClaimValidation, Summary as SummaryModel
+from app.services.llm_usage import llm_usage, stored_usage_stats
+from app.services.response_cache import response_cache
+
+router = APIRouter()
+
+@router.get("/llm")
+async def get_llm_stats(
+    hours: Optional[float] = Query(None, gt=0, description="Only count summaries and validations from the last N hours"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Token usage, prompt cache effectiveness and latency of Anthropic calls.
+
+    `calls` covers every call this process has made, per operation, with
+    latency and time-to-first-token percentiles over recent calls.
+    `summaries` and `claim_validations` aggregate the usage stored with
+    each generated summary and validation, across all workers.
+    """
+    since = datetime.utcnow() - timedelta(hours=hours) if hours else None
+    return {
+        "calls": llm_usage.stats(),
+        "summaries": await db.run_sync(lambda session: stored_usage_stats(session, SummaryModel, since)),
+        "claim_validations": await db.run_sync(
+            lambda session: stored_usage_stats(session, ClaimValidation, since)
+        ),
+    }
+
+@router.get("/response-cache")
+async def get_response_cache_stats():
+    """Hit/miss counters of the study and summary response cache, and 304s sent"""
+    return response_cache.stats()
@@ -1,109 +1,339 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.database import get_db
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from app.database import AsyncSessionLocal, get_async_db
 from app.models import Study as StudyModel, Bookmark as BookmarkModel
-from app.schemas import Study, StudyCreate, StudyUpdate, StudyListResponse, Bookmark, BookmarkCreate
+from app.schemas import (
+    Study, StudyCreate, StudyBulkCreate, StudyBulkResult, StudyUpdate, PartialStudyListResponse,
+    Bookmark, BookmarkCreate,
+)
+from app.services.ingest import bulk_upsert_studies
+from app.services.pagination import apply_keyset, encode_cursor, page_ranked, study_counts
+from app.services.response_cache import STUDY_CACHE_MAX_AGE, latest, make_etag, response_cache
+from app.services.retrieval import reciprocal_rank_fusion, study_index
+from app.services.study_filters import StudyFilters, apply_study_filters, facet_counts
+from app.services.study_terms import link_study
+from app.services.summary_jobs import record_study_view
+from app.services.vector_index import refresh_vector_index, vector_index
+from app.services.search import apply_fulltext_search, apply_substring_search
 
 router = APIRouter()
 
-@router.get("/", response_model=StudyListResponse)
-def list_studies(
+# Semantic and hybrid searches rank at most this many candidates
+RANKED_SEARCH_LIMIT = 500
+# Fields a study list can be projected to with `fields=`
+STUDY_FIELDS = tuple(Study.model_fields)
+
+# The body is built and cached as JSON (see list_studies), so there is no
+# response model to validate against; `fields` decides the study shape
+@router.get("/", response_model=None, responses={200: {
+    "model": PartialStudyListResponse,
+    "description": "A page of studies. Each study has every Study field, or with `fields` only `id` "
+                   "and the requested fields.",
+}})
+async def list_studies(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    mode: Literal["fulltext", "substring", "semantic", "hybrid"] = "fulltext",
+    fields: Optional[str] = Query(
+        None, description="Comma-separated Study fields to return, e.g. title,authors,publication_year"
+    ),
+    author: List[str] = Query([], description="Author name, e.g. Schoenfeld BJ; repeat to require several"),
+    mesh: List[str] = Query([], description="MeSH term, e.g. Muscle, Skeletal; repeat to require several"),
+    journal: List[str] = Query([], description="Journal title; repeat to accept any of several"),
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    facets: bool = Query(False, description="Also return top journals, years and MeSH terms of the matches"),
 ):
-    """List all studies with optional search and pagination"""
-    query = db.query(StudyModel)
-    
-    if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (StudyModel.title.ilike(search_term)) |
-            (StudyModel.abstract.ilike(search_term)) |
-            (StudyModel.keywords.ilike(search_term)) |
-            (StudyModel.authors.ilike(search_term))
+    """
+    List all studies with optional search and pagination
+
+    `fulltext` search is relevance-ranked and supports "quoted phrases" and
+    prefix* terms; `substring` keeps the old ILIKE matching. `semantic`
+    ranks by meaning (matching studies worded differently) and `hybrid`
+    fuses the full-text and semantic rankings; both consider the top
+    RANKED_SEARCH_LIMIT candidates. Results are ordered by rank (or
+    publication year when not searching), newest/best first. Pass the
+    returned `next_cursor` back as `cursor` to fetch the next page; `skip`
+    still works but gets slower on deep pages.
+
+    `author`, `mesh`, `journal` and `year_from`/`year_to` narrow the list
+    (or the search results) through indexed joins on the normalized author
+    and MeSH tables; names match case-insensitively. `facets=true` adds
+    the top journals, years and MeSH terms of everything matched, counted
+    in one query; clients only need it with the first page.
+
+    `fields` limits each study to those fields (plus `id`), and only
+    those columns are read from the database; list views can leave out
+    `abstract`, by far the largest. Rows are serialized straight to JSON
+    with orjson rather than through the Study model.
+
+    Pages are cached (see response_cache) and carry an ETag, so a client
+    revalidating an unchanged page gets a 304.
+    """
+    selected = parse_fields(fields)
+    filters = StudyFilters(tuple(author), tuple(mesh), tuple(journal), year_from, year_to)
+    key = response_cache.key("studies", request)
+    entry = response_cache.get(key)
+    if entry is None:
+        # updated_at is always read for the ETag, even when not returned
+        columns = [getattr(StudyModel, field) for field in selected]
+        if "updated_at" not in selected:
+            columns.append(StudyModel.updated_at)
+        async with AsyncSessionLocal() as db:
+            if search and mode in ("semantic", "hybrid"):
+                result = await list_ranked_studies(db, columns, search, mode, filters, facets, skip, limit, cursor)
+            else:
+                result = await list_matching_studies(db, columns, search, mode, filters, facets, skip, limit, cursor)
+        versions = [(row.id, row.updated_at) for row in result["studies"]]
+        result["studies"] = [dict(zip(selected, row)) for row in result["studies"]]
+        entry = response_cache.set(
+            key,
+            orjson.dumps(result),
+            make_etag(key[2], result["total"], result["next_cursor"], versions),
+            latest(updated_at for _, updated_at in versions),
+            STUDY_CACHE_MAX_AGE,
         )
+    return response_cache.respond(request, entry)
+
+def parse_fields(fields: Optional[str]) -> List[str]:
+    """The requested Study fields in schema order, always including id"""
+    if not fields:
+        return list(STUDY_FIELDS)
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(STUDY_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [field for field in STUDY_FIELDS if field == "id" or field in requested]
+
+async def list_matching_studies(
+    db: AsyncSession, columns: list, search: Optional[str], mode: str, filters: StudyFilters,
+    with_facets: bool, skip: int, limit: int, cursor: Optional[str]
+) -> dict:
+    """
+    Unsearched, full-text or substring listing, paged in the database.
+    Returns the page with `studies` as rows of `columns`.
+    """
+    stmt = select(*columns)
+    sort_key = func.coalesce(StudyModel.publication_year, 0)
     
-    total = query.count()
-    studies = query.offset(skip).limit(limit).all()
+    if search:
+        if mode == "fulltext":
+            stmt, rank = apply_fulltext_search(stmt, search, db.bind.dialect.name)
+            if rank is not None:
+                sort_key = rank
+        else:
+            stmt = apply_substring_search(stmt, search)
+    stmt = apply_study_filters(stmt, filters)
     
-    return StudyListResponse(
-        total=total,
-        studies=studies,
-        page=skip // limit + 1,
-        page_size=limit
+    total, total_estimated = await study_counts.count(
+        db, ("studies", mode, search or "", filters), stmt,
+        table_name=None if search or not filters.is_empty() else StudyModel.__tablename__
     )
+    facets = None
+    if with_facets:
+        facets = await facet_counts(db, stmt.with_only_columns(StudyModel.id, maintain_column_froms=True))
+    
+    stmt = stmt.add_columns(sort_key.label("sort_key"))
+    try:
+        stmt, page = apply_keyset(stmt, sort_key, StudyModel.id, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not cursor:
+        stmt = stmt.offset(skip)
+        page = skip // limit + 1
+    
+    # Fetch one extra row to learn whether there is a next page
+    rows = (await db.execute(stmt.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].sort_key, rows[-1].id, page)
+    
+    return {
+        "total": total,
+        "studies": rows,
+        "page": page,
+        "page_size": limit,
+        "next_cursor": next_cursor,
+        "total_estimated": total_estimated,
+        "facets": facets,
+    }
+
+async def list_ranked_studies(
+    db: AsyncSession, columns: list, search: str, mode: str, filters: StudyFilters, with_facets: bool,
+    skip: int, limit: int, cursor: Optional[str]
+) -> dict:
+    """Semantic/hybrid listing: rank candidates in memory, then load one page"""
+    await run_in_threadpool(refresh_vector_index)
+    ranked = await run_in_threadpool(vector_index.search, search, RANKED_SEARCH_LIMIT)
+    
+    if mode == "hybrid":
+        stmt, rank = apply_fulltext_search(select(StudyModel.id), search, db.bind.dialect.name)
+        if rank is not None:
+            stmt = stmt.add_columns(rank).order_by(rank.desc(), StudyModel.id.desc())
+            lexical = (await db.execute(stmt.limit(RANKED_SEARCH_LIMIT))).all()
+            ranked = reciprocal_rank_fusion([ranked, lexical], limit=RANKED_SEARCH_LIMIT)
+    
+    candidates = select(StudyModel.id).filter(StudyModel.id.in_([study_id for study_id, _ in ranked]))
+    if not filters.is_empty():
+        candidates = apply_study_filters(candidates, filters)
+        matching = set((await db.execute(candidates)).scalars())
+        ranked = [item for item in ranked if item[0] in matching]
+    facets = await facet_counts(db, candidates) if with_facets else None
+    
+    # Same (score, id) descending order the cursor assumes
+    ranked.sort(key=lambda item: (-item[1], -item[0]))
+    try:
+        items, page, next_cursor = page_ranked(ranked, skip, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    ids = [study_id for study_id, _ in items]
+    rows = (await db.execute(select(*columns).filter(StudyModel.id.in_(ids)))).all()
+    by_id = {row.id: row for row in rows}
+    
+    return {
+        "total": len(ranked),
+        "studies": [by_id[study_id] for study_id in ids if study_id in by_id],
+        "page": page,
+        "page_size": limit,
+        "next_cursor": next_cursor,
+        "total_estimated": len(ranked) >= RANKED_SEARCH_LIMIT,
+        "facets": facets,
+    }
 
 @router.get("/{study_id}", response_model=Study)
-def get_study(study_id: int, db: Session = Depends(get_db)):
-    """Get a specific study by ID"""
-    study = db.query(StudyModel).filter(StudyModel.id == study_id).first()
-    if not study:
-        raise HTTPException(status_code=404, detail="Study not found")
-    return study
+async def get_study(study_id: int, request: Request, background_tasks: BackgroundTasks):
+    """Get a specific study by ID (cached, with an ETag from `updated_at`)"""
+    key = response_cache.key("studies", request)
+    entry = response_cache.get(key)
+    if entry is None:
+        async with AsyncSessionLocal() as db:
+            study = await db.get(StudyModel, study_id)
+        if not study:
+            raise HTTPException(status_code=404, detail="Study not found")
+        entry = response_cache.set(
+            key,
+            Study.model_validate(study).model_dump_json().encode(),
+            make_etag(key[2], study.id, study.updated_at),
+            study.updated_at,
+            STUDY_CACHE_MAX_AGE,
+        )
+    response = response_cache.respond(request, entry)
+    # Viewed studies get their summary pre-generated sooner; recorded after
+    # the response is sent. A 304 is a refetch of a page already seen.
+    if response.status_code == 200:
+        background_tasks.add_task(_record_view, study_id)
+    return response
+
+async def _record_view(study_id: int):
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(record_study_view, study_id)
 
 @router.post("/", response_model=Study, status_code=201)
-def create_study(study: StudyCreate, db: Session = Depends(get_db)):
+async def create_study(study: StudyCreate, db: AsyncSession = Depends(get_async_db)):
     """Create a new study"""
     if study.doi:
-        existing = db.query(StudyModel).filter(StudyModel.doi == study.doi).first()
+        existing = (await db.execute(
+            select(StudyModel.id).filter(StudyModel.doi == study.doi)
+        )).first()
         if existing:
             raise HTTPException(status_code=400, detail="Study with this DOI already exists")
-    
-    db_study = StudyModel(**study.dict())
+    if study.pmid:
+        existing = (await db.execute(
+            select(StudyModel.id).filter(StudyModel.pmid == study.pmid)
+        )).first()
+        if existing:
+            raise HTTPException(status_code=400, detail="Study with this PMID already exists")
+
+    db_study = StudyModel(**study.dict(exclude={"mesh_terms"}))
     db.add(db_study)
-    db.commit()
-    db.refresh(db_study)
+    await db.flush()
+    await db.run_sync(link_study, db_study.id, study.dict())
+    await db.commit()
+    await db.refresh(db_study)
+    study_counts.invalidate()
+    response_cache.invalidate_studies()
     return db_study
 
+@router.post("/bulk", response_model=StudyBulkResult)
+async def bulk_create_studies(payload: StudyBulkCreate, db: AsyncSession = Depends(get_async_db)):
+    """
+    Create many studies at once
+
+    Studies that already exist (same DOI, or same title) are skipped, or
+    refreshed with `on_conflict="update"`. Writes are chunked and committed
+    once per chunk rather than once per study.
+    """
+    studies = [study.dict() for study in payload.studies]
+    result = await db.run_sync(bulk_upsert_studies, studies, on_conflict=payload.on_conflict)
+    study_counts.invalidate()
+    response_cache.invalidate_studies()
+    return result
+
 @router.patch("/{study_id}", response_model=Study)
-def update_study(study_id: int, study: StudyUpdate, db: Session = Depends(get_db)):
+async def update_study(study_id: int, study: StudyUpdate, db: AsyncSession = Depends(get_async_db)):
     """Update a study"""
-    db_study = db.query(StudyModel).filter(StudyModel.id == study_id).first()
+    db_study = await db.get(StudyModel, study_id)
     if not db_study:
         raise HTTPException(status_code=404, detail="Study not found")
     
     update_data = study.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_study, key, value)
+    if "authors" in update_data or "keywords" in update_data:
+        await db.run_sync(link_study, study_id, update_data)
     
-    db.commit()
-    db.refresh(db_study)
+    await db.commit()
+    await db.refresh(db_study)
+    study_counts.invalidate()
+    response_cache.invalidate_studies()
     return db_study
 
 @router.delete("/{study_id}", status_code=204)
-def delete_study(study_id: int, db: Session = Depends(get_db)):
+async def delete_study(study_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a study"""
-    study = db.query(StudyModel).filter(StudyModel.id == study_id).first()
+    study = await db.get(StudyModel, study_id)
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
     
-    db.delete(study)
-    db.commit()
+    await db.delete(study)
+    await db.commit()
+    await run_in_threadpool(study_index.remove, study_id)
+    await run_in_threadpool(vector_index.remove, study_id)
+    study_counts.invalidate()
+    # The study's summary went with it
+    response_cache.invalidate_studies()
+    response_cache.invalidate_summaries()
     return None
 
 @router.post("/{study_id}/bookmarks", response_model=Bookmark, status_code=201)
-def create_bookmark(study_id: int, bookmark: BookmarkCreate, db: Session = Depends(get_db)):
+async def create_bookmark(study_id: int, bookmark: BookmarkCreate, db: AsyncSession = Depends(get_async_db)):
     """Bookmark a study"""
-    study = db.query(StudyModel).filter(StudyModel.id == study_id).first()
+    study = await db.get(StudyModel, study_id)
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
     
     db_bookmark = BookmarkModel(**bookmark.dict())
     db.add(db_bookmark)
-    db.commit()
-    db.refresh(db_bookmark)
+    await db.commit()
+    await db.refresh(db_bookmark)
     return db_bookmark
 
 @router.get("/bookmarks/all", response_model=List[Bookmark])
-def list_bookmarks(
+async def list_bookmarks(
     user_id: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """List all bookmarks, optionally filtered by user"""
-    query = db.query(BookmarkModel)
+    stmt = select(BookmarkModel)
     if user_id:
-        query = query.filter(BookmarkModel.user_id == user_id)
-    return query.all()
\ No newline at end of file
+        stmt = stmt.filter(BookmarkModel.user_id == user_id)
+    return (await db.execute(stmt)).scalars().all()
\ No newline at end of file
@@ -1,51 +1,106 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import Study as StudyModel, Summary as SummaryModel
+import json
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal, get_async_db
 from app.schemas import Summary, SummaryCreate
-from app.services.ai_service import generate_summary
+from app.services.admission import AdmissionRejected, client_key
+from app.services.llm_client import UpstreamOverloadedError
+from app.services.response_cache import SUMMARY_CACHE_MAX_AGE, make_etag, response_cache
+from app.services.summary_jobs import summary_job_stats
+from app.services.summary_store import (
+    StudyNotFoundError, SummaryPendingError, get_or_create_summary, load_summary,
+    stream_summary_events
+)
 
 router = APIRouter()
 
 @router.post("/", response_model=Summary, status_code=201)
-async def create_summary(summary_req: SummaryCreate, db: Session = Depends(get_db)):
-    """Generate an AI summary for a study"""
-    
-    study = db.query(StudyModel).filter(StudyModel.id == summary_req.study_id).first()
-    if not study:
-        raise HTTPException(status_code=404, detail="Study not found")
-    
-    existing_summary = db.query(SummaryModel).filter(
-        SummaryModel.study_id == summary_req.study_id
-    ).first()
-    
-    if existing_summary:
-        return existing_summary
-    
+async def create_summary(summary_req: SummaryCreate, request: Request):
+    """Generate an AI summary for a study (or return the existing one)"""
     try:
-        summary_text, model_used = await generate_summary(
-            title=study.title,
-            abstract=study.abstract or "",
-            authors=study.authors or ""
+        return await get_or_create_summary(summary_req.study_id, client_key(request))
+    except (AdmissionRejected, UpstreamOverloadedError):
+        # Turned into 429/503 with Retry-After by the app's exception handlers
+        raise
+    except StudyNotFoundError:
+        raise HTTPException(status_code=404, detail="Study not found")
+    except SummaryPendingError:
+        raise HTTPException(
+            status_code=503,
+            detail="Summary generation is still in progress",
+            headers={"Retry-After": "5"}
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate summary: {str(e)}")
-    
-    db_summary = SummaryModel(
-        study_id=summary_req.study_id,
-        summary_text=summary_text,
-        model_used=model_used
-    )
-    db.add(db_summary)
-    db.commit()
-    db.refresh(db_summary)
-    
-    return db_summary
+
+@router.get("/jobs/stats")
+async def get_summary_job_stats(db: AsyncSession = Depends(get_async_db)):
+    """Queue depth and progress of background summary pre-generation"""
+    return await db.run_sync(summary_job_stats)
 
 @router.get("/{study_id}", response_model=Summary)
-def get_summary(study_id: int, db: Session = Depends(get_db)):
-    """Get the AI summary for a study"""
-    summary = db.query(SummaryModel).filter(SummaryModel.study_id == study_id).first()
-    if not summary:
-        raise HTTPException(status_code=404, detail="Summary not found")
-    return summary
\ No newline at end of file
+async def get_summary(study_id: int, request: Request):
+    """
+    Get the AI summary for a study. Summaries never change once written,
+    so they are cached with a long max-age; a missing one is remembered
+    briefly (see response_cache).
+    """
+    key = response_cache.key("summaries", request)
+    entry = response_cache.get(key)
+    if entry is None:
+        async with AsyncSessionLocal() as db:
+            summary = await load_summary(db, study_id)
+        if not summary:
+            entry = response_cache.set_missing(key, "Summary not found")
+        else:
+            entry = response_cache.set(
+                key,
+                Summary.model_validate(summary).model_dump_json().encode(),
+                make_etag(key[2], summary.id, summary.created_at),
+                summary.created_at,
+                SUMMARY_CACHE_MAX_AGE,
+            )
+    return response_cache.respond(request, entry)
+
+def format_sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+@router.get("/{study_id}/stream")
+async def stream_summary(study_id: int, request: Request):
+    """
+    Stream a study's AI summary as Server-Sent Events.
+
+    Emits `status` and `delta` events ({"text": ...}) while the summary is
+    being written, then a final `summary` event with the stored Summary.
+    Existing summaries are sent as a single `summary` event. Failures
+    after the stream has started arrive as an `error` event.
+    """
+    events = stream_summary_events(study_id, client_key(request))
+    try:
+        first = await events.__anext__()
+    except StudyNotFoundError:
+        raise HTTPException(status_code=404, detail="Study not found")
+
+    async def body():
+        try:
+            event = first
+            while True:
+                kind, value = event
+                if kind == "summary":
+                    yield format_sse("summary", Summary.model_validate(value).model_dump_json())
+                elif kind == "delta":
+                    yield format_sse("delta", json.dumps({"text": value}))
+                else:
+                    yield format_sse(kind, json.dumps({kind: value}))
+                event = await events.__anext__()
+        except StopAsyncIteration:
+            pass
+        except Exception as e:
+            yield format_sse("error", json.dumps({"detail": f"Failed to generate summary: {str(e)}"}))
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
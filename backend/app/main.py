@@ -1,17 +1,51 @@
 # backend/app/main.py
-from fastapi import FastAPI
+import os
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import studies, summaries
-from app.database import engine
+from fastapi.responses import JSONResponse, ORJSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.api import stats, studies, summaries
+from app.database import check_database, engine
+from app.migrations import run_migrations
 from app.models import Base
+from app.services.admission import AdmissionRejected, MAX_RETRY_AFTER, llm_admission
+from app.services.compression import CompressionMiddleware
+from app.services.llm_client import LLMClient, UpstreamOverloadedError, close_llm_client, set_llm_client
+from app.services.metrics import MetricsMiddleware
+from app.services.retrieval import refresh_study_index
+from app.services.search import install_search_index
+from app.services.vector_index import refresh_vector_index
+
+# Seconds /ready waits for the database before reporting it unavailable
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", "2"))
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+run_migrations(engine)
+install_search_index(engine)
+
+def warm_indexes():
+    refresh_study_index(force=True)
+    refresh_vector_index(force=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the retrieval indexes so the first search/validation doesn't pay for them
+    threading.Thread(target=warm_indexes, daemon=True).start()
+    # One pooled LLM client for the whole process
+    set_llm_client(LLMClient())
+    yield
+    await close_llm_client()
 
 app = FastAPI(
     title="Hypertrophy Research Explorer API",
     description="API for searching and analyzing exercise science research",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson encodes several times faster than the stdlib json module
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware for frontend
@@ -23,9 +57,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for large responses (cached ones arrive already compressed)
+app.add_middleware(CompressionMiddleware)
+
+# Outermost, so request latency includes every other middleware
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(UpstreamOverloadedError)
+async def upstream_overloaded_handler(request: Request, exc: UpstreamOverloadedError):
+    # The API is rate limiting us even after retries; pass its hint on
+    retry_after = exc.retry_after or llm_admission.retry_after()
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "AI service is temporarily overloaded"},
+        headers={"Retry-After": str(max(1, min(MAX_RETRY_AFTER, round(retry_after))))}
+    )
+
 # Include routers
 app.include_router(studies.router, prefix="/api/studies", tags=["studies"])
 app.include_router(summaries.router, prefix="/api/summaries", tags=["summaries"])
+app.include_router(stats.router, prefix="/api/stats", tags=["stats"])
 
 from app.api import claims
 app.include_router(claims.router, prefix="/api/claims", tags=["claims"])
@@ -36,4 +95,22 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    """Liveness: the process is up and serving"""
+    return {"status": "healthy"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: the database answers a query within READY_TIMEOUT seconds"""
+    try:
+        await check_database(READY_TIMEOUT)
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "database": type(e).__name__}
+        )
+    return {"status": "ready", "database": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics (see services/metrics)"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
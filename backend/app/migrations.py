@@ -0,0 +1,98 @@
+import re
+import warnings
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SAWarning
+
+# Idempotent schema upgrades for databases created by an older
+# Base.metadata.create_all(). Each step must be safe to run on every start,
+# and quick: every API worker runs them on import. Data backfills that
+# scale with the table are separate commands (backfill_study_terms.py).
+
+def _has_index(conn, table, name):
+    with warnings.catch_warnings():
+        # Expression indexes such as ix_studies_browse_order can't be reflected
+        warnings.simplefilter("ignore", SAWarning)
+        return any(index["name"] == name for index in inspect(conn).get_indexes(table))
+
+def _has_column(conn, table, name):
+    return any(column["name"] == name for column in inspect(conn).get_columns(table))
+
+def unique_summary_per_study(conn):
+    """Drop duplicate summaries (keeping the oldest) and enforce one per study"""
+    if _has_index(conn, "summaries", "ix_summaries_study_id"):
+        return
+    conn.execute(text("""
+        DELETE FROM summaries
+        WHERE id NOT IN (SELECT MIN(id) FROM summaries GROUP BY study_id)
+    """))
+    conn.execute(text("CREATE UNIQUE INDEX ix_summaries_study_id ON summaries (study_id)"))
+
+_PUBMED_URL_RE = re.compile(r"pubmed\.ncbi\.nlm\.nih\.gov/(\d+)")
+
+def study_pmid(conn):
+    """Add studies.pmid, backfilled from the PubMed URL in pdf_url"""
+    if _has_index(conn, "studies", "ix_studies_pmid"):
+        return
+    if not _has_column(conn, "studies", "pmid"):
+        conn.execute(text("ALTER TABLE studies ADD COLUMN pmid VARCHAR"))
+
+    rows = conn.execute(text(
+        "SELECT id, pdf_url FROM studies WHERE pmid IS NULL AND pdf_url LIKE '%pubmed.ncbi.nlm.nih.gov/%' ORDER BY id"
+    )).all()
+    seen = set()
+    updates = []
+    for study_id, pdf_url in rows:
+        match = _PUBMED_URL_RE.search(pdf_url)
+        # Leave later copies of an already-claimed PMID empty so the unique index builds
+        if match and match.group(1) not in seen:
+            seen.add(match.group(1))
+            updates.append({"id": study_id, "pmid": match.group(1)})
+    if updates:
+        conn.execute(text("UPDATE studies SET pmid = :pmid WHERE id = :id"), updates)
+    conn.execute(text("CREATE UNIQUE INDEX ix_studies_pmid ON studies (pmid)"))
+
+def summary_job_batch_id(conn):
+    """Add summary_jobs.batch_id for batch-mode summarization"""
+    if _has_column(conn, "summary_jobs", "batch_id"):
+        return
+    conn.execute(text("ALTER TABLE summary_jobs ADD COLUMN batch_id VARCHAR"))
+    conn.execute(text("CREATE INDEX ix_summary_jobs_batch_id ON summary_jobs (batch_id)"))
+
+USAGE_COLUMNS = ["input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens", "latency_ms", "ttft_ms"]
+
+def llm_usage_columns(conn):
+    """Add token and latency columns to summaries and claim_validations"""
+    for table, columns in (
+        ("summaries", USAGE_COLUMNS),
+        ("claim_validations", USAGE_COLUMNS + ["llm_calls"]),
+    ):
+        for column in columns:
+            if not _has_column(conn, table, column):
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER"))
+
+def study_journal_index(conn):
+    """Index lower(journal) for the journal filter and facet"""
+    # Expression indexes can't be reflected, so rely on IF NOT EXISTS
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_studies_journal_lower ON studies (lower(journal))"))
+
+def study_browse_indexes(conn):
+    """Index the keyset browse order, and updated_at for the search index refresh"""
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_studies_browse_order ON studies (coalesce(publication_year, 0), id)"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_studies_updated_at ON studies (updated_at)"))
+
+MIGRATIONS = [
+    unique_summary_per_study,
+    study_pmid,
+    summary_job_batch_id,
+    llm_usage_columns,
+    study_journal_index,
+    study_browse_indexes,
+]
+
+def run_migrations(engine):
+    """Apply every upgrade step in order"""
+    for migration in MIGRATIONS:
+        with engine.begin() as conn:
+            migration(conn)
@@ -1,8 +1,18 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
 
+class LLMUsageMixin:
+    """Tokens and latency of the model call(s) that produced a row (see llm_usage)"""
+    input_tokens = Column(Integer)
+    output_tokens = Column(Integer)
+    cache_read_tokens = Column(Integer)
+    cache_write_tokens = Column(Integer)
+    latency_ms = Column(Integer)
+    # Time to first token, for streamed generations
+    ttft_ms = Column(Integer)
+
 class Study(Base):
     __tablename__ = "studies"
     
@@ -13,13 +23,69 @@ class Study(Base):
     publication_year = Column(Integer)
     journal = Column(String)
     doi = Column(String, unique=True, index=True)
+    pmid = Column(String, unique=True, index=True)
     pdf_url = Column(String)
     keywords = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     bookmarks = relationship("Bookmark", back_populates="study", cascade="all, delete-orphan")
     summaries = relationship("Summary", back_populates="study", cascade="all, delete-orphan")
+    summary_job = relationship("SummaryJob", uselist=False, cascade="all, delete-orphan")
+    author_links = relationship("StudyAuthor", cascade="all, delete-orphan")
+    mesh_term_links = relationship("StudyMeshTerm", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # Keyset pagination order for browsing: newest first, then id
+        Index("ix_studies_browse_order", func.coalesce(publication_year, 0), id),
+        # Journal filter and facet, matched case-insensitively
+        Index("ix_studies_journal_lower", func.lower(journal)),
+    )
+
+class Author(Base):
+    """One distinct author name ("Schoenfeld BJ"), shared by their studies"""
+    __tablename__ = "authors"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)
+    
+    __table_args__ = (
+        Index("ix_authors_name_lower", func.lower(name)),
+    )
+
+class StudyAuthor(Base):
+    __tablename__ = "study_authors"
+    
+    study_id = Column(Integer, ForeignKey("studies.id"), primary_key=True)
+    author_id = Column(Integer, ForeignKey("authors.id"), primary_key=True)
+    # Order in the author list, 0 for the first author
+    position = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # Author filter: studies of an author without touching `studies`
+        Index("ix_study_authors_author", author_id, study_id),
+    )
+
+class MeshTerm(Base):
+    """One distinct MeSH descriptor ("Muscle, Skeletal")"""
+    __tablename__ = "mesh_terms"
+    
+    id = Column(Integer, primary_key=True)
+    term = Column(String, nullable=False, unique=True)
+    
+    __table_args__ = (
+        Index("ix_mesh_terms_term_lower", func.lower(term)),
+    )
+
+class StudyMeshTerm(Base):
+    __tablename__ = "study_mesh_terms"
+    
+    study_id = Column(Integer, ForeignKey("studies.id"), primary_key=True)
+    mesh_term_id = Column(Integer, ForeignKey("mesh_terms.id"), primary_key=True)
+    
+    __table_args__ = (
+        Index("ix_study_mesh_terms_term", mesh_term_id, study_id),
+    )
 
 class Bookmark(Base):
     __tablename__ = "bookmarks"
@@ -32,13 +98,66 @@ class Bookmark(Base):
     
     study = relationship("Study", back_populates="bookmarks")
 
-class Summary(Base):
+class Summary(LLMUsageMixin, Base):
     __tablename__ = "summaries"
     
     id = Column(Integer, primary_key=True, index=True)
-    study_id = Column(Integer, ForeignKey("studies.id"), nullable=False)
+    # One summary per study, enforced by the database across workers
+    study_id = Column(Integer, ForeignKey("studies.id"), nullable=False, unique=True, index=True)
     summary_text = Column(Text, nullable=False)
     model_used = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    study = relationship("Study", back_populates="summaries")
\ No newline at end of file
+    study = relationship("Study", back_populates="summaries")
+
+class SummaryJob(Base):
+    """Pre-generation job for a study's summary, worked by summary_worker.py"""
+    __tablename__ = "summary_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    study_id = Column(Integer, ForeignKey("studies.id"), nullable=False, unique=True)
+    # Higher runs first
+    priority = Column(Integer, nullable=False, default=0)
+    # pending -> running -> done, or back to pending with a later run_after
+    # until the attempts run out (failed)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    # A running job whose lease has expired belongs to a dead worker
+    locked_until = Column(DateTime)
+    worker = Column(String)
+    # Message Batches API batch the job was submitted in, while it runs
+    batch_id = Column(String, index=True)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    
+    __table_args__ = (
+        Index("ix_summary_jobs_queue", status, priority),
+    )
+
+class Lease(Base):
+    """Short-lived named lock shared by every worker process"""
+    __tablename__ = "leases"
+    
+    key = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+class SyncState(Base):
+    """Watermark for an incremental sync, e.g. the last run of one PubMed query"""
+    __tablename__ = "sync_state"
+    
+    key = Column(String, primary_key=True)
+    last_run_at = Column(DateTime, nullable=False)
+
+class ClaimValidation(LLMUsageMixin, Base):
+    """Persisted claim-validation results, keyed on claim text + evidence set"""
+    __tablename__ = "claim_validations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+    claim = Column(Text, nullable=False)
+    result = Column(Text, nullable=False)
+    llm_calls = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Literal, Union
 from datetime import datetime
 
 class StudyBase(BaseModel):
@@ -9,11 +9,23 @@ class StudyBase(BaseModel):
     publication_year: Optional[int] = None
     journal: Optional[str] = None
     doi: Optional[str] = None
+    pmid: Optional[str] = None
     pdf_url: Optional[str] = None
     keywords: Optional[str] = None
 
 class StudyCreate(StudyBase):
-    pass
+    # Exact MeSH descriptors for the MeSH filter; otherwise taken from keywords
+    mesh_terms: Optional[List[str]] = None
+
+class StudyBulkCreate(BaseModel):
+    studies: List[StudyCreate] = Field(..., max_length=10000)
+    # "skip" leaves existing studies alone; "update" refreshes them
+    on_conflict: Literal["skip", "update"] = "skip"
+
+class StudyBulkResult(BaseModel):
+    added: int
+    updated: int
+    skipped: int
 
 class StudyUpdate(BaseModel):
     title: Optional[str] = None
@@ -60,8 +72,40 @@ class Summary(BaseModel):
     class Config:
         from_attributes = True
 
+class FacetCount(BaseModel):
+    value: Union[int, str]
+    count: int
+
+class StudyFacets(BaseModel):
+    journals: List[FacetCount]
+    years: List[FacetCount]
+    mesh_terms: List[FacetCount]
+
 class StudyListResponse(BaseModel):
     total: int
     studies: List[Study]
     page: int
-    page_size: int
\ No newline at end of file
+    page_size: int
+    next_cursor: Optional[str] = None
+    total_estimated: bool = False
+    # Only with facets=true
+    facets: Optional[StudyFacets] = None
+
+class PartialStudy(BaseModel):
+    """A study projected with `fields=`: `id` plus the requested fields"""
+    id: int
+    title: Optional[str] = None
+    authors: Optional[str] = None
+    abstract: Optional[str] = None
+    publication_year: Optional[int] = None
+    journal: Optional[str] = None
+    doi: Optional[str] = None
+    pmid: Optional[str] = None
+    pdf_url: Optional[str] = None
+    keywords: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class PartialStudyListResponse(StudyListResponse):
+    # Full studies without `fields`, PartialStudy with it
+    studies: List[Union[Study, PartialStudy]]
\ No newline at end of file
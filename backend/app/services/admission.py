@@ -0,0 +1,157 @@
+"""
+Admission control for the LLM-backed endpoints.
+
+Each summary or claim validation that needs the model must first be
+admitted: at most `max_concurrent` run at once across the process, and at
+most `max_per_client` (running or queued) per client. Further requests
+wait in a bounded FIFO queue for up to `queue_timeout` seconds. A request
+that would exceed its client's share is rejected with 429; one that finds
+the queue full, or times out in it, gets 503. Both carry a Retry-After
+estimated from recent service times.
+
+Only the model call is admitted. Cache hits and stored summaries never
+queue, and no DB session should be held while waiting or generating.
+
+All limits are per process: the counters live in memory, so each uvicorn
+(or gunicorn) worker admits up to LLM_MAX_CONCURRENT model calls, and
+LLM_MAX_PER_CLIENT requests per client, on its own. With N workers the
+upstream concurrency can reach N * LLM_MAX_CONCURRENT; divide the limits
+by the worker count to keep a deployment-wide budget.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable, Optional
+
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "16"))
+LLM_MAX_PER_CLIENT = int(os.getenv("LLM_MAX_PER_CLIENT", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Use the first X-Forwarded-For address as the client (only behind a trusted proxy)
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+MAX_RETRY_AFTER = 60
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted; respond with `status_code` and Retry-After"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Global and per-client concurrency limits with a bounded wait queue"""
+
+    def __init__(
+        self,
+        max_concurrent: int = LLM_MAX_CONCURRENT,
+        max_per_client: int = LLM_MAX_PER_CLIENT,
+        max_queue: int = LLM_MAX_QUEUE,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_client = max_per_client
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._running = 0
+        self._waiting = 0
+        self._per_client: Dict[Hashable, int] = Counter()
+        # Exponentially weighted mean of how long an admitted request runs
+        self._service_time = 10.0
+        self.admitted = 0
+        self.rejected = Counter()
+
+    async def acquire(self, client: Optional[Hashable]) -> float:
+        """
+        Wait for a slot for `client` (None for internal callers, which only
+        count towards the global limit). Returns a ticket for release().
+        Raises AdmissionRejected when the client is over its limit, the
+        queue is full, or no slot frees up within the queue timeout.
+        """
+        if client is not None and self._per_client[client] >= self.max_per_client:
+            self._reject("client")
+            raise AdmissionRejected(
+                429, "Too many concurrent AI requests from this client", self.retry_after()
+            )
+        if self._slots.locked() and self._waiting >= self.max_queue:
+            self._reject("queue_full")
+            raise AdmissionRejected(503, "AI service is at capacity", self.retry_after())
+
+        if client is not None:
+            self._per_client[client] += 1
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._release_client(client)
+            self._reject("timeout")
+            raise AdmissionRejected(503, "Timed out waiting for AI capacity", self.retry_after())
+        except BaseException:
+            self._release_client(client)
+            raise
+        finally:
+            self._waiting -= 1
+
+        self._running += 1
+        self.admitted += 1
+        return time.monotonic()
+
+    def release(self, client: Optional[Hashable], ticket: float):
+        elapsed = time.monotonic() - ticket
+        self._service_time += 0.2 * (elapsed - self._service_time)
+        self._running -= 1
+        self._slots.release()
+        self._release_client(client)
+
+    @asynccontextmanager
+    async def admit(self, client: Optional[Hashable]):
+        ticket = await self.acquire(client)
+        try:
+            yield
+        finally:
+            self.release(client, ticket)
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained"""
+        waves = (self._waiting + 1) / self.max_concurrent
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(waves * self._service_time)))
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "clients": len(self._per_client),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "service_time": round(self._service_time, 3),
+        }
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+
+    def _release_client(self, client: Optional[Hashable]):
+        if client is None:
+            return
+        self._per_client[client] -= 1
+        if self._per_client[client] <= 0:
+            del self._per_client[client]
+
+
+def client_key(request) -> str:
+    """Identify the client behind a FastAPI/Starlette request"""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+llm_admission = AdmissionController()
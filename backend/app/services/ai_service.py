@@ -1,21 +1,14 @@
-import os
-import httpx
-from typing import Tuple
+import time
+from typing import AsyncIterator, Optional, Tuple
+from app.services.appraisal import APPRAISAL_GUIDE
+from app.services.llm_client import cached_system, get_llm_client
+from app.services.llm_usage import call_usage, create_message, error_status, llm_usage
 
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
+SUMMARY_MODEL = "claude-sonnet-4-20250514"
 
-async def generate_summary(title: str, abstract: str, authors: str) -> Tuple[str, str]:
-    """Generate a comprehensive summary of a research study using Claude API"""
-    if not ANTHROPIC_API_KEY:
-        raise ValueError("ANTHROPIC_API_KEY not set")
-    
-    prompt = f"""You are an expert exercise scientist and research analyst. Provide a comprehensive, in-depth analysis of this research study for fitness professionals, coaches, and serious athletes.
-
-Study Details:
-Title: {title}
-Authors: {authors}
-Abstract: {abstract}
+# Static instructions, sent after the appraisal guide as a cached system
+# prompt; only the study varies
+SUMMARY_SYSTEM_PROMPT = """You are an expert exercise scientist and research analyst. Provide a comprehensive, in-depth analysis of the research study you are given for fitness professionals, coaches, and serious athletes.
 
 Create a detailed analysis covering:
 
@@ -61,28 +54,64 @@ Create a detailed analysis covering:
 
 Be specific with numbers, percentages, and measurements. Write in clear, accessible language while maintaining scientific accuracy. Aim for depth over brevity."""
 
-    model = "claude-sonnet-4-20250514"
+def build_summary_request(title: str, abstract: str, authors: str) -> dict:
+    """Messages API payload asking Claude to summarize one study"""
+    prompt = f"""Study Details:
+Title: {title}
+Authors: {authors}
+Abstract: {abstract}"""
+
+    return {
+        "model": SUMMARY_MODEL,
+        "max_tokens": 4096,  # Increased from 1024 for longer responses
+        "system": cached_system(APPRAISAL_GUIDE, SUMMARY_SYSTEM_PROMPT),
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    }
+
+async def generate_summary(title: str, abstract: str, authors: str) -> Tuple[str, str, dict]:
+    """
+    Generate a comprehensive summary of a research study using Claude API.
+    Returns the text, the model and the call's usage (see llm_usage).
+    """
+    data, usage = await create_message("summary", build_summary_request(title, abstract, authors))
+    
+    summary_text = data["content"][0]["text"]
     
-    async with httpx.AsyncClient(timeout=60.0) as client:  # Increased timeout
-        response = await client.post(
-            ANTHROPIC_API_URL,
-            headers={
-                "x-api-key": ANTHROPIC_API_KEY,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json"
-            },
-            json={
-                "model": model,
-                "max_tokens": 4096,  # Increased from 1024 for longer responses
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ]
-            }
-        )
-        
-        response.raise_for_status()
-        data = response.json()
-        
-        summary_text = data["content"][0]["text"]
-        
-        return summary_text, model
\ No newline at end of file
+    return summary_text, SUMMARY_MODEL, usage
+
+async def stream_summary(
+    title: str, abstract: str, authors: str, usage: Optional[dict] = None
+) -> AsyncIterator[str]:
+    """
+    Like generate_summary, but yield the text piece by piece as Claude
+    writes it. Once the stream ends, the call's usage (including time to
+    first token) is recorded and copied into `usage` if given.
+    """
+    payload = build_summary_request(title, abstract, authors)
+    started = time.monotonic()
+    first_token = None
+    api_usage = {}
+    try:
+        async for event in get_llm_client().stream_message(payload):
+            if event.get("type") == "message_start":
+                # Input and cache token counts arrive up front...
+                api_usage.update(event.get("message", {}).get("usage", {}))
+            elif event.get("type") == "message_delta":
+                # ...and the output count at the end
+                api_usage.update(event.get("usage", {}))
+            elif event.get("type") == "content_block_delta":
+                delta = event.get("delta", {})
+                if delta.get("type") == "text_delta":
+                    if first_token is None:
+                        first_token = time.monotonic() - started
+                    yield delta["text"]
+    except BaseException as e:
+        llm_usage.record_error("summary_stream", error_status(e), time.monotonic() - started)
+        raise
+
+    call = call_usage(api_usage, time.monotonic() - started, ttft=first_token)
+    llm_usage.record("summary_stream", call)
+    if usage is not None:
+        usage.update(call)
@@ -0,0 +1,60 @@
+"""
+Evidence appraisal guide shared by the summary and claim validation
+prompts.
+
+It leads every system prompt, so study summaries and claim verdicts weigh
+evidence the same way. It also makes each static system prompt longer
+than the API's minimum cacheable prefix (1024 tokens for Sonnet), so the
+cache breakpoint at its end takes effect: after the first call in a
+cache window, the whole prefix is read back at a tenth of the input price
+instead of being processed again.
+"""
+
+APPRAISAL_GUIDE = """# Appraising exercise science research
+
+Apply this guide whenever you judge what a study shows. Work only from the study details you are given; never invent numbers, participants or findings that are not there, and say so when a detail you would need is missing.
+
+## Study design
+Rank the strength of evidence by design, strongest first:
+1. Systematic reviews and meta-analyses of randomized controlled trials, particularly with meta-regression of dose-response relationships.
+2. Randomized controlled trials. Within-subject (unilateral, one limb per condition) designs control for genetics and diet but can suffer from cross-education effects.
+3. Non-randomized controlled trials and crossover studies.
+4. Cohort, cross-sectional and case-control studies, which show association rather than causation.
+5. Case reports, narrative reviews and expert opinion.
+Acute studies (a single session, or measures taken within hours, such as muscle protein synthesis or hormone responses) are mechanistic evidence. They do not show long-term hypertrophy or strength outcomes on their own, and acute muscle protein synthesis often fails to predict long-term growth, especially in untrained people whose early response is dominated by muscle damage repair.
+
+## Participants
+- Sample size: most training studies have 10-40 participants, so they are underpowered for small effects. Treat a non-significant result from a small study as inconclusive, not as evidence of no effect.
+- Training status: untrained participants respond to almost any stimulus, so differences between protocols shrink; findings in trained lifters (typically at least one year of consistent resistance training) generalize better to serious athletes.
+- Sex, age and health status: results in young men do not automatically transfer to women, adolescents or older adults; sarcopenic and clinical populations respond differently.
+- Diet and supplementation: note whether energy and protein intake were controlled or at least recorded, since they confound hypertrophy outcomes.
+
+## Interventions
+- Volume: count hard sets per muscle group per week. Dose-response evidence favors more volume up to roughly 10-20 weekly sets, with diminishing and uncertain returns beyond.
+- Intensity and proximity to failure: loads from about 30% to 85% of one-repetition maximum produce similar hypertrophy when sets are taken close to failure; heavier loads are better for maximal strength.
+- Frequency: when weekly volume is equated, training a muscle once versus two or more times per week makes little difference to growth.
+- Duration: interventions shorter than 6-8 weeks capture mostly neural adaptation and edema; 8-12 weeks or more is needed for meaningful hypertrophy.
+- Equating: check whether the compared conditions were matched for volume, load and effort; unequal volume explains many apparent differences between protocols.
+
+## Outcome measures
+- Direct measures of muscle size, strongest first: MRI or CT cross-sectional area, ultrasound muscle thickness, muscle biopsy fiber cross-sectional area.
+- Indirect measures: DXA or bioelectrical impedance lean body mass include water, glycogen and organs, so they are easily confounded by hydration and carbohydrate intake.
+- Strength: one-repetition maximum improves with practice of the tested lift, so strength gains are partly skill; isometric and isokinetic tests transfer less to training.
+- Measurements taken within 48-72 hours of a session can be inflated by muscle swelling.
+
+## Results
+- Report effect sizes with their units: absolute and percentage changes, standardized mean differences and confidence intervals where given. A 1-2% difference in muscle thickness over 8 weeks is within measurement error for most methods.
+- Separate statistical from practical significance. A significant p-value with a trivial effect is not a practical recommendation, and a large but non-significant effect in a small sample deserves mention as uncertain.
+- Watch for selective reporting: many secondary outcomes, subgroup analyses or per-region measures without correction make chance findings likely.
+- Individual responses vary widely; group means hide responders and non-responders.
+
+## Bias and limitations
+- Funding and conflicts of interest, especially supplement studies funded by manufacturers.
+- Lack of blinding of assessors, missing placebo control for supplements, high or unequal dropout, and per-protocol rather than intention-to-treat analysis.
+- Short follow-up and lack of replication: a single study, however well designed, is not a consensus.
+
+## Confidence
+- High: several well-designed trials or a meta-analysis with consistent, meaningful effects in a relevant population.
+- Moderate: some good trials with inconsistent results, indirect outcome measures or a narrow population.
+- Low: a single small study, mechanistic or acute data only, observational data, or conflicting findings.
+State the population and conditions a conclusion applies to, and prefer "the evidence suggests" over certainty when confidence is not high."""
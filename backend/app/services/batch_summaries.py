@@ -0,0 +1,319 @@
+"""
+Batch-mode summarization through the Anthropic Message Batches API.
+
+Instead of one Messages call per study, pending summary jobs are claimed
+in bulk, packed into a batch (custom_id "study-<id>"), and the batch is
+polled until it has ended. Its JSONL results are then streamed back and
+written to `summaries` in chunks, one transaction per chunk, together
+with marking those jobs done. Batched requests are billed at half price
+and don't count against the per-request rate limits, at the cost of
+latency (most batches end within an hour, and always within 24).
+
+Per-request failures in a batch are handled like the worker's:
+transient errors and expired or canceled requests are rescheduled with
+backoff and go into a later batch; invalid requests fail for good.
+Jobs are claimed as BATCH_WORKER_ID with the ordinary SUMMARY_JOB_LEASE
+and only get the batch lease once their batch_id is recorded, so a
+restarted run resumes the batches that were still in flight rather than
+submitting them again. If a run died between submitting a batch and
+recording its id, the next run finds the batch in the API's batch list
+and matches its results to the unassigned batch-claimed jobs by
+custom_id before submitting anything new.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import httpx
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.database import AsyncSessionLocal, dialect_insert
+from app.models import Study as StudyModel, Summary as SummaryModel
+from app.services.ai_service import SUMMARY_MODEL, build_summary_request
+from app.services.llm_client import get_llm_client
+from app.services.llm_usage import call_usage, llm_usage, usage_columns
+from app.services.summary_jobs import (
+    BATCH_WORKER_ID, ClaimedJob, assign_summary_batch, batch_summary_jobs, claim_summary_jobs, complete_summary_jobs,
+    fail_summary_jobs, in_flight_summary_batches, release_summary_jobs, unassigned_summary_jobs
+)
+
+# The API allows up to 100,000 requests or 256 MB per batch
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "1000"))
+SUMMARY_BATCH_MAX_BYTES = int(os.getenv("SUMMARY_BATCH_MAX_BYTES", str(200 * 1024 * 1024)))
+SUMMARY_BATCH_POLL_INTERVAL = float(os.getenv("SUMMARY_BATCH_POLL_INTERVAL", "30"))
+SUMMARY_BATCH_POLL_MAX = float(os.getenv("SUMMARY_BATCH_POLL_MAX", "300"))
+# Batches expire after 24 hours; the jobs' lease must outlive that
+SUMMARY_BATCH_LEASE = float(os.getenv("SUMMARY_BATCH_LEASE", str(26 * 3600)))
+# Results written per transaction
+SUMMARY_BATCH_WRITE_CHUNK = 500
+# Batches created this long before the earliest unassigned job was claimed
+# are still searched for its results (clock skew against the API)
+SUMMARY_BATCH_ADOPT_SLACK = timedelta(minutes=5)
+
+BATCHES_PATH = "/v1/messages/batches"
+
+# Error types worth another attempt in a later batch
+RETRYABLE_ERROR_TYPES = {"api_error", "overloaded_error", "rate_limit_error", "timeout_error"}
+
+
+def custom_id(study_id: int) -> str:
+    return f"study-{study_id}"
+
+
+def _load_studies(db: Session, study_ids: List[int]) -> Dict[int, StudyModel]:
+    studies = db.execute(select(StudyModel).where(StudyModel.id.in_(study_ids))).scalars().all()
+    return {study.id: study for study in studies}
+
+
+def _store_results(db: Session, succeeded: List[tuple], jobs_by_study: Dict[int, ClaimedJob]):
+    """Insert summaries (keeping any that already exist) and mark their jobs done, atomically"""
+    now = datetime.utcnow()
+    db.execute(
+        dialect_insert(db.get_bind().dialect.name, SummaryModel.__table__)
+        .on_conflict_do_nothing(index_elements=["study_id"]),
+        [
+            {
+                "study_id": study_id, "summary_text": text, "model_used": model, "created_at": now,
+                **usage_columns(usage),
+            }
+            for study_id, text, model, usage in succeeded
+        ],
+    )
+    complete_summary_jobs(db, [jobs_by_study[study_id].id for study_id, *_ in succeeded], commit=False)
+    db.commit()
+
+
+async def submit_summary_batch(limit: int = SUMMARY_BATCH_SIZE) -> Optional[str]:
+    """
+    Claim up to `limit` ready jobs and submit them as one batch. Returns
+    the batch id, or None when no job was ready.
+    """
+    async with AsyncSessionLocal() as db:
+        # Short lease until the batch id is recorded (assign_summary_batch)
+        jobs = await db.run_sync(lambda session: claim_summary_jobs(session, limit, worker=BATCH_WORKER_ID))
+        if not jobs:
+            return None
+        studies = await db.run_sync(lambda session: _load_studies(session, [job.study_id for job in jobs]))
+
+    requests, submitted, missing, size = [], [], [], 0
+    for job in jobs:
+        study = studies.get(job.study_id)
+        if study is None:
+            missing.append(job)
+            continue
+        request = {
+            "custom_id": custom_id(study.id),
+            "params": build_summary_request(study.title, study.abstract or "", study.authors or ""),
+        }
+        request_size = len(json.dumps(request))
+        if size + request_size > SUMMARY_BATCH_MAX_BYTES:
+            break
+        requests.append(request)
+        submitted.append(job)
+        size += request_size
+
+    # Jobs that didn't fit go back to the queue for the next batch
+    overflow = [job.id for job in jobs[len(submitted) + len(missing):]]
+    async with AsyncSessionLocal() as db:
+        if missing:
+            await db.run_sync(lambda session: fail_summary_jobs(session, missing, "Study not found", retry=False))
+        if overflow:
+            await db.run_sync(lambda session: release_summary_jobs(session, overflow))
+    if not requests:
+        return None
+
+    try:
+        response = await get_llm_client().request("POST", BATCHES_PATH, json={"requests": requests})
+    except Exception as e:
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(
+                lambda session: fail_summary_jobs(session, submitted, f"Batch submission failed: {e}")
+            )
+        raise
+    batch = response.json()
+
+    async with AsyncSessionLocal() as db:
+        await db.run_sync(
+            lambda session: assign_summary_batch(
+                session, [job.id for job in submitted], batch["id"], lease=SUMMARY_BATCH_LEASE
+            )
+        )
+    return batch["id"]
+
+
+def _created_at(batch: dict) -> datetime:
+    return datetime.fromisoformat(batch["created_at"].replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+async def list_summary_batches(since: datetime) -> List[dict]:
+    """Batches created since `since` (UTC), newest first, from the API's batch list"""
+    client = get_llm_client()
+    batches, params = [], {"limit": 100}
+    while True:
+        page = (await client.request("GET", BATCHES_PATH, params=params)).json()
+        for batch in page["data"]:
+            if _created_at(batch) < since:
+                return batches
+            batches.append(batch)
+        if not page.get("has_more"):
+            return batches
+        params["after_id"] = page["last_id"]
+
+
+async def wait_for_batch(batch_id: str, poll_interval: float = SUMMARY_BATCH_POLL_INTERVAL) -> dict:
+    """Poll a batch, backing off up to SUMMARY_BATCH_POLL_MAX, until it has ended"""
+    client = get_llm_client()
+    while True:
+        batch = (await client.request("GET", f"{BATCHES_PATH}/{batch_id}")).json()
+        if batch["processing_status"] == "ended":
+            return batch
+        await asyncio.sleep(poll_interval)
+        poll_interval = min(poll_interval * 1.5, SUMMARY_BATCH_POLL_MAX)
+
+
+async def collect_summary_batch(batch: dict, adopt: bool = False) -> Dict[str, int]:
+    """
+    Stream an ended batch's results into `summaries` and settle its jobs.
+    Returns counts of succeeded, retried and failed requests.
+
+    With `adopt`, the batch's id was never recorded: its results are
+    matched by custom_id to running jobs that have no batch_id, and other
+    results are ignored.
+    """
+    async with AsyncSessionLocal() as db:
+        if adopt:
+            jobs, _ = await db.run_sync(unassigned_summary_jobs)
+        else:
+            jobs = await db.run_sync(lambda session: batch_summary_jobs(session, batch["id"]))
+    jobs_by_study = {job.study_id: job for job in jobs}
+    counts = {"succeeded": 0, "retried": 0, "failed": 0}
+    succeeded: List[tuple] = []
+    retry: Dict[str, List[ClaimedJob]] = {}
+    give_up: Dict[str, List[ClaimedJob]] = {}
+
+    async def flush():
+        if succeeded:
+            rows = list(succeeded)
+            succeeded.clear()
+            async with AsyncSessionLocal() as db:
+                await db.run_sync(lambda session: _store_results(session, rows, jobs_by_study))
+
+    seen = set()
+    results_url = batch.get("results_url") or f"{BATCHES_PATH}/{batch['id']}/results"
+    async for line in get_llm_client().iter_lines(results_url):
+        entry = json.loads(line)
+        study_id = int(entry["custom_id"].rsplit("-", 1)[1])
+        job = jobs_by_study.get(study_id)
+        if job is None or study_id in seen:
+            # Settled by an earlier, interrupted collection
+            continue
+        seen.add(study_id)
+        result = entry["result"]
+        if result["type"] == "succeeded":
+            message = result["message"]
+            text = "".join(block.get("text", "") for block in message["content"] if block.get("type") == "text")
+            usage = call_usage(message.get("usage"), latency=None)
+            llm_usage.record("summary_batch", usage)
+            succeeded.append((study_id, text, message.get("model", SUMMARY_MODEL), usage))
+            counts["succeeded"] += 1
+            if len(succeeded) >= SUMMARY_BATCH_WRITE_CHUNK:
+                await flush()
+        elif result["type"] == "errored":
+            error = result.get("error", {})
+            # The error object is wrapped in an error response
+            error = error.get("error", error)
+            reason = f"{error.get('type', 'error')}: {error.get('message', '')}"
+            llm_usage.record_error("summary_batch", error.get("type", "error"))
+            target = retry if error.get("type") in RETRYABLE_ERROR_TYPES else give_up
+            target.setdefault(reason, []).append(job)
+        else:
+            # canceled or expired: never ran, so try again in a later batch
+            retry.setdefault(f"Batch request {result['type']}", []).append(job)
+    await flush()
+
+    # Unassigned jobs missing from an adopted batch were never in it
+    unanswered = [job for study_id, job in jobs_by_study.items() if study_id not in seen and not adopt]
+    if unanswered:
+        retry.setdefault("No result in batch", []).extend(unanswered)
+
+    async with AsyncSessionLocal() as db:
+        for reason, failed in retry.items():
+            counts["retried"] += len(failed)
+            await db.run_sync(lambda session: fail_summary_jobs(session, failed, reason, retry=True))
+        for reason, failed in give_up.items():
+            counts["failed"] += len(failed)
+            await db.run_sync(lambda session: fail_summary_jobs(session, failed, reason, retry=False))
+    return counts
+
+
+async def run_summary_batches(
+    batch_size: int = SUMMARY_BATCH_SIZE,
+    max_batches: int = 4,
+    poll_interval: float = SUMMARY_BATCH_POLL_INTERVAL,
+    on_batch=None,
+) -> Dict[str, int]:
+    """
+    Resume any batches left in flight, then keep up to `max_batches`
+    batches running until no job is ready and none are in flight.
+    Requests rescheduled with a backoff that hasn't passed by then are
+    left for the next run (or the summary worker). `on_batch(batch,
+    counts)` is called as each batch is collected.
+    """
+    totals = {"batches": 0, "succeeded": 0, "retried": 0, "failed": 0}
+
+    async def settle(batch_id: str, adopt: bool = False):
+        try:
+            batch = await wait_for_batch(batch_id, poll_interval)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404:
+                raise
+            if adopt:
+                return
+            # The API no longer knows the batch; resubmit its requests
+            async with AsyncSessionLocal() as db:
+                jobs = await db.run_sync(lambda session: batch_summary_jobs(session, batch_id))
+                await db.run_sync(lambda session: fail_summary_jobs(session, jobs, "Batch not found"))
+            totals["retried"] += len(jobs)
+            return
+        counts = await collect_summary_batch(batch, adopt=adopt)
+        if adopt and not any(counts.values()):
+            # Not the lost batch (e.g. one collected by an earlier run)
+            return
+        totals["batches"] += 1
+        for key in counts:
+            totals[key] += counts[key]
+        if on_batch:
+            on_batch(batch, counts)
+
+    async with AsyncSessionLocal() as db:
+        resumed = await db.run_sync(in_flight_summary_batches)
+        _, claimed_since = await db.run_sync(unassigned_summary_jobs)
+    in_flight = {asyncio.create_task(settle(batch_id)) for batch_id in resumed}
+
+    try:
+        if claimed_since is not None:
+            # Jobs submitted by a run that died before recording the batch
+            # id. Collect such batches before claiming anything, so their
+            # jobs aren't submitted (and paid for) twice once the short
+            # lease expires.
+            for batch in await list_summary_batches(claimed_since - SUMMARY_BATCH_ADOPT_SLACK):
+                if batch["id"] not in resumed:
+                    await settle(batch["id"], adopt=True)
+        while True:
+            while len(in_flight) < max_batches:
+                batch_id = await submit_summary_batch(batch_size)
+                if batch_id is None:
+                    break
+                in_flight.add(asyncio.create_task(settle(batch_id)))
+            if not in_flight:
+                return totals
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    except BaseException:
+        # Leave the batches running; their jobs keep their batch_id and are
+        # resumed by the next run
+        for task in in_flight:
+            task.cancel()
+        raise
@@ -1,36 +1,49 @@
+import asyncio
+import json
 import os
-import httpx
-from typing import List
+import time
+from typing import Dict, List, Literal, Optional
 from app.models import Study as StudyModel
+from app.services.appraisal import APPRAISAL_GUIDE
+from app.services.evidence import pack_evidence
+from app.services.llm_client import cached_system
+from app.services.llm_usage import add_usage, create_message
 
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
-ANTHROPIC_API_URL = "https://api.anthropic.com/v1/messages"
+CLAIM_MODEL = "claude-sonnet-4-20250514"
 
-async def validate_claim_against_studies(claim: str, studies: List[StudyModel]):
-    """
-    Use Claude to validate a fitness claim against relevant studies
-    """
-    if not ANTHROPIC_API_KEY:
-        raise ValueError("ANTHROPIC_API_KEY not set")
-    
-    # Format studies for the prompt
-    studies_text = ""
-    for i, study in enumerate(studies, 1):
-        studies_text += f"\n\nStudy {i}:\n"
-        studies_text += f"Title: {study.title}\n"
-        studies_text += f"Authors: {study.authors or 'N/A'}\n"
-        studies_text += f"Year: {study.publication_year or 'N/A'}\n"
-        studies_text += f"Abstract: {study.abstract or 'No abstract available'}\n"
-    
-    prompt = f"""You are an expert exercise scientist analyzing a fitness claim against scientific research.
-
-CLAIM TO VALIDATE:
-"{claim}"
+# "single" sends every study in one prompt; "map_reduce" classifies chunks
+# of studies concurrently and then asks for a verdict over the
+# classifications; "auto" uses map-reduce once the evidence set is larger
+# than CLAIM_MAP_REDUCE_THRESHOLD, which only happens once the API's
+# CLAIM_EVIDENCE_LIMIT (15 by default) is raised above it. A map-reduce
+# validation is admitted as one request but makes a call per chunk (up to
+# CLAIM_MAP_CONCURRENCY at once) plus the reduce call
+CLAIM_VALIDATION_MODE = os.getenv("CLAIM_VALIDATION_MODE", "auto")
+CLAIM_MAP_REDUCE_THRESHOLD = int(os.getenv("CLAIM_MAP_REDUCE_THRESHOLD", "15"))
+CLAIM_MAP_CHUNK_SIZE = int(os.getenv("CLAIM_MAP_CHUNK_SIZE", "10"))
+CLAIM_MAP_CONCURRENCY = int(os.getenv("CLAIM_MAP_CONCURRENCY", "10"))
+# Evidence tokens per map chunk
+CLAIM_MAP_CHUNK_BUDGET = int(os.getenv("CLAIM_MAP_CHUNK_BUDGET", "2000"))
 
-RELEVANT RESEARCH STUDIES:
-{studies_text}
+ValidationMode = Literal["auto", "single", "map_reduce"]
+STANCES = ("supporting", "mixed", "refuting", "irrelevant")
 
-Based on these studies, provide a structured analysis in the following JSON format:
+VERDICT_GUIDELINES = """Guidelines:
+- SUPPORTED: Strong evidence supporting the claim
+- PARTIALLY_SUPPORTED: Some evidence supports it but with important caveats/context
+- NOT_SUPPORTED: Evidence contradicts the claim
+- INSUFFICIENT_EVIDENCE: Studies don't directly address this claim
+
+- Confidence HIGH: Multiple high-quality studies with consistent findings
+- Confidence MODERATE: Some studies but mixed results or methodological limitations
+- Confidence LOW: Very limited or indirect evidence"""
+
+# The static instructions of each prompt are sent after the appraisal guide
+# as a cached system prompt; the claim and the evidence follow in the user
+# message
+SINGLE_SYSTEM_PROMPT = f"""You are an expert exercise scientist analyzing a fitness claim against scientific research.
+
+You will be given a claim and the relevant research studies, numbered Study 1, Study 2, and so on. Based on these studies, provide a structured analysis in the following JSON format:
 
 {{
   "verdict": "SUPPORTED" | "PARTIALLY_SUPPORTED" | "NOT_SUPPORTED" | "INSUFFICIENT_EVIDENCE",
@@ -43,7 +56,7 @@ Based on these studies, provide a structured analysis in the following JSON form
   }},
   "key_studies": [
     {{
-      "id": <study number from 1-{len(studies)}>,
+      "id": <study number>,
       "title": "study title",
       "finding": "1 sentence on what this study found regarding the claim"
     }}
@@ -51,66 +64,260 @@ Based on these studies, provide a structured analysis in the following JSON form
   "bottom_line": "2-3 sentences with the practical takeaway"
 }}
 
-Guidelines:
-- SUPPORTED: Strong evidence supporting the claim
-- PARTIALLY_SUPPORTED: Some evidence supports it but with important caveats/context
-- NOT_SUPPORTED: Evidence contradicts the claim
-- INSUFFICIENT_EVIDENCE: Studies don't directly address this claim
-
-- Confidence HIGH: Multiple high-quality studies with consistent findings
-- Confidence MODERATE: Some studies but mixed results or methodological limitations
-- Confidence LOW: Very limited or indirect evidence
+{VERDICT_GUIDELINES}
 
 Be specific with numbers and cite which studies support/refute the claim. Include the 3-5 most relevant studies in key_studies.
 
 Respond ONLY with valid JSON, no additional text."""
 
-    model = "claude-sonnet-4-20250514"
-    
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        response = await client.post(
-            ANTHROPIC_API_URL,
-            headers={
-                "x-api-key": ANTHROPIC_API_KEY,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json"
-            },
-            json={
-                "model": model,
-                "max_tokens": 2048,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ]
-            }
-        )
-        
-        response.raise_for_status()
-        data = response.json()
-        
-        response_text = data["content"][0]["text"]
-        
-        # Parse JSON response
-        import json
-        
-        # Clean up response if it has markdown code blocks
-        if response_text.startswith("```"):
-            response_text = response_text.split("```")[1]
-            if response_text.startswith("json"):
-                response_text = response_text[4:]
-        
-        result = json.loads(response_text.strip())
-        
-        # Map study IDs to actual database IDs
-        key_studies_with_ids = []
-        for key_study in result.get("key_studies", []):
-            study_idx = key_study.get("id", 1) - 1  # Convert to 0-based index
-            if 0 <= study_idx < len(studies):
-                key_studies_with_ids.append({
-                    "id": studies[study_idx].id,  # Use actual database ID
-                    "title": key_study.get("title", studies[study_idx].title),
-                    "finding": key_study.get("finding", "")
-                })
-        
-        result["key_studies"] = key_studies_with_ids
-        
-        return result
\ No newline at end of file
+MAP_SYSTEM_PROMPT = """You are an expert exercise scientist assessing research studies against a fitness claim.
+
+You will be given a claim and a numbered set of studies. For each study, classify whether its findings support the claim, and respond in the following JSON format:
+
+{
+  "studies": [
+    {
+      "id": <study number>,
+      "stance": "supporting" | "mixed" | "refuting" | "irrelevant",
+      "finding": "1 sentence on what this study found regarding the claim"
+    }
+  ]
+}
+
+- supporting: the study's findings back the claim
+- mixed: the findings are nuanced, conditional or partly contradict the claim
+- refuting: the findings contradict the claim
+- irrelevant: the study doesn't address the claim
+
+Include every study. Be specific with numbers in the findings.
+
+Respond ONLY with valid JSON, no additional text."""
+
+REDUCE_SYSTEM_PROMPT = f"""You are an expert exercise scientist analyzing a fitness claim against scientific research.
+
+You will be given a claim, and each relevant study's classification against it (supporting, mixed or refuting) with its key finding. Based on these findings, provide a structured analysis in the following JSON format:
+
+{{
+  "verdict": "SUPPORTED" | "PARTIALLY_SUPPORTED" | "NOT_SUPPORTED" | "INSUFFICIENT_EVIDENCE",
+  "confidence": "high" | "moderate" | "low",
+  "summary": "2-3 sentence summary of what the research shows",
+  "key_studies": [<study numbers of the 3-5 most relevant studies>],
+  "bottom_line": "2-3 sentences with the practical takeaway"
+}}
+
+{VERDICT_GUIDELINES}
+
+Respond ONLY with valid JSON, no additional text."""
+
+async def validate_claim_against_studies(
+    claim: str, studies: List[StudyModel], mode: Optional[ValidationMode] = None
+):
+    """
+    Use Claude to validate a fitness claim against relevant studies
+
+    The result includes a `usage` entry with the estimated evidence tokens
+    (packed, and what full abstracts would have cost), the input, output
+    and cache tokens the API reported summed over the model calls made,
+    the number of calls and the overall latency.
+    """
+    mode = mode or CLAIM_VALIDATION_MODE
+    started = time.monotonic()
+    if mode == "map_reduce" or (mode == "auto" and len(studies) > CLAIM_MAP_REDUCE_THRESHOLD):
+        result = await validate_claim_map_reduce(claim, studies)
+    else:
+        result = await _validate_single(claim, studies)
+    result["usage"]["latency_ms"] = round((time.monotonic() - started) * 1000)
+    return result
+
+async def _validate_single(claim: str, studies: List[StudyModel]):
+    # Keep the most claim-relevant passages of each abstract, within budget
+    evidence = pack_evidence(claim, studies)
+    studies = evidence.studies
+    studies_text = evidence.text
+
+    prompt = f"""CLAIM TO VALIDATE:
+"{claim}"
+
+RELEVANT RESEARCH STUDIES (Study 1-{len(studies)}):
+{studies_text}"""
+
+    data, call = await create_message("claim_single", {
+        "model": CLAIM_MODEL,
+        "max_tokens": 2048,
+        "system": cached_system(APPRAISAL_GUIDE, SINGLE_SYSTEM_PROMPT),
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    })
+
+    result = parse_json_response(data)
+
+    # Map study IDs to actual database IDs
+    key_studies_with_ids = []
+    for key_study in result.get("key_studies", []):
+        study_idx = key_study.get("id", 1) - 1  # Convert to 0-based index
+        if 0 <= study_idx < len(studies):
+            key_studies_with_ids.append({
+                "id": studies[study_idx].id,  # Use actual database ID
+                "title": key_study.get("title", studies[study_idx].title),
+                "finding": key_study.get("finding", "")
+            })
+
+    result["key_studies"] = key_studies_with_ids
+    result["usage"] = {
+        "evidence_tokens": evidence.tokens,
+        "unpacked_evidence_tokens": evidence.unpacked_tokens,
+        **add_usage({}, call),
+    }
+
+    return result
+
+async def validate_claim_map_reduce(
+    claim: str,
+    studies: List[StudyModel],
+    chunk_size: int = CLAIM_MAP_CHUNK_SIZE,
+    concurrency: int = CLAIM_MAP_CONCURRENCY,
+):
+    """
+    Validate a claim against a large evidence set in two steps.
+
+    Map: the studies are split into chunks of `chunk_size` and each chunk
+    is classified (stance plus a one-sentence finding per study) by its own
+    model call, at most `concurrency` at a time. Latency therefore grows
+    with the number of waves of chunks rather than with prompt size.
+
+    Reduce: one short call turns the per-study classifications into the
+    verdict, summary and key studies. The evidence counts are tallied from
+    the classifications rather than left to the model.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def classify(start: int):
+        async with semaphore:
+            return await _classify_chunk(claim, studies[start:start + chunk_size], start + 1)
+
+    tasks = [asyncio.ensure_future(classify(start)) for start in range(0, len(studies), chunk_size)]
+    try:
+        chunks = await asyncio.gather(*tasks)
+    except BaseException:
+        # Don't leave the other chunks running upstream once the request has failed
+        for task in tasks:
+            task.cancel()
+        raise
+
+    classifications: Dict[int, dict] = {}
+    usage = {"evidence_tokens": 0, "unpacked_evidence_tokens": 0}
+    for chunk_classifications, chunk_usage in chunks:
+        classifications.update(chunk_classifications)
+        usage["evidence_tokens"] += chunk_usage["evidence_tokens"]
+        usage["unpacked_evidence_tokens"] += chunk_usage["unpacked_evidence_tokens"]
+        add_usage(usage, chunk_usage)
+
+    counts = {stance: 0 for stance in STANCES if stance != "irrelevant"}
+    for classification in classifications.values():
+        if classification["stance"] in counts:
+            counts[classification["stance"]] += 1
+
+    relevant = {
+        number: classification for number, classification in sorted(classifications.items())
+        if classification["stance"] != "irrelevant"
+    }
+    if not relevant:
+        return {
+            "verdict": "INSUFFICIENT_EVIDENCE",
+            "confidence": "low",
+            "summary": "None of the retrieved studies directly address this claim.",
+            "evidence": counts,
+            "key_studies": [],
+            "bottom_line": "More research needed. Try rephrasing your claim or check back as we add more studies.",
+            "usage": usage,
+        }
+
+    result, reduce_usage = await _reduce_classifications(claim, studies, relevant, counts)
+    add_usage(usage, reduce_usage)
+
+    key_studies = []
+    for number in result.get("key_studies", []):
+        if isinstance(number, dict):
+            number = number.get("id")
+        if number in relevant:
+            study = studies[number - 1]
+            key_studies.append({"id": study.id, "title": study.title, "finding": relevant[number]["finding"]})
+
+    result["evidence"] = counts
+    result["key_studies"] = key_studies
+    result["usage"] = usage
+    return result
+
+async def _classify_chunk(claim: str, chunk: List[StudyModel], first_number: int):
+    """Map step: stance and finding for each study in `chunk`, keyed by study number"""
+    evidence = pack_evidence(claim, chunk, budget=CLAIM_MAP_CHUNK_BUDGET, first_number=first_number)
+    last_number = first_number + len(chunk) - 1
+
+    prompt = f"""CLAIM:
+"{claim}"
+
+STUDIES (Study {first_number}-{last_number}):
+{evidence.text}"""
+
+    data, usage = await create_message("claim_map", {
+        "model": CLAIM_MODEL,
+        "max_tokens": 150 * len(chunk) + 100,
+        "system": cached_system(APPRAISAL_GUIDE, MAP_SYSTEM_PROMPT),
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    })
+    response = parse_json_response(data)
+
+    classifications = {}
+    for item in response.get("studies", []):
+        number = item.get("id")
+        stance = str(item.get("stance", "")).lower()
+        if isinstance(number, int) and first_number <= number <= last_number and stance in STANCES:
+            classifications[number] = {"stance": stance, "finding": item.get("finding", "")}
+
+    usage["evidence_tokens"] = evidence.tokens
+    usage["unpacked_evidence_tokens"] = evidence.unpacked_tokens
+    return classifications, usage
+
+async def _reduce_classifications(
+    claim: str, studies: List[StudyModel], relevant: Dict[int, dict], counts: Dict[str, int]
+):
+    """Reduce step: verdict over the per-study classifications"""
+    lines = []
+    for number, classification in relevant.items():
+        study = studies[number - 1]
+        year = study.publication_year or "N/A"
+        lines.append(f"Study {number} [{classification['stance']}] ({study.title}, {year}): {classification['finding']}")
+    findings_text = "\n".join(lines)
+
+    prompt = f"""CLAIM TO VALIDATE:
+"{claim}"
+
+Each relevant study has already been classified against the claim:
+{findings_text}
+
+Totals: {counts['supporting']} supporting, {counts['mixed']} mixed, {counts['refuting']} refuting."""
+
+    data, usage = await create_message("claim_reduce", {
+        "model": CLAIM_MODEL,
+        "max_tokens": 1024,
+        "system": cached_system(APPRAISAL_GUIDE, REDUCE_SYSTEM_PROMPT),
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    })
+    return parse_json_response(data), usage
+
+def parse_json_response(data: dict) -> dict:
+    """Decode the JSON object in a Messages API response"""
+    response_text = data["content"][0]["text"]
+
+    # Clean up response if it has markdown code blocks
+    if response_text.startswith("```"):
+        response_text = response_text.split("```")[1]
+        if response_text.startswith("json"):
+            response_text = response_text[4:]
+
+    return json.loads(response_text.strip())
@@ -0,0 +1,116 @@
+"""
+Response compression: brotli when the client accepts it and the `brotli`
+package is installed, gzip otherwise.
+
+Cached responses are compressed once per encoding by the response cache
+(see response_cache); everything else goes through
+`CompressionMiddleware`, which only compresses complete bodies of at
+least COMPRESS_MIN_SIZE bytes and never touches event streams, since
+buffering inside the compressor would hold back SSE deltas.
+"""
+import gzip
+import os
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this aren't worth the CPU (or the framing overhead)
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+# On a 100-study page (~290 KB) brotli 5 takes ~7 ms and gzip 6 ~13 ms,
+# both ~8x smaller; the top levels cost 2-100x the CPU for 5-15% less
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+SKIP_MEDIA_TYPES = ("text/event-stream",)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best encoding the client accepts ("br" or "gzip"), or None for identity"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    def allowed(encoding: str) -> bool:
+        return accepted.get(encoding, accepted.get("*", 0.0)) > 0
+
+    if brotli is not None and allowed("br"):
+        return "br"
+    if allowed("gzip"):
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compress large, complete responses the client accepts compressed"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "").split(";")[0]
+                passthrough = "content-encoding" in headers or media_type in SKIP_MEDIA_TYPES
+                if passthrough:
+                    await send(message)
+                else:
+                    # Hold the headers back until the body shows whether to compress
+                    start = message
+                return
+            if passthrough or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            initial, start = start, None
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                # Streamed or small: send as is from here on
+                passthrough = True
+                await send(initial)
+                await send(message)
+                return
+
+            body = compress(body, encoding)
+            headers = MutableHeaders(raw=initial["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(initial)
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,138 @@
+"""
+Evidence packing for the claim validation prompt.
+
+Rather than pasting every retrieved abstract in full, each abstract is
+split into sentences, the sentences are scored against the claim, and the
+best ones are kept within a token budget. The budget is shared out by
+retrieval rank, so the best-matching studies get the most room, and
+whatever a study doesn't need rolls over to the studies after it. Every
+study keeps its header, so "Study N" in the model's answer still refers to
+the Nth retrieved study.
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import List, NamedTuple, Optional, Sequence, Set, Tuple
+from app.models import Study as StudyModel
+from app.services.retrieval import tokenize
+
+EVIDENCE_TOKEN_BUDGET = int(os.getenv("EVIDENCE_TOKEN_BUDGET", "2500"))
+# Rough size of a token in English text; close enough for budgeting
+CHARS_PER_TOKEN = 4
+# Below this, a study gets its header only rather than a cut-off sentence
+MIN_EXCERPT_TOKENS = 20
+MAX_AUTHORS = 3
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\"'])")
+# Structured-abstract sections that carry the study's findings
+_FINDINGS_LABELS = ("RESULT", "CONCLUSION", "FINDING")
+
+
+class PackedEvidence(NamedTuple):
+    text: str
+    # "Study N" in the prompt is studies[N - first_number]
+    studies: List[StudyModel]
+    # Estimated tokens of `text`, and of the same studies with full abstracts
+    tokens: int
+    unpacked_tokens: int
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text or "") if sentence.strip()]
+
+
+def pack_evidence(
+    claim: str, studies: Sequence[StudyModel], budget: int = EVIDENCE_TOKEN_BUDGET, first_number: int = 1
+) -> PackedEvidence:
+    """
+    Format `studies` (best first) for the prompt, keeping abstracts within
+    `budget` tokens. Studies are numbered from `first_number`.
+    """
+    claim_terms = set(tokenize(claim))
+    sentences = [split_sentences(study.abstract) for study in studies]
+    sentence_terms = [[set(tokenize(sentence)) & claim_terms for sentence in group] for group in sentences]
+
+    # IDF over this evidence set, so claim terms every study mentions
+    # ("muscle") count for less than the distinctive ones
+    n_sentences = sum(len(group) for group in sentences) or 1
+    df = Counter(term for group in sentence_terms for terms in group for term in terms)
+    idf = {term: math.log(1 + n_sentences / (1 + df[term])) for term in claim_terms}
+
+    # Linear rank weights: the top study gets n shares, the last gets one
+    weights = [len(studies) - i for i in range(len(studies))]
+    remaining_budget = float(budget)
+    remaining_weight = sum(weights)
+
+    blocks = []
+    unpacked_tokens = 0
+    for number, (study, group, terms, weight) in enumerate(zip(studies, sentences, sentence_terms, weights), first_number):
+        share = remaining_budget * weight / remaining_weight
+        remaining_weight -= weight
+        excerpt, complete = _select_excerpt(group, terms, idf, share)
+        remaining_budget = max(0.0, remaining_budget - estimate_tokens(excerpt))
+        blocks.append(_format_study(number, study, excerpt, complete))
+        unpacked_tokens += estimate_tokens(_format_study(number, study, study.abstract, True, max_authors=None))
+
+    text = "".join(blocks)
+    return PackedEvidence(text, list(studies), estimate_tokens(text), unpacked_tokens)
+
+
+def _select_excerpt(
+    sentences: List[str], terms: List[Set[str]], idf: dict, budget: float
+) -> Tuple[str, bool]:
+    """Best sentences that fit in `budget` tokens, in their original order. Returns (excerpt, complete)."""
+    if not sentences:
+        return "", True
+
+    def rank(position: int):
+        sentence = sentences[position]
+        score = sum(idf[term] for term in terms[position])
+        findings = position == len(sentences) - 1 or sentence.upper().startswith(_FINDINGS_LABELS)
+        return score, findings, -position
+
+    chosen = []
+    used = 0
+    for position in sorted(range(len(sentences)), key=rank, reverse=True):
+        cost = estimate_tokens(sentences[position]) + 1
+        if used + cost <= budget:
+            chosen.append(position)
+            used += cost
+
+    if not chosen:
+        if budget < MIN_EXCERPT_TOKENS:
+            return "", False
+        best = max(range(len(sentences)), key=rank)
+        return sentences[best][:int(budget) * CHARS_PER_TOKEN].rstrip() + "…", False
+
+    chosen.sort()
+    parts = [sentences[chosen[0]]]
+    for previous, position in zip(chosen, chosen[1:]):
+        parts.append(" " if position == previous + 1 else " … ")
+        parts.append(sentences[position])
+    return "".join(parts), len(chosen) == len(sentences)
+
+
+def _format_study(
+    number: int, study: StudyModel, excerpt: str, complete: bool, max_authors: Optional[int] = MAX_AUTHORS
+) -> str:
+    authors = study.authors or "N/A"
+    names = [name.strip() for name in authors.split(",")]
+    if max_authors is not None and len(names) > max_authors:
+        authors = ", ".join(names[:max_authors]) + " et al."
+
+    text = f"\n\nStudy {number}:\n"
+    text += f"Title: {study.title}\n"
+    text += f"Authors: {authors}\n"
+    text += f"Year: {study.publication_year or 'N/A'}\n"
+    if not study.abstract:
+        text += "Abstract: No abstract available\n"
+    elif complete:
+        text += f"Abstract: {excerpt}\n"
+    elif excerpt:
+        text += f"Abstract (excerpts): {excerpt}\n"
+    return text
@@ -0,0 +1,265 @@
+"""
+Bulk study ingestion.
+
+Studies are written in chunks. Each chunk costs one query to find the rows
+that already exist (same PMID, else same DOI, else same exact title), one
+multi-row INSERT ... ON CONFLICT DO NOTHING for the new ones, one
+executemany UPDATE when refreshing existing rows, and a single COMMIT. On
+Postgres with psycopg2, chunks with many new rows are streamed through COPY
+into a temporary table and inserted from there.
+
+The same commit links the added and updated studies to their normalized
+authors and MeSH terms (see study_terms).
+"""
+import io
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Literal
+from sqlalchemy import bindparam, delete, func, or_, select, text, update
+from sqlalchemy.orm import Session
+from app.database import dialect_insert
+from app.models import Study as StudyModel
+from app.services.study_terms import known_mesh_terms, study_terms, sync_study_terms
+
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))
+# Chunks with at least this many new studies use COPY when the driver allows it
+INGEST_COPY_THRESHOLD = int(os.getenv("INGEST_COPY_THRESHOLD", "500"))
+
+STUDY_FIELDS = (
+    "title", "authors", "abstract", "publication_year", "journal", "doi", "pmid", "pdf_url", "keywords",
+)
+# Unique per study, so only ever filled in, never overwritten
+IDENTIFIER_FIELDS = ("doi", "pmid")
+
+OnConflict = Literal["skip", "update"]
+
+
+def bulk_upsert_studies(
+    db: Session,
+    studies: Iterable[dict],
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    on_conflict: OnConflict = "skip",
+) -> Dict[str, int]:
+    """
+    Insert `studies` (dicts with StudyCreate's fields, plus optionally
+    the parser's full `mesh_terms` list) in chunks.
+
+    Studies matching an existing row are skipped, or with
+    `on_conflict="update"` have that row's fields refreshed from the
+    non-null incoming values. `studies` may be any iterable, so a parser
+    generator can be ingested without materialising it.
+    Returns counts of added, updated and skipped studies.
+    """
+    totals = {"added": 0, "updated": 0, "skipped": 0}
+    chunk: List[dict] = []
+    for study in studies:
+        chunk.append(study)
+        if len(chunk) >= chunk_size:
+            _ingest_chunk(db, chunk, on_conflict, totals)
+            chunk = []
+    if chunk:
+        _ingest_chunk(db, chunk, on_conflict, totals)
+    return totals
+
+
+def _ingest_chunk(db: Session, chunk: List[dict], on_conflict: OnConflict, totals: Dict[str, int]):
+    # Normalise and drop duplicates within the chunk itself
+    rows, sources = [], []
+    pmids, dois, titles = set(), set(), {}
+    for study in chunk:
+        row = {field: study.get(field) for field in STUDY_FIELDS}
+        row["doi"] = row["doi"] or None
+        row["pmid"] = row["pmid"] or None
+        if (
+            not row["title"]
+            or row["pmid"] in pmids
+            or row["doi"] in dois
+            or (row["title"] in titles and _same_study(row, titles[row["title"]]))
+        ):
+            totals["skipped"] += 1
+            continue
+        if row["pmid"]:
+            pmids.add(row["pmid"])
+        if row["doi"]:
+            dois.add(row["doi"])
+        titles.setdefault(row["title"], row["pmid"])
+        rows.append(row)
+        sources.append(study)
+    if not rows:
+        return
+    known_terms = known_mesh_terms(
+        db, (study.get("keywords") for study in sources if study.get("mesh_terms") is None)
+    )
+    row_terms = [study_terms(study, known_terms) for study in sources]
+
+    conditions = [StudyModel.title.in_(titles)]
+    if pmids:
+        conditions.append(StudyModel.pmid.in_(pmids))
+    if dois:
+        conditions.append(StudyModel.doi.in_(dois))
+    existing = db.execute(
+        select(StudyModel.id, StudyModel.pmid, StudyModel.doi, StudyModel.title).where(or_(*conditions))
+    ).all()
+    by_pmid = {row.pmid: row.id for row in existing if row.pmid}
+    by_doi = {row.doi: row.id for row in existing if row.doi}
+    by_title = {row.title: row for row in existing}
+
+    new_rows, new_terms, updates = [], {}, []
+    terms_by_study = {}
+    for row, terms in zip(rows, row_terms):
+        existing_id = by_pmid.get(row["pmid"]) or by_doi.get(row["doi"])
+        match = by_title.get(row["title"])
+        if existing_id is None and match is not None and _same_study(row, match.pmid):
+            existing_id = match.id
+        if existing_id is None:
+            new_rows.append(row)
+            new_terms[_identity(row)] = terms
+        elif on_conflict == "update":
+            updates.append({"b_id": existing_id, **{f"b_{field}": row[field] for field in STUDY_FIELDS}})
+            terms_by_study[existing_id] = terms
+        else:
+            totals["skipped"] += 1
+
+    now = datetime.utcnow()
+    if new_rows:
+        if len(new_rows) >= INGEST_COPY_THRESHOLD and _supports_copy(db):
+            inserted = _copy_insert(db, new_rows, now)
+        else:
+            table = StudyModel.__table__
+            stmt = (
+                dialect_insert(db.get_bind().dialect.name, table)
+                .on_conflict_do_nothing()
+                .returning(table.c.id, table.c.pmid, table.c.doi, table.c.title)
+            )
+            params = [{**row, "created_at": now, "updated_at": now} for row in new_rows]
+            inserted = db.execute(stmt, params).all()
+        for study in inserted:
+            terms_by_study[study.id] = new_terms[_identity(study._mapping)]
+        totals["added"] += len(inserted)
+        # Lost a race with a concurrent writer on PMID or DOI
+        totals["skipped"] += len(new_rows) - len(inserted)
+
+    if updates:
+        table = StudyModel.__table__
+        values = {
+            field: func.coalesce(bindparam(f"b_{field}"), table.c[field])
+            for field in STUDY_FIELDS if field not in IDENTIFIER_FIELDS
+        }
+        # Only fill in missing identifiers; never repoint ones already set
+        for field in IDENTIFIER_FIELDS:
+            values[field] = func.coalesce(table.c[field], bindparam(f"b_{field}"))
+        values["updated_at"] = now
+        db.execute(update(table).where(table.c.id == bindparam("b_id")).values(values), updates)
+        totals["updated"] += len(updates)
+
+    sync_study_terms(db, terms_by_study)
+    db.commit()
+
+
+def _identity(row) -> tuple:
+    """
+    What tells the new rows of a chunk apart, so inserted ids can be
+    matched back to them: PMID, else DOI, else title (see the dedup above)
+    """
+    if row["pmid"]:
+        return ("pmid", row["pmid"])
+    if row["doi"]:
+        return ("doi", row["doi"])
+    return ("title", row["title"])
+
+
+def _same_study(row: dict, other_pmid) -> bool:
+    """
+    Whether `row` duplicates a study with the same title and PMID
+    `other_pmid`. Distinct PubMed records can share a title (errata,
+    letters...), so two different PMIDs never count as duplicates.
+    """
+    return not (row["pmid"] and other_pmid and row["pmid"] != other_pmid)
+
+
+def delete_studies_by_pmid(db: Session, pmids: Iterable[str], chunk_size: int = INGEST_CHUNK_SIZE) -> int:
+    """
+    Delete the studies with these PMIDs, along with the rows the ORM
+    cascades to (bookmarks, summaries, summary jobs, author and MeSH
+    links). Returns how many studies were deleted.
+
+    Each chunk is one DELETE ... WHERE ... IN per table rather than a
+    load and delete per study. Authors and MeSH terms themselves stay, as
+    with the cascade. The full-text index follows through its triggers
+    (SQLite) or generated column (Postgres); the in-process BM25 index
+    drops the studies when it next reconciles.
+    """
+    pmids = list(pmids)
+    dependents = [
+        relationship.mapper.class_
+        for relationship in StudyModel.__mapper__.relationships if relationship.cascade.delete
+    ]
+    deleted = 0
+    for i in range(0, len(pmids), chunk_size):
+        batch = pmids[i:i + chunk_size]
+        study_ids = select(StudyModel.id).where(StudyModel.pmid.in_(batch))
+        for model in dependents:
+            db.execute(
+                delete(model).where(model.study_id.in_(study_ids)),
+                execution_options={"synchronize_session": False},
+            )
+        deleted += db.execute(
+            delete(StudyModel).where(StudyModel.pmid.in_(batch)),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+    db.commit()
+    return deleted
+
+
+def _supports_copy(db: Session) -> bool:
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def _copy_value(value) -> str:
+    """Encode one value for COPY's text format"""
+    if value is None:
+        return r"\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_insert(db: Session, rows: List[dict], now: datetime) -> list:
+    """
+    COPY rows into a temp table, then insert the ones that don't conflict.
+    Returns the inserted (id, pmid, doi, title) rows.
+    """
+    table = StudyModel.__tablename__
+    columns = ", ".join(STUDY_FIELDS)
+    # Dropped again when the chunk commits
+    db.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {table}_ingest ON COMMIT DROP AS "
+        f"SELECT {columns} FROM {table} WITH NO DATA"
+    ))
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(row[field]) for field in STUDY_FIELDS))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table}_ingest ({columns}) FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+    result = db.execute(
+        text(
+            f"INSERT INTO {table} ({columns}, created_at, updated_at) "
+            f"SELECT {columns}, :now, :now FROM {table}_ingest "
+            f"ON CONFLICT DO NOTHING RETURNING id, pmid, doi, title"
+        ),
+        {"now": now},
+    )
+    return result.all()
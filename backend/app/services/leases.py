@@ -0,0 +1,48 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import dialect_insert
+from app.models import Lease
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def acquire_lease(db: AsyncSession, key: str, ttl: float) -> Optional[str]:
+    """
+    Try to take the lease `key` for `ttl` seconds.
+
+    Returns an owner token to pass to release_lease(), or None if another
+    holder's lease hasn't expired yet. Works across processes and hosts
+    because the lease is a row in the shared database.
+    """
+    token = f"{WORKER_ID}:{uuid.uuid4().hex}"
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+
+    inserted = await db.execute(
+        dialect_insert(db.bind.dialect.name, Lease)
+        .values(key=key, owner=token, expires_at=expires_at)
+        .on_conflict_do_nothing(index_elements=["key"])
+    )
+    if inserted.rowcount != 1:
+        # Take over a lease whose holder died without releasing it
+        taken = await db.execute(
+            update(Lease)
+            .where(Lease.key == key, Lease.expires_at < now)
+            .values(owner=token, expires_at=expires_at)
+        )
+        if taken.rowcount != 1:
+            await db.rollback()
+            return None
+    await db.commit()
+    return token
+
+
+async def release_lease(db: AsyncSession, key: str, token: str):
+    """Release a lease, but only if `token` still owns it"""
+    await db.execute(delete(Lease).where(Lease.key == key, Lease.owner == token))
+    await db.commit()
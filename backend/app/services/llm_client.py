@@ -0,0 +1,285 @@
+"""
+Shared HTTP client for the Anthropic Messages API.
+
+One pooled `httpx.AsyncClient` is created in the FastAPI lifespan and
+reused by every service, so calls share keep-alive connections (and
+HTTP/2 multiplexing when `h2` is installed) instead of paying a TCP+TLS
+handshake per request. Transient failures (429, 5xx, connection errors)
+are retried with jittered exponential backoff.
+
+In tests, install a client backed by a mock transport:
+
+    set_llm_client(LLMClient(api_key="test", transport=httpx.MockTransport(handler)))
+"""
+import asyncio
+import json
+import os
+import random
+from typing import AsyncIterator, Optional
+import httpx
+
+ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+ANTHROPIC_VERSION = "2023-06-01"
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() in ("1", "true", "yes")
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Mark static prompt prefixes with cache_control breakpoints
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "true").lower() in ("1", "true", "yes")
+# Shortest prefix the API will cache (Sonnet); shorter ones are processed in full
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+# 529 is Anthropic's "overloaded" status
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
+# Statuses meaning the API is rate limiting or shedding load; still
+# failing after retries, they surface as UpstreamOverloadedError
+OVERLOADED_STATUS_CODES = {429, 503, 529}
+
+# Errors raised before the request reached the server, so safe to resend
+RETRYABLE_ERRORS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+    httpx.RemoteProtocolError,
+)
+
+
+class UpstreamOverloadedError(httpx.HTTPStatusError):
+    """The API kept rate limiting or shedding load after every retry"""
+
+    @property
+    def retry_after(self) -> Optional[float]:
+        try:
+            return float(self.response.headers.get("retry-after", ""))
+        except ValueError:
+            return None
+
+
+def raise_for_status(response: httpx.Response):
+    """response.raise_for_status(), with overload statuses as UpstreamOverloadedError"""
+    if response.status_code in OVERLOADED_STATUS_CODES:
+        raise UpstreamOverloadedError(
+            f"Upstream overloaded ({response.status_code})", request=response.request, response=response
+        )
+    response.raise_for_status()
+
+
+def cached_system(*texts: str) -> list:
+    """
+    System prompt as one content block per text, the last ending in a cache
+    breakpoint, so the API can reuse the whole prompt across calls.
+    Prefixes shorter than PROMPT_CACHE_MIN_TOKENS are simply not cached.
+    """
+    blocks = [{"type": "text", "text": text} for text in texts]
+    if PROMPT_CACHE:
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class LLMClient:
+    """Pooled, retrying client for the Anthropic API"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = ANTHROPIC_API_KEY,
+        base_url: str = ANTHROPIC_BASE_URL,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        http2: bool = LLM_HTTP2,
+        timeout: float = LLM_TIMEOUT,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        max_keepalive: int = LLM_MAX_KEEPALIVE,
+        keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+    ):
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={
+                "x-api-key": api_key or "",
+                "anthropic-version": ANTHROPIC_VERSION,
+                "content-type": "application/json",
+            },
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2 and transport is None and _h2_available(),
+            transport=transport,
+        )
+
+    async def create_message(self, payload: dict) -> dict:
+        """POST /v1/messages and return the decoded response body"""
+        response = await self.request("POST", "/v1/messages", json=payload)
+        return response.json()
+
+    async def stream_message(self, payload: dict) -> AsyncIterator[dict]:
+        """
+        POST /v1/messages with streaming enabled and yield each decoded
+        server-sent event as it arrives.
+
+        Failures before the first event are retried like request(); once
+        events have been yielded, errors propagate to the caller.
+        """
+        if not self.api_key:
+            raise ValueError("ANTHROPIC_API_KEY not set")
+
+        payload = {**payload, "stream": True}
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self._client.stream("POST", "/v1/messages", json=payload) as response:
+                    if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                        delay = self.backoff_delay(attempt, response)
+                    else:
+                        if response.is_error:
+                            await response.aread()
+                            raise_for_status(response)
+                        async for event in iter_sse_events(response):
+                            started = True
+                            if event.get("type") == "error":
+                                raise RuntimeError(event.get("error", {}).get("message", "Stream error"))
+                            yield event
+                        return
+            except RETRYABLE_ERRORS:
+                if started or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def iter_lines(self, path: str) -> AsyncIterator[str]:
+        """
+        GET `path` (or an absolute URL) and yield the body line by line
+        without buffering it, e.g. Message Batches results (JSONL).
+
+        Failures before the first line are retried like request().
+        """
+        if not self.api_key:
+            raise ValueError("ANTHROPIC_API_KEY not set")
+
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async with self._client.stream("GET", path) as response:
+                    if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                        delay = self.backoff_delay(attempt, response)
+                    else:
+                        if response.is_error:
+                            await response.aread()
+                            raise_for_status(response)
+                        async for line in response.aiter_lines():
+                            started = True
+                            if line:
+                                yield line
+                        return
+            except RETRYABLE_ERRORS:
+                if started or attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_delay(attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """
+        Send a request, retrying transient failures. Raises on the final
+        error status (UpstreamOverloadedError for rate limiting/overload).
+        """
+        if not self.api_key:
+            raise ValueError("ANTHROPIC_API_KEY not set")
+
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, path, **kwargs)
+            except RETRYABLE_ERRORS:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                await response.aclose()
+                await asyncio.sleep(self.backoff_delay(attempt, response))
+                attempt += 1
+                continue
+
+            raise_for_status(response)
+            return response
+
+    def backoff_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Full-jitter exponential backoff, honouring a numeric Retry-After"""
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+async def iter_sse_events(response: httpx.Response) -> AsyncIterator[dict]:
+    """Decode a text/event-stream body into JSON `data` payloads"""
+    data_lines = []
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+        elif not line and data_lines:
+            yield json.loads("\n".join(data_lines))
+            data_lines = []
+    if data_lines:
+        yield json.loads("\n".join(data_lines))
+
+
+_llm_client: Optional[LLMClient] = None
+
+
+def get_llm_client() -> LLMClient:
+    """Return the shared client, creating one if the app lifespan hasn't"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
+
+
+def set_llm_client(client: Optional[LLMClient]):
+    """Install the shared client (the app lifespan, or a test with a mock transport)"""
+    global _llm_client
+    _llm_client = client
+
+
+async def close_llm_client():
+    global _llm_client
+    if _llm_client is not None:
+        await _llm_client.aclose()
+        _llm_client = None
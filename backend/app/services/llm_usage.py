@@ -0,0 +1,220 @@
+"""
+Token and latency accounting for Anthropic API calls.
+
+Every Messages call goes through `create_message` (or reports a streamed
+call with `llm_usage.record`), which notes the usage the API reported and
+how long the call took in the process-wide `llm_usage` tally (and the
+Prometheus metrics); failed calls are counted by outcome. Callers also
+store the usage on what the call produced (a Summary or a claim
+validation) via `usage_columns`, so it survives restarts and can be
+aggregated by the stats endpoint.
+
+With prompt caching, `input_tokens` counts only the part of the prompt
+after the last cache breakpoint. The prefix is billed as
+`cache_creation_input_tokens` (1.25x) when written and
+`cache_read_input_tokens` (0.1x) when read back.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, Optional
+import httpx
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.services.llm_client import UpstreamOverloadedError, get_llm_client
+from app.services.metrics import observe_llm_call
+
+TOKEN_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+# Billing weight of each kind of input token, relative to an uncached one
+INPUT_COST_WEIGHTS = {
+    "input_tokens": 1.0,
+    "cache_creation_input_tokens": 1.25,
+    "cache_read_input_tokens": 0.1,
+}
+# Calls per operation kept for latency percentiles
+LATENCY_WINDOW = 1000
+
+
+def call_usage(
+    api_usage: Optional[dict], latency: Optional[float], ttft: Optional[float] = None
+) -> dict:
+    """
+    One call's usage: the API's token counts plus latency in milliseconds
+    (None for batched requests, which have no latency of their own)
+    """
+    api_usage = api_usage or {}
+    usage = {field: api_usage.get(field) or 0 for field in TOKEN_FIELDS}
+    usage["latency_ms"] = round(latency * 1000) if latency is not None else None
+    usage["ttft_ms"] = round(ttft * 1000) if ttft is not None else None
+    usage["llm_calls"] = 1
+    return usage
+
+
+def add_usage(total: dict, usage: dict) -> dict:
+    """Add one call's tokens and call count into `total`, in place"""
+    for field in TOKEN_FIELDS + ("llm_calls",):
+        total[field] = (total.get(field) or 0) + (usage.get(field) or 0)
+    return total
+
+
+def usage_columns(usage: Optional[dict]) -> dict:
+    """Column values for a row that stores usage (see models.LLMUsageMixin)"""
+    usage = usage or {}
+    return {
+        "input_tokens": usage.get("input_tokens"),
+        "output_tokens": usage.get("output_tokens"),
+        "cache_read_tokens": usage.get("cache_read_input_tokens"),
+        "cache_write_tokens": usage.get("cache_creation_input_tokens"),
+        "latency_ms": usage.get("latency_ms"),
+        "ttft_ms": usage.get("ttft_ms"),
+    }
+
+
+def error_status(error: BaseException) -> str:
+    """Outcome label for a failed call"""
+    if isinstance(error, UpstreamOverloadedError):
+        return "overloaded"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.HTTPStatusError):
+        return "client_error" if error.response.status_code < 500 else "server_error"
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    return "error"
+
+
+def _percentile(values, fraction: float) -> Optional[int]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LLMUsageStats:
+    """Per-operation call, token and latency tallies since process start"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._operations: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, operation: str) -> dict:
+        entry = self._operations.get(operation)
+        if entry is None:
+            entry = self._operations[operation] = {
+                "calls": 0,
+                "tokens": {field: 0 for field in TOKEN_FIELDS},
+                "latencies": deque(maxlen=self.window),
+                "ttfts": deque(maxlen=self.window),
+                "errors": Counter(),
+            }
+        return entry
+
+    def record(self, operation: str, usage: dict):
+        with self._lock:
+            entry = self._entry(operation)
+            entry["calls"] += 1
+            for field in TOKEN_FIELDS:
+                entry["tokens"][field] += usage.get(field) or 0
+            if usage.get("latency_ms") is not None:
+                entry["latencies"].append(usage["latency_ms"])
+            if usage.get("ttft_ms") is not None:
+                entry["ttfts"].append(usage["ttft_ms"])
+        observe_llm_call(
+            operation, "ok", usage,
+            latency=usage["latency_ms"] / 1000 if usage.get("latency_ms") is not None else None,
+            ttft=usage["ttft_ms"] / 1000 if usage.get("ttft_ms") is not None else None,
+        )
+
+    def record_error(self, operation: str, status: str, latency: Optional[float] = None):
+        """A call that failed with outcome `status` (see error_status) after `latency` seconds"""
+        with self._lock:
+            self._entry(operation)["errors"][status] += 1
+        observe_llm_call(operation, status, latency=latency)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                operation: {
+                    "calls": entry["calls"],
+                    **entry["tokens"],
+                    **cache_ratios(entry["tokens"]),
+                    "latency_ms_p50": _percentile(entry["latencies"], 0.5),
+                    "latency_ms_p95": _percentile(entry["latencies"], 0.95),
+                    "ttft_ms_p50": _percentile(entry["ttfts"], 0.5),
+                    "ttft_ms_p95": _percentile(entry["ttfts"], 0.95),
+                    "errors": dict(entry["errors"]),
+                }
+                for operation, entry in sorted(self._operations.items())
+            }
+
+
+def cache_ratios(tokens: dict) -> dict:
+    """
+    Share of prompt tokens read from the cache, and the prompt's billed
+    size in uncached-token equivalents (what it would cost without
+    caching is the plain sum of the three input counts)
+    """
+    prompt = sum(tokens.get(field) or 0 for field in INPUT_COST_WEIGHTS)
+    billed = sum((tokens.get(field) or 0) * weight for field, weight in INPUT_COST_WEIGHTS.items())
+    return {
+        "cache_hit_rate": round((tokens.get("cache_read_input_tokens") or 0) / prompt, 4) if prompt else 0.0,
+        "billed_input_tokens": round(billed),
+    }
+
+
+llm_usage = LLMUsageStats()
+
+
+async def create_message(operation: str, payload: dict):
+    """
+    POST a Messages request through the shared client, recording its
+    usage and latency under `operation`. Returns (response, usage).
+    """
+    started = time.monotonic()
+    try:
+        data = await get_llm_client().create_message(payload)
+    except BaseException as e:
+        llm_usage.record_error(operation, error_status(e), time.monotonic() - started)
+        raise
+    usage = call_usage(data.get("usage"), time.monotonic() - started)
+    llm_usage.record(operation, usage)
+    return data, usage
+
+
+def stored_usage_stats(db: Session, model, since: Optional[datetime] = None) -> dict:
+    """
+    Token and latency totals over the rows of `model` (Summary or
+    ClaimValidation) created since `since`. Rows written before usage was
+    recorded are counted separately and left out of the averages.
+    """
+    query = select(
+        func.count(),
+        func.count(model.input_tokens),
+        func.sum(model.input_tokens),
+        func.sum(model.output_tokens),
+        func.sum(model.cache_read_tokens),
+        func.sum(model.cache_write_tokens),
+        func.avg(model.latency_ms),
+        func.avg(model.ttft_ms),
+    ).select_from(model)
+    if since is not None:
+        query = query.where(model.created_at >= since)
+    rows, measured, input_tokens, output_tokens, cache_read, cache_write, latency, ttft = db.execute(query).one()
+
+    tokens = {
+        "input_tokens": input_tokens or 0,
+        "output_tokens": output_tokens or 0,
+        "cache_read_input_tokens": cache_read or 0,
+        "cache_creation_input_tokens": cache_write or 0,
+    }
+    return {
+        "rows": rows,
+        "with_usage": measured,
+        **tokens,
+        **cache_ratios(tokens),
+        "avg_latency_ms": round(latency) if latency is not None else None,
+        "avg_ttft_ms": round(ttft) if ttft is not None else None,
+    }
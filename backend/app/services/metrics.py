@@ -0,0 +1,256 @@
+"""
+Prometheus metrics, served at /metrics.
+
+- HTTP: request latency per route template and status
+  (`MetricsMiddleware`).
+- Database: execution time per statement fingerprint (the SQL with
+  literals and parameter lists collapsed), with statements slower than
+  DB_SLOW_QUERY_MS logged. `db_statement_info` maps each fingerprint to
+  its SQL. Also connection pool checkout wait and utilization.
+- Model calls: latency, time to first token, outcome and tokens per
+  operation, reported by llm_usage.
+
+Metrics are per process, like the other in-process stats.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Statements at least this slow are logged (without their parameters)
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+# Distinct fingerprints given their own series; the rest share "other"
+DB_METRICS_MAX_STATEMENTS = int(os.getenv("DB_METRICS_MAX_STATEMENTS", "500"))
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency, until the last body byte is sent",
+    ["method", "route", "status"], buckets=HTTP_BUCKETS,
+)
+http_requests_in_progress = Gauge("http_requests_in_progress", "HTTP requests being handled")
+
+db_statement_duration = Histogram(
+    "db_statement_duration_seconds", "Statement execution time by fingerprint",
+    ["engine", "fingerprint"], buckets=DB_BUCKETS,
+)
+db_slow_statements = Counter(
+    "db_slow_statements_total", "Statements slower than DB_SLOW_QUERY_MS", ["engine", "fingerprint"]
+)
+db_statement_info = Gauge("db_statement_info", "SQL of each statement fingerprint", ["fingerprint", "statement"])
+db_pool_checkout_wait = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ["engine"], buckets=DB_BUCKETS,
+)
+db_pool_checkout_timeouts = Counter(
+    "db_pool_checkout_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT", ["engine"]
+)
+
+llm_request_duration = Histogram(
+    "llm_request_duration_seconds", "Anthropic API call latency", ["operation", "status"], buckets=LLM_BUCKETS,
+)
+llm_time_to_first_token = Histogram(
+    "llm_time_to_first_token_seconds", "Time to the first streamed token", ["operation"], buckets=LLM_BUCKETS,
+)
+llm_requests = Counter("llm_requests_total", "Anthropic API calls by outcome", ["operation", "status"])
+llm_tokens = Counter("llm_tokens_total", "Tokens used by Anthropic API calls", ["operation", "type"])
+
+# usage key (see llm_usage.TOKEN_FIELDS) -> llm_tokens_total type label
+LLM_TOKEN_TYPES = {
+    "input_tokens": "input",
+    "output_tokens": "output",
+    "cache_read_input_tokens": "cache_read",
+    "cache_creation_input_tokens": "cache_write",
+}
+
+
+class MetricsMiddleware:
+    """Observe each HTTP request's latency under its route template"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_progress.dec()
+            # FastAPI puts the matched route in the scope; label by its
+            # template (/api/studies/{study_id}) so ids don't become series
+            route = scope.get("route")
+            http_request_duration.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - started)
+
+
+# String and number literals, then the bind styles of psycopg2, asyncpg,
+# SQLAlchemy text() and sqlite (but not Postgres ::casts)
+_LITERALS_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|\$\d+|(?<![:\w]):\w+|\?")
+_PARAM_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROW_LIST_RE = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+
+
+@lru_cache(maxsize=4096)
+def normalize_statement(statement: str) -> str:
+    """The statement with literals, parameters and IN/VALUES lists collapsed"""
+    statement = " ".join(statement.split())
+    statement = _LITERALS_RE.sub("?", statement)
+    statement = _PARAM_LIST_RE.sub("(?)", statement)
+    return _ROW_LIST_RE.sub("(?)", statement)
+
+
+class StatementFingerprints:
+    """Short stable ids for normalized statements, capped in number"""
+
+    def __init__(self, limit: int = DB_METRICS_MAX_STATEMENTS):
+        self.limit = limit
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def get(self, statement: str) -> str:
+        normalized = normalize_statement(statement)
+        fingerprint = hashlib.sha1(normalized.encode()).hexdigest()[:12]
+        if fingerprint in self._seen:
+            return fingerprint
+        with self._lock:
+            if len(self._seen) >= self.limit:
+                return "other"
+            self._seen.add(fingerprint)
+        db_statement_info.labels(fingerprint, normalized[:1000]).set(1)
+        return fingerprint
+
+
+statement_fingerprints = StatementFingerprints()
+
+
+def observe_statement(engine_name: str, statement: str, elapsed: float):
+    fingerprint = statement_fingerprints.get(statement)
+    db_statement_duration.labels(engine_name, fingerprint).observe(elapsed)
+    if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+        db_slow_statements.labels(engine_name, fingerprint).inc()
+        logger.warning(
+            "Slow query (%.0f ms, %s engine, fingerprint %s): %s",
+            elapsed * 1000, engine_name, fingerprint, normalize_statement(statement)[:1000],
+        )
+
+
+def instrument_engine(engine, name: str):
+    """
+    Time every statement run on `engine` (for an AsyncEngine, pass its
+    sync_engine) and report its pool's utilization
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            observe_statement(name, statement, time.perf_counter() - started)
+
+    pool_collector.engines[name] = engine
+
+
+class _TimedPoolMixin:
+    """Observe how long each checkout waits for a connection"""
+    engine_name = "sync"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            db_pool_checkout_timeouts.labels(self.engine_name).inc()
+            raise
+        finally:
+            db_pool_checkout_wait.labels(self.engine_name).observe(time.perf_counter() - started)
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    engine_name = "sync"
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    engine_name = "async"
+
+
+class PoolCollector:
+    """Connection pool state of the instrumented engines, read at scrape time"""
+
+    def __init__(self):
+        self.engines = {}
+
+    def collect(self):
+        connections = GaugeMetricFamily(
+            "db_pool_connections", "Pooled connections by state", labels=["engine", "state"]
+        )
+        capacity = GaugeMetricFamily(
+            "db_pool_capacity", "Pool size plus allowed overflow", labels=["engine"]
+        )
+        utilization = GaugeMetricFamily(
+            "db_pool_utilization", "Checked-out connections as a share of capacity", labels=["engine"]
+        )
+        for name, engine in self.engines.items():
+            pool = engine.pool
+            if not isinstance(pool, QueuePool):
+                # SQLite's single-connection pools have nothing to report
+                continue
+            checked_out = pool.checkedout()
+            connections.add_metric([name, "checked_out"], checked_out)
+            connections.add_metric([name, "idle"], pool.checkedin())
+            max_overflow = getattr(pool, "_max_overflow", -1)
+            if max_overflow >= 0:
+                total = pool.size() + max_overflow
+                capacity.add_metric([name], total)
+                utilization.add_metric([name], checked_out / total if total else 0.0)
+        yield connections
+        yield capacity
+        yield utilization
+
+
+pool_collector = PoolCollector()
+REGISTRY.register(pool_collector)
+
+
+def observe_llm_call(
+    operation: str, status: str, usage: Optional[dict] = None, latency: Optional[float] = None,
+    ttft: Optional[float] = None,
+):
+    """One Anthropic call's outcome; latencies in seconds (None for batched requests)"""
+    llm_requests.labels(operation, status).inc()
+    if latency is not None:
+        llm_request_duration.labels(operation, status).observe(latency)
+    if ttft is not None:
+        llm_time_to_first_token.labels(operation).observe(ttft)
+    for field, token_type in LLM_TOKEN_TYPES.items():
+        tokens = (usage or {}).get(field)
+        if tokens:
+            llm_tokens.labels(operation, token_type).inc(tokens)
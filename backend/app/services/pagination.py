@@ -0,0 +1,117 @@
+import base64
+import json
+import os
+from typing import Any, Hashable, List, Optional, Tuple
+from sqlalchemy import func, literal_column, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.cache import TTLCache
+
+# Result sets up to this size are always counted exactly
+COUNT_EXACT_THRESHOLD = int(os.getenv("COUNT_EXACT_THRESHOLD", "10000"))
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "300"))
+
+
+def encode_cursor(sort_key: Any, last_id: int, page: int) -> str:
+    """Opaque cursor pointing just past (sort_key, last_id)"""
+    payload = json.dumps({"k": sort_key, "id": last_id, "p": page}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int, int]:
+    """Inverse of encode_cursor; raises ValueError on anything malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return payload["k"], int(payload["id"]), int(payload.get("p", 1))
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def apply_keyset(stmt, sort_expr, id_column, cursor: Optional[str]):
+    """
+    Order `stmt` by (sort_expr, id) descending and, given a cursor, start
+    right after the row it points at. Returns (stmt, page).
+    """
+    stmt = stmt.order_by(sort_expr.desc(), id_column.desc())
+    if not cursor:
+        return stmt, 1
+    sort_key, last_id, page = decode_cursor(cursor)
+    return stmt.filter(tuple_(sort_expr, id_column) < tuple_(sort_key, last_id)), page + 1
+
+
+def page_ranked(ranked: List[Tuple[int, float]], skip: int, limit: int, cursor: Optional[str]):
+    """
+    Cut one page out of an in-memory (id, score) list sorted by (score, id)
+    descending, with the same cursor format as apply_keyset. Returns
+    (page_items, page, next_cursor); raises ValueError on a bad cursor.
+    """
+    if cursor:
+        sort_key, last_id, page = decode_cursor(cursor)
+        page += 1
+        start = next(
+            (i for i, (item_id, score) in enumerate(ranked) if (score, item_id) < (sort_key, last_id)),
+            len(ranked),
+        )
+    else:
+        start, page = skip, skip // limit + 1
+    items = ranked[start:start + limit]
+    next_cursor = None
+    if items and start + limit < len(ranked):
+        next_cursor = encode_cursor(items[-1][1], items[-1][0], page)
+    return items, page, next_cursor
+
+
+class CountCache:
+    """
+    Cache of result-set totals for list endpoints.
+
+    Totals up to COUNT_EXACT_THRESHOLD are counted exactly with a capped
+    COUNT. Larger unfiltered totals come from the Postgres planner
+    estimate; larger filtered ones are counted once and kept until the
+    TTL runs out or a write calls `invalidate()`.
+    """
+
+    def __init__(self, exact_threshold: int = COUNT_EXACT_THRESHOLD, ttl: float = COUNT_CACHE_TTL):
+        self.exact_threshold = exact_threshold
+        self._cache = TTLCache(maxsize=2048, ttl=ttl)
+
+    async def count(self, db: AsyncSession, key: Hashable, stmt, table_name: Optional[str] = None) -> Tuple[int, bool]:
+        """
+        Return (total, estimated) for the rows selected by `stmt`.
+
+        Pass `table_name` when `stmt` is an unfiltered scan of that table so
+        large totals can use the planner estimate.
+        """
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        stmt = stmt.with_only_columns(literal_column("1"), maintain_column_froms=True).order_by(None)
+        capped = stmt.limit(self.exact_threshold + 1).subquery()
+        total = (await db.execute(select(func.count()).select_from(capped))).scalar()
+        estimated = False
+
+        if total > self.exact_threshold:
+            estimate = None
+            if table_name and db.bind.dialect.name == "postgresql":
+                estimate = (await db.execute(
+                    text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name"),
+                    {"name": table_name},
+                )).scalar()
+            if estimate and estimate > self.exact_threshold:
+                total, estimated = int(estimate), True
+            else:
+                total = (await db.execute(select(func.count()).select_from(stmt.subquery()))).scalar()
+
+        self._cache.set(key, (total, estimated))
+        return total, estimated
+
+    def invalidate(self):
+        """Forget all totals; call after any write that can change them"""
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+study_counts = CountCache()
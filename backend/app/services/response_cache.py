@@ -0,0 +1,190 @@
+"""
+HTTP response caching for the study and summary read endpoints.
+
+Each GET response is given an ETag and a Last-Modified date derived from
+the rows behind it (`updated_at` for studies, `created_at` for
+summaries), and its serialized JSON body is kept in an in-process LRU
+keyed on the request's path and query. A repeat request is answered from
+the LRU without opening a database session. If its If-None-Match (or
+If-Modified-Since) still matches, the answer is a bodiless 304. Bodies
+are compressed once per content coding and the result kept with the entry.
+
+Writes in this process invalidate the affected entries straight away.
+Invalidation bumps a generation number that is part of every key, so a
+response computed from rows read before a write can't be cached under
+the new generation.
+
+The generations live in memory, so they say nothing about writes made
+elsewhere: another uvicorn worker, the scraper or bulk ingest. Until an
+entry's RESPONSE_CACHE_TTL runs out, this process keeps serving its
+body, and keeps answering revalidations with 304 because the ETag was
+computed when the entry was cached. With several workers, a client can
+therefore see a study it just edited through one worker unchanged on
+another for up to RESPONSE_CACHE_TTL seconds (60 by default); lower it
+(0 disables the cache) where that window matters.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, NamedTuple, Optional
+from fastapi import Request, Response
+from app.services.cache import TTLCache
+from app.services.compression import COMPRESS_MIN_SIZE, compress, negotiate_encoding
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+# How stale an entry may get when the write happened in another process,
+# including other workers of this app
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+# max-age sent to clients; 0 makes them revalidate (cheaply, via 304) every time
+STUDY_CACHE_MAX_AGE = int(os.getenv("STUDY_CACHE_MAX_AGE", "0"))
+# Summaries are written once and never change
+SUMMARY_CACHE_MAX_AGE = int(os.getenv("SUMMARY_CACHE_MAX_AGE", "3600"))
+# How long a 404 for a missing summary is remembered; summaries generated
+# in this process invalidate it at once, ones from the worker after this
+RESPONSE_CACHE_MISSING_TTL = float(os.getenv("RESPONSE_CACHE_MISSING_TTL", "10"))
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    # None for a cached 404
+    etag: Optional[str]
+    last_modified: Optional[datetime]
+    max_age: int
+    status_code: int
+    # Compressed copies of `body`, by content coding, made on first request
+    encoded: dict
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag over the request key and the version stamps of its rows"""
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest()[:20] + '"'
+
+
+def latest(timestamps: Iterable[Optional[datetime]]) -> Optional[datetime]:
+    timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(timestamps) if timestamps else None
+
+
+def request_key(request: Request) -> str:
+    """Path plus query parameters in a canonical order"""
+    query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}"
+
+
+def _as_utc(timestamp: datetime) -> datetime:
+    # The database stores naive UTC timestamps
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def not_modified(request: Request, entry: CachedResponse) -> bool:
+    """Whether the client's copy is current, per RFC 9110 precedence"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison: a W/ prefix added by a proxy still matches
+        return "*" in tags or any(tag.removeprefix("W/") == entry.etag for tag in tags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and entry.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have whole-second precision
+        return _as_utc(entry.last_modified).replace(microsecond=0) <= since
+    return False
+
+
+def cache_headers(entry: CachedResponse, encoding: Optional[str]) -> dict:
+    headers = {
+        # A compressed body isn't byte-identical to the plain one, so its
+        # ETag is weak; not_modified() compares weakly either way
+        "ETag": f"W/{entry.etag}" if encoding else entry.etag,
+        "Cache-Control": f"public, max-age={entry.max_age}" if entry.max_age > 0 else "no-cache",
+    }
+    if entry.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(_as_utc(entry.last_modified), usegmt=True)
+    if len(entry.body) >= COMPRESS_MIN_SIZE:
+        headers["Vary"] = "Accept-Encoding"
+    return headers
+
+
+def respond(request: Request, entry: CachedResponse) -> Response:
+    """
+    The cached body, compressed if the client accepts it, or a 304 when
+    the client already has it
+    """
+    if entry.status_code != 200:
+        return Response(entry.body, status_code=entry.status_code, media_type="application/json")
+    encoding = None
+    if len(entry.body) >= COMPRESS_MIN_SIZE:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    headers = cache_headers(entry, encoding)
+    if not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    if encoding is None:
+        return Response(entry.body, media_type="application/json", headers=headers)
+
+    body = entry.encoded.get(encoding)
+    if body is None:
+        body = entry.encoded[encoding] = compress(entry.body, encoding)
+    headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    """LRU+TTL of serialized GET responses, grouped for invalidation"""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generations = {"studies": 0, "summaries": 0}
+        self._lock = threading.Lock()
+        self.not_modified = 0
+
+    def key(self, group: str, request: Request) -> tuple:
+        """
+        Cache key for a request to a `group` endpoint. Take it before
+        reading the database, so a write in between invalidates it.
+        """
+        return (group, self._generations[group], request_key(request))
+
+    def get(self, key: tuple) -> Optional[CachedResponse]:
+        return self._cache.get(key)
+
+    def set(self, key: tuple, body: bytes, etag: str, last_modified: Optional[datetime], max_age: int) -> CachedResponse:
+        entry = CachedResponse(body, etag, last_modified, max_age, 200, {})
+        self._cache.set(key, entry)
+        return entry
+
+    def set_missing(self, key: tuple, detail: str) -> CachedResponse:
+        """Remember a 404 for RESPONSE_CACHE_MISSING_TTL"""
+        entry = CachedResponse(json.dumps({"detail": detail}).encode(), None, None, 0, 404, {})
+        self._cache.set(key, entry, ttl=min(RESPONSE_CACHE_MISSING_TTL, self._cache.ttl))
+        return entry
+
+    def respond(self, request: Request, entry: CachedResponse) -> Response:
+        response = respond(request, entry)
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    def invalidate_studies(self):
+        """Forget every study and study list response; call after any study write"""
+        with self._lock:
+            self._generations["studies"] += 1
+
+    def invalidate_summaries(self):
+        """Forget every summary response (including 404s); call after summaries are created or deleted"""
+        with self._lock:
+            self._generations["summaries"] += 1
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "not_modified": self.not_modified}
+
+
+response_cache = ResponseCache()
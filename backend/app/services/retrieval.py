@@ -0,0 +1,340 @@
+import math
+import re
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import Study as StudyModel
+
+# Field weights for the BM25F-style term frequencies
+FIELD_WEIGHTS = {"title": 3.0, "keywords": 2.0, "abstract": 1.0}
+
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been
+before being below between both but by can could did do does doing down during each
+few for from further had has have having here how i if in into is it its itself just
+may might more most must my need needs no nor not of off on once only or other our
+out over own same should so some such than that the their them then there these they
+this those through to too under until up very was we were what when where which while
+who why will with would you your
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def stem(word: str) -> str:
+    """Very light suffix stripping so plurals and -ing/-ed forms share postings"""
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("ed"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase, split on non-alphanumerics, drop stop words and stem"""
+    if not text:
+        return []
+    return [
+        stem(token) for token in _TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+# Rows tokenized per lock acquisition during a refresh
+_REFRESH_BATCH = 1000
+
+
+def _weighted_tokens(title: Optional[str], abstract: Optional[str], keywords: Optional[str]) -> Dict[str, float]:
+    """Token counts across the fields, each weighted by FIELD_WEIGHTS"""
+    weighted: Dict[str, float] = {}
+    for field, text in (("title", title), ("keywords", keywords), ("abstract", abstract)):
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            weighted[token] = weighted.get(token, 0.0) + weight
+    return weighted
+
+
+class BM25Index:
+    """
+    In-memory inverted index over study title, MeSH keywords and abstract.
+
+    Postings are kept in compact typed arrays (one slot per indexed study
+    version) and scored with NumPy, so a query touching a few hundred
+    thousand postings still takes milliseconds. Updating a study tombstones
+    its old slot and appends a new one; slots are compacted once tombstones
+    pile up.
+
+    The index syncs itself from the `studies` table using an `updated_at`
+    watermark, so rows added by other processes (e.g. the scraper) are
+    picked up on the next refresh without a full rebuild. Timestamps are
+    set before the writing transaction commits (and bulk ingest stamps a
+    whole chunk at once), so a row can become visible with an updated_at
+    older than the watermark; each refresh therefore re-reads the last
+    `watermark_slack` seconds, skipping rows it already indexed at that
+    timestamp. Every `reconcile_interval` seconds the indexed ids are also
+    checked against the table, dropping studies deleted elsewhere and
+    adding any that committed later than the slack allowed for.
+
+    Refreshes read and tokenize rows without holding the lock searches
+    take, and only hold it to apply each batch.
+    """
+
+    def __init__(
+        self,
+        k1: float = 1.2,
+        b: float = 0.75,
+        refresh_interval: float = 5.0,
+        watermark_slack: float = 60.0,
+        reconcile_interval: float = 300.0,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.refresh_interval = refresh_interval
+        self.watermark_slack = timedelta(seconds=watermark_slack)
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.RLock()
+        # Serializes refreshes; guards the watermark and throttle
+        self._refresh_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._slot_ids = array("q")
+        self._slot_len = array("f")
+        self._live = array("b")
+        self._slot_of: Dict[int, int] = {}
+        self._total_len = 0.0
+        self._watermark: Optional[datetime] = None
+        # updated_at of the studies indexed within the slack window
+        self._recent: Dict[int, datetime] = {}
+        self._last_refresh: Optional[float] = None
+        self._last_reconcile: Optional[float] = None
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def add(self, study_id: int, title: Optional[str], abstract: Optional[str], keywords: Optional[str]):
+        """Index (or re-index) a single study"""
+        weighted = _weighted_tokens(title, abstract, keywords)
+        with self._lock:
+            self._add_weighted(study_id, weighted)
+
+    def _add_weighted(self, study_id: int, weighted: Dict[str, float]):
+        """Index a study's weighted token counts; the caller holds the lock"""
+        self._drop(study_id)
+        slot = len(self._slot_ids)
+        length = sum(weighted.values())
+        self._slot_ids.append(study_id)
+        self._slot_len.append(length)
+        self._live.append(1)
+        self._slot_of[study_id] = slot
+        self._total_len += length
+        for token, tf in weighted.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = (array("i"), array("f"))
+            postings[0].append(slot)
+            postings[1].append(tf)
+
+    def remove(self, study_id: int):
+        """Drop a study from the index"""
+        with self._lock:
+            self._drop(study_id)
+            self._maybe_compact()
+
+    def _drop(self, study_id: int):
+        slot = self._slot_of.pop(study_id, None)
+        if slot is not None:
+            self._live[slot] = 0
+            self._total_len -= self._slot_len[slot]
+
+    def _maybe_compact(self):
+        dead = len(self._slot_ids) - len(self._slot_of)
+        if dead < 1000 or dead < len(self._slot_ids) // 4:
+            return
+
+        live = np.frombuffer(self._live, dtype=np.int8).astype(bool)
+        remap = np.cumsum(live, dtype=np.int64) - 1
+        postings = {}
+        for token, (slots, tfs) in self._postings.items():
+            slot_arr = np.frombuffer(slots, dtype=np.int32)
+            keep = live[slot_arr]
+            if keep.any():
+                postings[token] = (
+                    array("i", remap[slot_arr[keep]].astype(np.int32).tobytes()),
+                    array("f", np.frombuffer(tfs, dtype=np.float32)[keep].tobytes()),
+                )
+        slot_ids = array("q", np.frombuffer(self._slot_ids, dtype=np.int64)[live].tobytes())
+        slot_len = array("f", np.frombuffer(self._slot_len, dtype=np.float32)[live].tobytes())
+        del live, remap
+
+        self._postings = postings
+        self._slot_ids = slot_ids
+        self._slot_len = slot_len
+        self._live = array("b", b"\x01" * len(slot_ids))
+        self._slot_of = {study_id: slot for slot, study_id in enumerate(slot_ids)}
+
+    def add_many(self, rows: Iterable):
+        """Index rows exposing id, title, abstract and keywords"""
+        for row in rows:
+            self.add(row.id, row.title, row.abstract, row.keywords)
+        with self._lock:
+            self._maybe_compact()
+
+    def refresh(self, db: Session, force: bool = False):
+        """
+        Pull studies created or updated since the last refresh.
+
+        Cheap to call on every request: it is throttled to once per
+        `refresh_interval` seconds and only reads changed rows. `force`
+        skips the throttle and reconciles the indexed ids too.
+        """
+        with self._refresh_lock:
+            now = time.monotonic()
+            if (
+                not force
+                and self._last_refresh is not None
+                and now - self._last_refresh < self.refresh_interval
+            ):
+                return
+            self._last_refresh = now
+
+            query = db.query(
+                StudyModel.id,
+                StudyModel.title,
+                StudyModel.abstract,
+                StudyModel.keywords,
+                StudyModel.updated_at,
+            )
+            if self._watermark is not None:
+                # Rows committed late can carry a timestamp from before the watermark
+                query = query.filter(StudyModel.updated_at >= self._watermark - self.watermark_slack)
+
+            watermark = self._watermark
+            recent = dict(self._recent)
+            batch = []
+            for row in query.order_by(StudyModel.updated_at).yield_per(_REFRESH_BATCH):
+                if row.updated_at is not None:
+                    if recent.get(row.id) == row.updated_at:
+                        # Already indexed at this version
+                        continue
+                    recent[row.id] = row.updated_at
+                    if watermark is None or row.updated_at > watermark:
+                        watermark = row.updated_at
+                batch.append((row.id, _weighted_tokens(row.title, row.abstract, row.keywords)))
+                if len(batch) >= _REFRESH_BATCH:
+                    self._apply(batch)
+                    batch = []
+            self._apply(batch)
+            self._watermark = watermark
+            if watermark is not None:
+                cutoff = watermark - self.watermark_slack
+                self._recent = {study_id: at for study_id, at in recent.items() if at >= cutoff}
+
+            if self._last_reconcile is None:
+                # A first refresh reads every row
+                self._last_reconcile = now
+            elif force or now - self._last_reconcile >= self.reconcile_interval:
+                self._last_reconcile = now
+                self._reconcile(db)
+            with self._lock:
+                self._maybe_compact()
+
+    def _reconcile(self, db: Session):
+        """Drop studies deleted elsewhere and add any the watermark missed"""
+        stored = {study_id for (study_id,) in db.query(StudyModel.id)}
+        with self._lock:
+            indexed = set(self._slot_of)
+            for study_id in indexed - stored:
+                self._drop(study_id)
+        missing = sorted(stored - indexed)
+        for start in range(0, len(missing), _REFRESH_BATCH):
+            rows = db.query(
+                StudyModel.id, StudyModel.title, StudyModel.abstract, StudyModel.keywords,
+            ).filter(StudyModel.id.in_(missing[start:start + _REFRESH_BATCH]))
+            self._apply([
+                (row.id, _weighted_tokens(row.title, row.abstract, row.keywords)) for row in rows
+            ])
+
+    def _apply(self, batch: List[Tuple[int, Dict[str, float]]]):
+        if batch:
+            with self._lock:
+                for study_id, weighted in batch:
+                    self._add_weighted(study_id, weighted)
+
+    def search(self, text: str, limit: int = 15) -> List[Tuple[int, float]]:
+        """Return up to `limit` (study_id, score) pairs, best first"""
+        terms = set(tokenize(text))
+        with self._lock:
+            n_docs = len(self._slot_of)
+            if not terms or n_docs == 0:
+                return []
+
+            lengths = np.frombuffer(self._slot_len, dtype=np.float32)
+            live = np.frombuffer(self._live, dtype=np.int8)
+            avgdl = max(self._total_len / n_docs, 1e-9)
+            norm = self.k1 * (1 - self.b + self.b * lengths / avgdl)
+            scores = np.zeros(len(lengths), dtype=np.float32)
+
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                slots = np.frombuffer(postings[0], dtype=np.int32)
+                tfs = np.frombuffer(postings[1], dtype=np.float32)
+                df = int(live[slots].sum())
+                if df == 0:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                scores[slots] += idf * tfs * (self.k1 + 1) / (tfs + norm[slots])
+
+            scores *= live
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > limit:
+                top = np.argpartition(scores[candidates], -limit)[-limit:]
+                candidates = candidates[top]
+            order = candidates[np.argsort(-scores[candidates], kind="stable")]
+            slot_ids = np.frombuffer(self._slot_ids, dtype=np.int64)
+            return [(int(slot_ids[slot]), float(scores[slot])) for slot in order]
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[List[Tuple[int, float]]], k: int = 60, limit: Optional[int] = None
+) -> List[Tuple[int, float]]:
+    """
+    Merge ranked (id, score) lists. Each list contributes 1 / (k + rank) per
+    id, so ids ranked well by several retrievers rise to the top no matter
+    how differently the retrievers scale their scores.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (item_id, _) in enumerate(ranking, start=1):
+            fused[item_id] = fused.get(item_id, 0.0) + 1.0 / (k + rank)
+    ordered = sorted(fused.items(), key=lambda item: (-item[1], -item[0]))
+    return ordered[:limit] if limit is not None else ordered
+
+
+# Process-wide index shared by the API routers
+study_index = BM25Index()
+
+
+def refresh_study_index(force: bool = False):
+    """
+    Sync `study_index` using its own short-lived session.
+
+    Blocking; async callers should run it in a worker thread.
+    """
+    db = SessionLocal()
+    try:
+        study_index.refresh(db, force=force)
+    finally:
+        db.close()
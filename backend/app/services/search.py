@@ -0,0 +1,162 @@
+import re
+from typing import List, NamedTuple, Tuple
+from sqlalchemy import text, func, literal_column
+from sqlalchemy.sql import table, column
+from app.models import Study as StudyModel
+
+# Field weights, highest first: title > keywords > abstract > authors.
+# Postgres uses the A-D tsvector labels, SQLite passes them to bm25().
+SEARCH_FIELDS = ["title", "keywords", "abstract", "authors"]
+PG_WEIGHT_LABELS = ["A", "B", "C", "D"]
+SQLITE_BM25_WEIGHTS = [10.0, 5.0, 2.0, 1.0]
+
+_QUERY_TOKEN_RE = re.compile(r'"([^"]*)"\*?|(\S+)')
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_PG_VECTOR_EXPR = " || ".join(
+    f"setweight(to_tsvector('english', coalesce({field}, '')), '{label}')"
+    for field, label in zip(SEARCH_FIELDS, PG_WEIGHT_LABELS)
+)
+
+_PG_DDL = [
+    f"""ALTER TABLE studies ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS ({_PG_VECTOR_EXPR}) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_studies_search_vector ON studies USING GIN (search_vector)",
+]
+
+_SQLITE_FIELDS = ", ".join(SEARCH_FIELDS)
+_SQLITE_NEW = ", ".join(f"new.{field}" for field in SEARCH_FIELDS)
+_SQLITE_OLD = ", ".join(f"old.{field}" for field in SEARCH_FIELDS)
+
+_SQLITE_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS studies_fts USING fts5(
+        {_SQLITE_FIELDS}, content='studies', content_rowid='id',
+        tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS studies_fts_ai AFTER INSERT ON studies BEGIN
+        INSERT INTO studies_fts(rowid, {_SQLITE_FIELDS}) VALUES (new.id, {_SQLITE_NEW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS studies_fts_ad AFTER DELETE ON studies BEGIN
+        INSERT INTO studies_fts(studies_fts, rowid, {_SQLITE_FIELDS})
+        VALUES ('delete', old.id, {_SQLITE_OLD});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS studies_fts_au AFTER UPDATE OF {_SQLITE_FIELDS} ON studies BEGIN
+        INSERT INTO studies_fts(studies_fts, rowid, {_SQLITE_FIELDS})
+        VALUES ('delete', old.id, {_SQLITE_OLD});
+        INSERT INTO studies_fts(rowid, {_SQLITE_FIELDS}) VALUES (new.id, {_SQLITE_NEW});
+    END""",
+]
+
+# Lightweight handle on the FTS5 table; it lives outside Base.metadata so
+# create_all never tries to build it on Postgres.
+studies_fts = table("studies_fts", column("rowid"))
+
+
+class SearchTerm(NamedTuple):
+    words: Tuple[str, ...]
+    prefix: bool = False
+
+
+def parse_search_query(search: str) -> List[SearchTerm]:
+    """
+    Split a user search string into terms.
+
+    Supports "quoted phrases" and trailing-* prefix matches, e.g.
+    `"protein synthesis" hypertroph*`. All terms must match.
+    """
+    terms = []
+    for match in _QUERY_TOKEN_RE.finditer(search or ""):
+        phrase, word = match.group(1), match.group(2)
+        raw = phrase if phrase is not None else word
+        words = tuple(w.lower() for w in _WORD_RE.findall(raw))
+        if not words:
+            continue
+        prefix = match.group(0).endswith("*")
+        terms.append(SearchTerm(words, prefix))
+    return terms
+
+
+def to_pg_tsquery(terms: List[SearchTerm]) -> str:
+    """Render terms as a to_tsquery() expression"""
+    parts = []
+    for term in terms:
+        words = list(term.words)
+        if term.prefix:
+            words[-1] += ":*"
+        parts.append(" <-> ".join(words) if len(words) > 1 else words[0])
+    return " & ".join(f"({part})" for part in parts)
+
+
+def to_fts5_query(terms: List[SearchTerm]) -> str:
+    """Render terms as an FTS5 MATCH expression"""
+    parts = []
+    for term in terms:
+        part = '"' + " ".join(term.words) + '"'
+        if term.prefix:
+            part += "*"
+        parts.append(part)
+    return " AND ".join(parts)
+
+
+def install_search_index(engine):
+    """
+    Create the full-text index for studies if it doesn't exist yet.
+
+    Postgres gets a generated, weighted tsvector column with a GIN index;
+    SQLite gets an external-content FTS5 table kept in sync by triggers.
+    Safe to call on every startup.
+    """
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        with engine.begin() as conn:
+            for statement in _PG_DDL:
+                conn.execute(text(statement))
+    elif dialect == "sqlite":
+        with engine.begin() as conn:
+            existed = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'studies_fts'")
+            ).first()
+            for statement in _SQLITE_DDL:
+                conn.execute(text(statement))
+            if not existed:
+                # Index rows that were inserted before the triggers existed
+                conn.execute(text("INSERT INTO studies_fts(studies_fts) VALUES ('rebuild')"))
+
+
+def apply_fulltext_search(query, search: str, dialect: str):
+    """
+    Restrict a Study query/select to rows matching `search`.
+
+    Returns (query, rank) where `rank` is a column expression that sorts
+    best matches first when ordered descending, or None if the dialect has
+    no full-text backend and a substring filter was applied instead.
+    """
+    terms = parse_search_query(search)
+    if not terms:
+        return query, None
+
+    if dialect == "postgresql":
+        search_vector = literal_column("studies.search_vector")
+        tsquery = func.to_tsquery(literal_column("'english'::regconfig"), to_pg_tsquery(terms))
+        query = query.filter(search_vector.op("@@")(tsquery))
+        return query, func.ts_rank(search_vector, tsquery)
+
+    if dialect == "sqlite":
+        weights = ", ".join(str(w) for w in SQLITE_BM25_WEIGHTS)
+        query = query.join(studies_fts, studies_fts.c.rowid == StudyModel.id).filter(
+            text("studies_fts MATCH :fts_query").bindparams(fts_query=to_fts5_query(terms))
+        )
+        # bm25() is "lower is better", negate it so both backends sort DESC
+        return query, literal_column(f"-bm25(studies_fts, {weights})")
+
+    return apply_substring_search(query, search), None
+
+
+def apply_substring_search(query, search: str):
+    """Legacy ILIKE matching across title, abstract, keywords and authors"""
+    search_term = f"%{search}%"
+    return query.filter(
+        (StudyModel.title.ilike(search_term)) |
+        (StudyModel.abstract.ilike(search_term)) |
+        (StudyModel.keywords.ilike(search_term)) |
+        (StudyModel.authors.ilike(search_term))
+    )
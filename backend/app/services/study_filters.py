@@ -0,0 +1,102 @@
+"""
+Structured study filters (author, MeSH term, journal, year range) and
+facet counts for the study list.
+
+Author and MeSH filters go through the normalized link tables (see
+study_terms): the name is found via its lower() index and its studies via
+the (author_id, study_id) / (mesh_term_id, study_id) index, so no study
+row is scanned to evaluate them. Names match case-insensitively.
+"""
+import os
+from typing import NamedTuple, Optional, Tuple
+from sqlalchemy import String, cast, func, literal_column, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Author, MeshTerm, Study as StudyModel, StudyAuthor, StudyMeshTerm
+
+# Values returned per facet
+FACET_LIMIT = int(os.getenv("FACET_LIMIT", "20"))
+
+
+class StudyFilters(NamedTuple):
+    # Every author and every MeSH term must match; any of the journals may
+    authors: Tuple[str, ...] = ()
+    mesh_terms: Tuple[str, ...] = ()
+    journals: Tuple[str, ...] = ()
+    year_from: Optional[int] = None
+    year_to: Optional[int] = None
+
+    def is_empty(self) -> bool:
+        return (
+            not (self.authors or self.mesh_terms or self.journals)
+            and self.year_from is None and self.year_to is None
+        )
+
+
+def _linked_to(link, link_column, entity, name_column, name: str):
+    """Ids of the studies linked to the name, as an IN subquery"""
+    return StudyModel.id.in_(
+        select(link.study_id)
+        .join(entity, entity.id == link_column)
+        .where(func.lower(name_column) == name.lower())
+    )
+
+
+def apply_study_filters(stmt, filters: StudyFilters):
+    """Restrict a Study select to rows matching `filters`"""
+    for name in filters.authors:
+        stmt = stmt.filter(_linked_to(StudyAuthor, StudyAuthor.author_id, Author, Author.name, name))
+    for term in filters.mesh_terms:
+        stmt = stmt.filter(_linked_to(StudyMeshTerm, StudyMeshTerm.mesh_term_id, MeshTerm, MeshTerm.term, term))
+    if filters.journals:
+        stmt = stmt.filter(func.lower(StudyModel.journal).in_([journal.lower() for journal in filters.journals]))
+    if filters.year_from is not None or filters.year_to is not None:
+        # Same expression as the browse-order index, so year ranges are a
+        # range scan of it in listing order
+        year = func.coalesce(StudyModel.publication_year, 0)
+        stmt = stmt.filter(StudyModel.publication_year.isnot(None))
+        if filters.year_from is not None:
+            stmt = stmt.filter(year >= filters.year_from)
+        if filters.year_to is not None:
+            stmt = stmt.filter(year <= filters.year_to)
+    return stmt
+
+
+def _top(facet: str, value, count, stmt, limit: int):
+    """One facet's top values by count, as a UNION ALL member"""
+    top = (
+        # The facet name is inlined: asyncpg can't type a bare parameter
+        stmt.with_only_columns(
+            literal_column(f"'{facet}'").label("facet"), value.label("value"), count.label("count")
+        )
+        .where(value.isnot(None))
+        .group_by(value)
+        .order_by(count.desc(), value)
+        .limit(limit)
+        .subquery()
+    )
+    return select(top.c.facet, top.c.value, top.c.count)
+
+
+async def facet_counts(db: AsyncSession, matched_ids, limit: int = FACET_LIMIT) -> dict:
+    """
+    Top journals, publication years and MeSH terms among the studies
+    whose ids `matched_ids` (a select of Study.id) returns, counted in a
+    single query
+    """
+    matched = matched_ids.order_by(None).cte("matched")
+    count = func.count()
+    in_matched = select(StudyModel.id).join(matched, matched.c.id == StudyModel.id)
+    mesh = (
+        select(StudyMeshTerm.study_id)
+        .join(matched, matched.c.id == StudyMeshTerm.study_id)
+        .join(MeshTerm, MeshTerm.id == StudyMeshTerm.mesh_term_id)
+    )
+    stmt = union_all(
+        _top("journals", StudyModel.journal, count, in_matched, limit),
+        _top("years", cast(StudyModel.publication_year, String), count, in_matched, limit),
+        _top("mesh_terms", MeshTerm.term, count, mesh, limit),
+    )
+    facets = {"journals": [], "years": [], "mesh_terms": []}
+    for facet, value, total in (await db.execute(stmt)).all():
+        facets[facet].append({"value": int(value) if facet == "years" else value, "count": total})
+    return facets
@@ -0,0 +1,188 @@
+"""
+Normalized authors and MeSH terms.
+
+`Study.authors` and `Study.keywords` stay as the comma-joined strings the
+API returns, and each study is also linked to one `authors` row per name
+and one `mesh_terms` row per MeSH descriptor, so filters and facets can
+use indexed joins instead of ILIKE scans (see study_filters).
+
+Authors are split out of `Study.authors` ("Last Initials" never contains
+a comma). MeSH terms come from the parser's exact `mesh_terms` list when
+there is one. Otherwise, as for studies created through the API, they
+come from `keywords` split at commas, with adjacent pieces rejoined when
+the joined form ("Muscle, Skeletal") is already a known term.
+"""
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from sqlalchemy import delete, exists, insert, or_, select
+from sqlalchemy.orm import Session
+from app.database import dialect_insert
+from app.models import Author, MeshTerm, Study as StudyModel, StudyAuthor, StudyMeshTerm
+
+# Names per IN (...) lookup
+LOOKUP_CHUNK_SIZE = 500
+
+
+def _clean(names: Iterable[Optional[str]]) -> List[str]:
+    """Whitespace-normalized, non-empty names, first occurrence kept"""
+    seen = set()
+    cleaned = []
+    for name in names:
+        name = " ".join((name or "").split())
+        if name and name not in seen:
+            seen.add(name)
+            cleaned.append(name)
+    return cleaned
+
+
+def split_authors(authors: Optional[str]) -> List[str]:
+    return _clean((authors or "").split(","))
+
+
+def split_keywords(keywords: Optional[str], known_terms: Set[str] = frozenset()) -> List[str]:
+    """
+    Split comma-joined MeSH terms. Descriptors can contain a comma
+    themselves, so a piece is joined with the next when the result is in
+    `known_terms`.
+    """
+    pieces = [piece.strip() for piece in (keywords or "").split(",")]
+    terms = []
+    i = 0
+    while i < len(pieces):
+        if i + 1 < len(pieces) and f"{pieces[i]}, {pieces[i + 1]}" in known_terms:
+            terms.append(f"{pieces[i]}, {pieces[i + 1]}")
+            i += 2
+        else:
+            terms.append(pieces[i])
+            i += 1
+    return _clean(terms)
+
+
+def study_terms(study: dict, known_terms: Set[str] = frozenset()) -> dict:
+    """
+    A study's author names and MeSH terms. Either is None when the study
+    dict doesn't set it, meaning the study's existing links are kept.
+    """
+    authors = split_authors(study["authors"]) if study.get("authors") is not None else None
+    if study.get("mesh_terms") is not None:
+        mesh_terms = _clean(study["mesh_terms"])
+    elif study.get("keywords") is not None:
+        mesh_terms = split_keywords(study["keywords"], known_terms)
+    else:
+        mesh_terms = None
+    return {"authors": authors, "mesh_terms": mesh_terms}
+
+
+def known_mesh_terms(db: Session, keywords: Iterable[Optional[str]]) -> Set[str]:
+    """Known terms that contain a comma and could appear in `keywords`"""
+    candidates = set()
+    for value in keywords:
+        pieces = [piece.strip() for piece in (value or "").split(",")]
+        candidates.update(f"{a}, {b}" for a, b in zip(pieces, pieces[1:]))
+    return set(_lookup_ids(db, MeshTerm, MeshTerm.term, candidates))
+
+
+def _lookup_ids(db: Session, entity, column, names: Iterable[str]) -> Dict[str, int]:
+    names = list(names)
+    ids = {}
+    for i in range(0, len(names), LOOKUP_CHUNK_SIZE):
+        rows = db.execute(select(column, entity.id).where(column.in_(names[i:i + LOOKUP_CHUNK_SIZE])))
+        ids.update(rows.tuples().all())
+    return ids
+
+
+def _ensure_ids(db: Session, entity, column, names: Set[str]) -> Dict[str, int]:
+    """Ids for `names`, inserting the ones not stored yet"""
+    ids = _lookup_ids(db, entity, column, names)
+    missing = [{column.key: name} for name in names if name not in ids]
+    if missing:
+        # Another writer may add the same name concurrently; the lookup
+        # below picks up whichever row won
+        db.execute(dialect_insert(db.get_bind().dialect.name, entity).on_conflict_do_nothing(), missing)
+        ids.update(_lookup_ids(db, entity, column, (row[column.key] for row in missing)))
+    return ids
+
+
+def _replace_links(db: Session, link, names_by_study: Dict[int, List[str]], entity, column, build):
+    if not names_by_study:
+        return
+    ids = _ensure_ids(db, entity, column, {name for names in names_by_study.values() for name in names})
+    study_ids = list(names_by_study)
+    for i in range(0, len(study_ids), LOOKUP_CHUNK_SIZE):
+        db.execute(delete(link).where(link.study_id.in_(study_ids[i:i + LOOKUP_CHUNK_SIZE])))
+    rows = [
+        build(study_id, ids[name], position)
+        for study_id, names in names_by_study.items()
+        for position, name in enumerate(names)
+    ]
+    if rows:
+        db.execute(insert(link), rows)
+
+
+def sync_study_terms(db: Session, terms_by_study: Dict[int, dict]):
+    """
+    Point each study's author and MeSH links at the names in its
+    `study_terms()` dict, replacing its old links; a None list leaves that
+    kind of link alone. Doesn't commit.
+    """
+    _replace_links(
+        db, StudyAuthor,
+        {study_id: terms["authors"] for study_id, terms in terms_by_study.items() if terms["authors"] is not None},
+        Author, Author.name,
+        lambda study_id, author_id, position: {"study_id": study_id, "author_id": author_id, "position": position},
+    )
+    _replace_links(
+        db, StudyMeshTerm,
+        {study_id: terms["mesh_terms"] for study_id, terms in terms_by_study.items() if terms["mesh_terms"] is not None},
+        MeshTerm, MeshTerm.term,
+        lambda study_id, mesh_term_id, position: {"study_id": study_id, "mesh_term_id": mesh_term_id},
+    )
+
+
+def link_study(db: Session, study_id: int, fields: dict):
+    """
+    Re-link one study after a create or update that set `fields`. Unlike
+    in bulk ingestion, an author or keyword field set to None clears its
+    links. Doesn't commit.
+    """
+    given = {field: fields[field] or "" for field in ("authors", "keywords") if field in fields}
+    if fields.get("mesh_terms") is not None:
+        given["mesh_terms"] = fields["mesh_terms"]
+        known_terms = set()
+    else:
+        known_terms = known_mesh_terms(db, [given.get("keywords")])
+    sync_study_terms(db, {study_id: study_terms(given, known_terms)})
+
+
+def backfill_study_terms(db: Session, batch_size: int = 1000, progress: Optional[Callable] = None) -> int:
+    """
+    Link studies stored before authors and MeSH terms were normalized,
+    from their comma-joined `authors` and `keywords`. Only studies with
+    no links at all are touched, and each batch is committed on its own,
+    so an interrupted run picks up where it stopped. Returns how many
+    studies were linked.
+    """
+    unlinked = (
+        select(StudyModel.id, StudyModel.authors, StudyModel.keywords)
+        .where(
+            or_(StudyModel.authors.is_not(None), StudyModel.keywords.is_not(None)),
+            ~exists().where(StudyAuthor.study_id == StudyModel.id),
+            ~exists().where(StudyMeshTerm.study_id == StudyModel.id),
+        )
+        .order_by(StudyModel.id)
+        .limit(batch_size)
+    )
+    linked, last_id = 0, 0
+    while True:
+        rows = db.execute(unlinked.where(StudyModel.id > last_id)).all()
+        if not rows:
+            return linked
+        known_terms = known_mesh_terms(db, (row.keywords for row in rows))
+        sync_study_terms(db, {
+            row.id: study_terms({"authors": row.authors, "keywords": row.keywords}, known_terms)
+            for row in rows
+        })
+        db.commit()
+        linked += len(rows)
+        last_id = rows[-1].id
+        if progress:
+            progress(linked)
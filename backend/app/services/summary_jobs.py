@@ -0,0 +1,306 @@
+"""
+Persistent queue of summary pre-generation jobs.
+
+Every study without a summary can have one job row. Jobs run highest
+priority first, where priority is built from three sources:
+
+- recently ingested by the scraper: SUMMARY_PRIORITY_INGESTED
+- each detail-page view while the summary is missing: SUMMARY_PRIORITY_VIEW
+- the backfill of older studies: newer publications first (0-30)
+
+Workers claim a job by flipping it to "running" with a lease
+(`locked_until`), so several workers can share the table, and a job left
+running by a worker that died is picked up again once its lease expires.
+Failures are retried with exponential backoff up to SUMMARY_JOB_MAX_ATTEMPTS.
+Jobs submitted through the Message Batches API (see batch_summaries) are
+claimed under a `worker` starting with BATCH_CLAIM_PREFIX and also record
+their `batch_id`, so a restarted batch run can resume the batch.
+
+The functions take a sync Session; async callers use `db.run_sync`.
+"""
+import os
+import random
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Tuple
+from sqlalchemy import and_, case, exists, func, literal, or_, select, update
+from sqlalchemy.orm import Session
+from app.database import dialect_insert
+from app.models import Study as StudyModel, Summary as SummaryModel, SummaryJob
+from app.services.leases import WORKER_ID
+
+SUMMARY_PRIORITY_INGESTED = int(os.getenv("SUMMARY_PRIORITY_INGESTED", "100"))
+# Added per detail view of a study that has no summary yet; 0 disables
+SUMMARY_PRIORITY_VIEW = int(os.getenv("SUMMARY_PRIORITY_VIEW", "10"))
+SUMMARY_JOB_LEASE = float(os.getenv("SUMMARY_JOB_LEASE", "600"))
+SUMMARY_JOB_MAX_ATTEMPTS = int(os.getenv("SUMMARY_JOB_MAX_ATTEMPTS", "5"))
+SUMMARY_JOB_BACKOFF_BASE = float(os.getenv("SUMMARY_JOB_BACKOFF_BASE", "30"))
+SUMMARY_JOB_BACKOFF_MAX = float(os.getenv("SUMMARY_JOB_BACKOFF_MAX", "3600"))
+
+# Marks the `worker` of jobs claimed for a Message Batches batch
+BATCH_CLAIM_PREFIX = "batch:"
+BATCH_WORKER_ID = BATCH_CLAIM_PREFIX + WORKER_ID
+
+
+class ClaimedJob(NamedTuple):
+    id: int
+    study_id: int
+    attempts: int
+
+
+def _claimable(now: datetime):
+    return or_(
+        and_(SummaryJob.status == "pending", SummaryJob.run_after <= now),
+        and_(SummaryJob.status == "running", SummaryJob.locked_until < now),
+    )
+
+
+def enqueue_missing_summaries(
+    db: Session, priority: Optional[int] = None, since: Optional[datetime] = None
+) -> int:
+    """
+    Queue a job for every study that has neither a summary nor a job.
+
+    With `since`, only studies created from then on (e.g. by a scraper run
+    that started then). Without `priority`, newer publications rank higher.
+    Returns how many jobs were queued.
+    """
+    now = datetime.utcnow()
+    if priority is None:
+        age = func.coalesce(StudyModel.publication_year, 0) - 2000
+        priority_expr = case((age < 0, 0), (age > 30, 30), else_=age)
+    else:
+        priority_expr = literal(priority)
+
+    query = select(
+        StudyModel.id, priority_expr, literal("pending"), literal(0), literal(now), literal(now)
+    ).where(
+        ~exists().where(SummaryModel.study_id == StudyModel.id),
+        ~exists().where(SummaryJob.study_id == StudyModel.id),
+    )
+    if since is not None:
+        query = query.where(StudyModel.created_at >= since)
+
+    stmt = dialect_insert(db.get_bind().dialect.name, SummaryJob.__table__).from_select(
+        ["study_id", "priority", "status", "attempts", "run_after", "created_at"], query
+    )
+    result = db.execute(stmt.on_conflict_do_nothing(index_elements=["study_id"]))
+    db.commit()
+    return result.rowcount
+
+
+def record_study_view(db: Session, study_id: int):
+    """Move a study that still lacks a summary up the queue"""
+    if SUMMARY_PRIORITY_VIEW <= 0:
+        return
+    if db.execute(select(SummaryModel.id).where(SummaryModel.study_id == study_id)).first():
+        return
+    now = datetime.utcnow()
+    stmt = dialect_insert(db.get_bind().dialect.name, SummaryJob.__table__)
+    db.execute(
+        stmt.values(
+            study_id=study_id, priority=SUMMARY_PRIORITY_VIEW, status="pending", attempts=0,
+            run_after=now, created_at=now,
+        ).on_conflict_do_update(
+            index_elements=["study_id"],
+            set_={"priority": SummaryJob.__table__.c.priority + SUMMARY_PRIORITY_VIEW},
+            where=SummaryJob.__table__.c.status == "pending",
+        )
+    )
+    db.commit()
+
+
+def claim_summary_jobs(
+    db: Session, limit: int = 1, lease: float = SUMMARY_JOB_LEASE, worker: str = WORKER_ID
+) -> List[ClaimedJob]:
+    """
+    Claim up to `limit` runnable jobs for `worker`, highest priority first.
+
+    The candidates are taken with one conditional UPDATE, so when several
+    workers race for the same jobs each job goes to exactly one of them
+    (the loser may get fewer than `limit`).
+    """
+    now = datetime.utcnow()
+    candidates = db.execute(
+        select(SummaryJob.id)
+        .where(_claimable(now))
+        .order_by(SummaryJob.priority.desc(), SummaryJob.id)
+        .limit(limit)
+    ).scalars().all()
+    if not candidates:
+        return []
+
+    taken = db.execute(
+        update(SummaryJob)
+        .where(SummaryJob.id.in_(candidates), _claimable(now))
+        .values(
+            status="running",
+            attempts=SummaryJob.attempts + 1,
+            locked_until=now + timedelta(seconds=lease),
+            worker=worker,
+            batch_id=None,
+        )
+        .returning(SummaryJob.id, SummaryJob.study_id, SummaryJob.attempts)
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    return [ClaimedJob(*row) for row in taken]
+
+
+def complete_summary_job(db: Session, job_id: int):
+    complete_summary_jobs(db, [job_id])
+
+
+def complete_summary_jobs(db: Session, job_ids: List[int], commit: bool = True):
+    if not job_ids:
+        return
+    db.execute(
+        update(SummaryJob)
+        .where(SummaryJob.id.in_(job_ids))
+        .values(
+            status="done", locked_until=None, batch_id=None, last_error=None,
+            finished_at=datetime.utcnow(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        db.commit()
+
+
+def fail_summary_job(db: Session, job: ClaimedJob, error: str, retry: bool = True):
+    fail_summary_jobs(db, [job], error, retry=retry)
+
+
+def fail_summary_jobs(db: Session, jobs: List[ClaimedJob], error: str, retry: bool = True):
+    """Schedule retries with jittered exponential backoff, or give up"""
+    now = datetime.utcnow()
+    by_attempts = {}
+    for job in jobs:
+        by_attempts.setdefault(job.attempts, []).append(job.id)
+
+    for attempts, job_ids in by_attempts.items():
+        if retry and attempts < SUMMARY_JOB_MAX_ATTEMPTS:
+            delay = min(SUMMARY_JOB_BACKOFF_MAX, SUMMARY_JOB_BACKOFF_BASE * 2 ** (attempts - 1))
+            values = {
+                "status": "pending",
+                "run_after": now + timedelta(seconds=delay * random.uniform(0.5, 1.5)),
+            }
+        else:
+            values = {"status": "failed", "finished_at": now}
+        db.execute(
+            update(SummaryJob)
+            .where(SummaryJob.id.in_(job_ids))
+            .values(locked_until=None, batch_id=None, last_error=error[:2000], **values)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+
+def release_summary_jobs(db: Session, job_ids: List[int]):
+    """Put claimed jobs back in the queue untouched, refunding the attempt"""
+    db.execute(
+        update(SummaryJob)
+        .where(SummaryJob.id.in_(job_ids))
+        .values(
+            status="pending", attempts=SummaryJob.attempts - 1, locked_until=None, batch_id=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def assign_summary_batch(db: Session, job_ids: List[int], batch_id: str, lease: float = SUMMARY_JOB_LEASE):
+    """
+    Record which Message Batches batch the claimed jobs were submitted in,
+    extending their lease to `lease` seconds from now
+    """
+    db.execute(
+        update(SummaryJob)
+        .where(SummaryJob.id.in_(job_ids), SummaryJob.status == "running")
+        .values(batch_id=batch_id, locked_until=datetime.utcnow() + timedelta(seconds=lease))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def batch_summary_jobs(db: Session, batch_id: str) -> List[ClaimedJob]:
+    """The running jobs submitted in `batch_id`"""
+    rows = db.execute(
+        select(SummaryJob.id, SummaryJob.study_id, SummaryJob.attempts)
+        .where(SummaryJob.batch_id == batch_id, SummaryJob.status == "running")
+    ).all()
+    return [ClaimedJob(*row) for row in rows]
+
+
+def unassigned_summary_jobs(db: Session) -> Tuple[List[ClaimedJob], Optional[datetime]]:
+    """
+    Jobs claimed for a batch that are running without a batch_id, and
+    about when the earliest was claimed. A batch worker that died between
+    submitting a batch and recording its id leaves its jobs like this.
+    Jobs a summary worker is part way through are never batch-claimed, so
+    they are left to it.
+    """
+    rows = db.execute(
+        select(SummaryJob.id, SummaryJob.study_id, SummaryJob.attempts, SummaryJob.locked_until)
+        .where(
+            SummaryJob.status == "running",
+            SummaryJob.batch_id.is_(None),
+            SummaryJob.worker.startswith(BATCH_CLAIM_PREFIX, autoescape=True),
+        )
+    ).all()
+    earliest = min((row.locked_until for row in rows if row.locked_until), default=None)
+    claimed_since = earliest - timedelta(seconds=SUMMARY_JOB_LEASE) if earliest else None
+    return [ClaimedJob(*row[:3]) for row in rows], claimed_since
+
+
+def in_flight_summary_batches(db: Session) -> List[str]:
+    """Batches with running jobs, e.g. left by a batch worker that restarted"""
+    return list(db.execute(
+        select(SummaryJob.batch_id)
+        .where(SummaryJob.status == "running", SummaryJob.batch_id.is_not(None))
+        .distinct()
+    ).scalars())
+
+
+def summary_job_stats(db: Session) -> dict:
+    """Queue depth and progress of the pre-generation queue"""
+    now = datetime.utcnow()
+    by_status = dict(db.execute(
+        select(SummaryJob.status, func.count()).group_by(SummaryJob.status)
+    ).all())
+    ready, oldest_ready = db.execute(
+        select(func.count(), func.min(SummaryJob.run_after))
+        .where(SummaryJob.status == "pending", SummaryJob.run_after <= now)
+    ).one()
+    stalled = db.execute(
+        select(func.count()).where(SummaryJob.status == "running", SummaryJob.locked_until < now)
+    ).scalar()
+    done_last_hour = db.execute(
+        select(func.count()).where(
+            SummaryJob.status == "done", SummaryJob.finished_at >= now - timedelta(hours=1)
+        )
+    ).scalar()
+    studies = db.execute(select(func.count()).select_from(StudyModel)).scalar()
+    summaries = db.execute(select(func.count()).select_from(SummaryModel)).scalar()
+    return {
+        "pending": by_status.get("pending", 0),
+        "ready": ready,
+        "delayed": by_status.get("pending", 0) - ready,
+        "running": by_status.get("running", 0),
+        "stalled": stalled,
+        "done": by_status.get("done", 0),
+        "failed": by_status.get("failed", 0),
+        "done_last_hour": done_last_hour,
+        "oldest_ready_seconds": round((now - oldest_ready).total_seconds()) if oldest_ready else 0,
+        "summary_coverage": round(summaries / studies, 4) if studies else 0.0,
+    }
+
+
+def retry_failed_summary_jobs(db: Session) -> int:
+    """Give every failed job a fresh set of attempts. Returns how many."""
+    result = db.execute(
+        update(SummaryJob)
+        .where(SummaryJob.status == "failed")
+        .values(status="pending", attempts=0, run_after=datetime.utcnow(), finished_at=None)
+    )
+    db.commit()
+    return result.rowcount
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Hashable, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import AsyncSessionLocal, dialect_insert
+from app.models import Study as StudyModel, Summary as SummaryModel
+from app.services.admission import AdmissionRejected, llm_admission
+from app.services.ai_service import SUMMARY_MODEL, generate_summary, stream_summary
+from app.services.leases import acquire_lease, release_lease
+from app.services.llm_usage import usage_columns
+from app.services.response_cache import response_cache
+from app.services.singleflight import SingleFlight
+
+# How long one worker may hold the generation lease for a study
+SUMMARY_LEASE_TTL = float(os.getenv("SUMMARY_LEASE_TTL", "180"))
+# How long a caller waits on another worker's generation before giving up
+SUMMARY_WAIT_TIMEOUT = float(os.getenv("SUMMARY_WAIT_TIMEOUT", "120"))
+SUMMARY_POLL_INTERVAL = 0.5
+
+
+class StudyNotFoundError(LookupError):
+    pass
+
+
+class SummaryPendingError(TimeoutError):
+    """Another worker is still generating this summary"""
+
+
+_in_flight = SingleFlight()
+# Strong references so streaming generations aren't garbage collected mid-run
+_background_tasks = set()
+
+
+async def load_summary(db: AsyncSession, study_id: int) -> Optional[SummaryModel]:
+    return (await db.execute(
+        select(SummaryModel).filter(SummaryModel.study_id == study_id)
+    )).scalars().first()
+
+
+async def store_summary(
+    db: AsyncSession, study_id: int, summary_text: str, model_used: str, usage: Optional[dict] = None
+) -> SummaryModel:
+    """
+    Insert a summary, with the usage of the call that wrote it, unless
+    one already exists, and return the stored row
+    """
+    await db.execute(
+        dialect_insert(db.bind.dialect.name, SummaryModel)
+        .values(study_id=study_id, summary_text=summary_text, model_used=model_used, **usage_columns(usage))
+        .on_conflict_do_nothing(index_elements=["study_id"])
+    )
+    await db.commit()
+    # Drops the cached "Summary not found" for this study
+    response_cache.invalidate_summaries()
+    return await load_summary(db, study_id)
+
+
+async def get_or_create_summary(study_id: int, client: Optional[Hashable] = None) -> SummaryModel:
+    """
+    Return the summary for a study, generating it if needed.
+
+    Concurrent callers in this process share one generation (single
+    flight); callers in other processes are serialised by a database
+    lease, and the unique index on summaries.study_id backs both up.
+    Generating counts against `client`'s LLM admission limit and may
+    raise AdmissionRejected.
+    """
+    while True:
+        started = []
+
+        def produce():
+            started.append(True)
+            return _produce_summary(study_id, client)
+
+        try:
+            return await _in_flight.do(study_id, produce)
+        except AdmissionRejected as e:
+            # A shared generation is admitted under the client that started
+            # it. Being over *that* client's limit (429) says nothing about
+            # the callers that joined it, so they try again under their own.
+            # Capacity rejections (503) apply to everyone alike.
+            if started or e.status_code != 429:
+                raise
+
+
+async def _produce_summary(study_id: int, client: Optional[Hashable]) -> SummaryModel:
+    lease_key = f"summary:{study_id}"
+    deadline = time.monotonic() + SUMMARY_WAIT_TIMEOUT
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            existing = await load_summary(db, study_id)
+            if existing:
+                return existing
+            study = await db.get(StudyModel, study_id)
+            if not study:
+                raise StudyNotFoundError(study_id)
+            token = await acquire_lease(db, lease_key, SUMMARY_LEASE_TTL)
+        if token:
+            break
+        if time.monotonic() > deadline:
+            raise SummaryPendingError(study_id)
+        await asyncio.sleep(SUMMARY_POLL_INTERVAL)
+
+    try:
+        async with AsyncSessionLocal() as db:
+            # The previous holder may have finished between our check and the lease
+            existing = await load_summary(db, study_id)
+            if existing:
+                return existing
+
+        # No DB session is held while queued or while the model generates
+        async with llm_admission.admit(client):
+            summary_text, model_used, usage = await generate_summary(
+                title=study.title,
+                abstract=study.abstract or "",
+                authors=study.authors or ""
+            )
+
+        async with AsyncSessionLocal() as db:
+            return await store_summary(db, study_id, summary_text, model_used, usage)
+    finally:
+        async with AsyncSessionLocal() as db:
+            await release_lease(db, lease_key, token)
+
+
+async def stream_summary_events(
+    study_id: int, client: Optional[Hashable] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Yield ("status", str), ("delta", str) and finally ("summary", Summary)
+    events for a study's summary.
+
+    A stored summary is yielded straight away. Otherwise, if this caller
+    wins the generation lease, text deltas are relayed as Claude writes
+    them; generation runs in a background task, so the summary is still
+    stored if the client disconnects halfway. If another caller holds the
+    lease, this waits for their result like get_or_create_summary().
+    Raises StudyNotFoundError, or AdmissionRejected when `client` can't be
+    admitted to the model, before yielding anything.
+    """
+    lease_key = f"summary:{study_id}"
+    async with AsyncSessionLocal() as db:
+        existing = await load_summary(db, study_id)
+        if existing:
+            yield "summary", existing
+            return
+        study = await db.get(StudyModel, study_id)
+        if not study:
+            raise StudyNotFoundError(study_id)
+        token = await acquire_lease(db, lease_key, SUMMARY_LEASE_TTL)
+        # The previous holder may have finished between our check and the lease
+        existing = await load_summary(db, study_id) if token else None
+        if existing:
+            await release_lease(db, lease_key, token)
+            yield "summary", existing
+            return
+
+    if not token:
+        yield "status", "waiting"
+        yield "summary", await get_or_create_summary(study_id, client)
+        return
+
+    try:
+        ticket = await llm_admission.acquire(client)
+    except BaseException:
+        async with AsyncSessionLocal() as db:
+            await release_lease(db, lease_key, token)
+        raise
+
+    yield "status", "generating"
+    queue: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_stream_and_store(study, lease_key, token, queue, client, ticket))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    while True:
+        kind, value = await queue.get()
+        if kind == "error":
+            raise value
+        yield kind, value
+        if kind == "summary":
+            return
+
+
+async def _stream_and_store(
+    study: StudyModel, lease_key: str, token: str, queue: asyncio.Queue,
+    client: Optional[Hashable], ticket: float
+):
+    chunks = []
+    usage = {}
+    try:
+        async for text in stream_summary(
+            title=study.title,
+            abstract=study.abstract or "",
+            authors=study.authors or "",
+            usage=usage
+        ):
+            chunks.append(text)
+            queue.put_nowait(("delta", text))
+
+        async with AsyncSessionLocal() as db:
+            summary = await store_summary(db, study.id, "".join(chunks), SUMMARY_MODEL, usage)
+        queue.put_nowait(("summary", summary))
+    except Exception as e:
+        queue.put_nowait(("error", e))
+    finally:
+        llm_admission.release(client, ticket)
+        async with AsyncSessionLocal() as db:
+            await release_lease(db, lease_key, token)
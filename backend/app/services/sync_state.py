@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from sqlalchemy.orm import Session
+from app.database import dialect_insert
+from app.models import SyncState
+
+
+def get_watermark(db: Session, key: str) -> Optional[datetime]:
+    """When the sync named `key` last completed, or None if it never has"""
+    state = db.get(SyncState, key)
+    return state.last_run_at if state else None
+
+
+def get_watermarks(db: Session, keys: Iterable[str]) -> Dict[str, datetime]:
+    """Watermarks for every key that has one"""
+    states = db.query(SyncState).filter(SyncState.key.in_(list(keys)))
+    return {state.key: state.last_run_at for state in states}
+
+
+def set_watermarks(db: Session, keys: Iterable[str], last_run_at: datetime):
+    """
+    Record that the syncs named `keys` completed as of `last_run_at`.
+
+    Pass the time the run *started*, so records added while it was running
+    are picked up next time.
+    """
+    rows = [{"key": key, "last_run_at": last_run_at} for key in keys]
+    if not rows:
+        return
+    stmt = dialect_insert(db.get_bind().dialect.name, SyncState)
+    db.execute(
+        stmt.on_conflict_do_update(index_elements=["key"], set_={"last_run_at": stmt.excluded.last_run_at}),
+        rows,
+    )
+    db.commit()
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import dialect_insert
+from app.models import ClaimValidation
+from app.services.cache import TTLCache
+from app.services.llm_usage import usage_columns
+
+CLAIM_CACHE_SIZE = int(os.getenv("CLAIM_CACHE_SIZE", "1024"))
+CLAIM_CACHE_TTL = float(os.getenv("CLAIM_CACHE_TTL", "3600"))
+# Database rows older than this are treated as misses and overwritten
+CLAIM_CACHE_DB_TTL_DAYS = float(os.getenv("CLAIM_CACHE_DB_TTL_DAYS", "30"))
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_claim(claim: str) -> str:
+    """Case, punctuation and whitespace-insensitive form of a claim"""
+    return _SPACE_RE.sub(" ", _NON_WORD_RE.sub(" ", claim.lower())).strip()
+
+
+def cache_key(claim: str, studies: Iterable) -> str:
+    """
+    Key for a validation: the normalized claim plus the identity and
+    last-modified time of every study used as evidence, so the entry goes
+    stale on its own when the evidence set or any of its studies changes.
+    """
+    digest = hashlib.sha256(normalize_claim(claim).encode())
+    for study in studies:
+        updated_at = study.updated_at.isoformat() if study.updated_at else ""
+        digest.update(f"|{study.id}:{updated_at}".encode())
+    return digest.hexdigest()
+
+
+class ValidationCache:
+    """In-process LRU+TTL in front of the claim_validations table"""
+
+    def __init__(self, maxsize: int = CLAIM_CACHE_SIZE, ttl: float = CLAIM_CACHE_TTL):
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.db_hits = 0
+        self.misses = 0
+
+    async def get(self, db: AsyncSession, key: str) -> Optional[dict]:
+        result = self._memory.get(key)
+        if result is not None:
+            return result
+
+        cutoff = datetime.utcnow() - timedelta(days=CLAIM_CACHE_DB_TTL_DAYS)
+        row = (await db.execute(
+            select(ClaimValidation.result).filter(
+                ClaimValidation.cache_key == key,
+                ClaimValidation.created_at >= cutoff
+            )
+        )).scalar()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.db_hits += 1
+        result = json.loads(row)
+        self._memory.set(key, result)
+        return result
+
+    async def set(self, db: AsyncSession, key: str, claim: str, result: dict, usage: Optional[dict] = None):
+        """Store a result, with the usage of the validation that produced it"""
+        self._memory.set(key, result)
+        values = {
+            "cache_key": key,
+            "claim": normalize_claim(claim),
+            "result": json.dumps(result),
+            "created_at": datetime.utcnow(),
+            "llm_calls": (usage or {}).get("llm_calls"),
+            **usage_columns(usage),
+        }
+        stmt = dialect_insert(db.bind.dialect.name, ClaimValidation).values(**values)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["cache_key"],
+            set_={
+                column: stmt.excluded[column] for column in values if column not in ("cache_key", "claim")
+            }
+        ))
+        await db.commit()
+
+    def stats(self) -> dict:
+        memory = self._memory.stats()
+        hits = memory["hits"] + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": memory["hits"],
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_size": memory["size"],
+            "memory_maxsize": memory["maxsize"],
+        }
+
+
+validation_cache = ValidationCache()
@@ -0,0 +1,527 @@
+"""
+Offline semantic retrieval over studies.
+
+Dense vectors come from latent semantic analysis: TF-IDF over the same
+stemmed tokens as the BM25 index, projected onto the top singular vectors
+of the corpus (randomized SVD in NumPy; no model downloads). Terms that
+co-occur across the corpus ("hypertrophy" / "muscle growth", "CSA" /
+"cross-sectional area") land close together, so a query matches studies
+that use different wording.
+
+Vectors live in a float32 matrix, L2-normalised so cosine similarity is
+a dot product, and queries are scored with batched matrix products. The
+fitted model and matrix are snapshotted to VECTOR_INDEX_PATH and loaded
+with np.memmap, so restarts skip the fit and every worker process shares
+the same pages. New and edited studies are folded into the existing model
+incrementally; the model is refit once the corpus has outgrown it.
+"""
+import json
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import Study as StudyModel
+from app.services.retrieval import FIELD_WEIGHTS, tokenize
+
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "data/vector_index")
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "128"))
+VECTOR_MAX_FEATURES = int(os.getenv("VECTOR_MAX_FEATURES", "50000"))
+# Refit once the corpus is this many times larger than at the last fit
+VECTOR_REFIT_GROWTH = float(os.getenv("VECTOR_REFIT_GROWTH", "1.5"))
+
+_SNAPSHOT_VERSION = 1
+# Superseded snapshot generations are only deleted once they are at least
+# this old, so a save still being written by another process survives
+_SNAPSHOT_GRACE = 60.0
+# Rows scored per matrix product, so a memory-mapped matrix is paged in
+# a block at a time
+_SCORE_BLOCK = 1 << 16
+
+
+class _CSRMatrix:
+    """Just enough of a CSR sparse matrix to multiply by dense blocks"""
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, n_cols: int):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (len(indptr) - 1, n_cols)
+
+    def matmul(self, dense: np.ndarray, max_nnz: int = 1 << 20) -> np.ndarray:
+        n_rows = self.shape[0]
+        out = np.zeros((n_rows, dense.shape[1]), dtype=np.float32)
+        start = 0
+        while start < n_rows:
+            # As many rows as keep the gathered block under max_nnz entries
+            end = int(np.searchsorted(self.indptr, self.indptr[start] + max_nnz, side="right")) - 1
+            end = min(max(end, start + 1), n_rows)
+            lo, hi = self.indptr[start], self.indptr[end]
+            if hi > lo:
+                products = dense[self.indices[lo:hi]] * self.data[lo:hi, None]
+                nonempty = np.diff(self.indptr[start:end + 1]) > 0
+                offsets = self.indptr[start:end][nonempty] - lo
+                out[start:end][nonempty] = np.add.reduceat(products, offsets, axis=0)
+            start = end
+        return out
+
+    def transpose(self) -> "_CSRMatrix":
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind="stable")
+        counts = np.bincount(self.indices, minlength=self.shape[1])
+        indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return _CSRMatrix(indptr, rows[order].astype(np.int32), self.data[order], self.shape[0])
+
+
+def randomized_svd(
+    matrix: _CSRMatrix, n_components: int, n_oversamples: int = 10, n_iter: int = 2, seed: int = 0
+) -> np.ndarray:
+    """Top right singular vectors (n_components x n_cols) of a sparse matrix"""
+    transposed = matrix.transpose()
+    rank = min(n_components + n_oversamples, *matrix.shape)
+    rng = np.random.default_rng(seed)
+    q = matrix.matmul(rng.standard_normal((matrix.shape[1], rank)).astype(np.float32))
+    q, _ = np.linalg.qr(q)
+    for _ in range(n_iter):
+        z, _ = np.linalg.qr(transposed.matmul(q))
+        q, _ = np.linalg.qr(matrix.matmul(z))
+    b = transposed.matmul(q).T
+    _, _, vt = np.linalg.svd(b, full_matrices=False)
+    return np.ascontiguousarray(vt[:n_components], dtype=np.float32)
+
+
+def _weighted_terms(title: Optional[str], abstract: Optional[str], keywords: Optional[str]) -> Dict[str, float]:
+    weighted: Dict[str, float] = {}
+    for field, text in (("title", title), ("keywords", keywords), ("abstract", abstract)):
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            weighted[token] = weighted.get(token, 0.0) + weight
+    return weighted
+
+
+class VectorIndex:
+    """
+    Semantic study index: an LSA model plus one unit vector per study.
+
+    Thread-safe. Refreshes never block searches: the model and matrix are
+    swapped in under a short lock, and a refresh already running on
+    another thread makes further refresh calls return immediately.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = VECTOR_INDEX_PATH,
+        dim: int = VECTOR_DIM,
+        max_features: int = VECTOR_MAX_FEATURES,
+        refit_growth: float = VECTOR_REFIT_GROWTH,
+        refresh_interval: float = 5.0,
+    ):
+        self.path = path
+        self.dim = dim
+        self.max_features = max_features
+        self.refit_growth = refit_growth
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._vocab: Dict[str, int] = {}
+        self._idf = np.zeros(0, dtype=np.float32)
+        self._components = np.zeros((0, 0), dtype=np.float32)
+        # Vectors from the last fit or snapshot (possibly memory-mapped), then
+        # studies folded in since; slots number both in that order
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._extra = np.zeros((0, 0), dtype=np.float32)
+        # Study id per slot, -1 once removed
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._count = 0
+        self._slot_of: Dict[int, int] = {}
+        self._fitted_docs = 0
+        self._watermark: Optional[datetime] = None
+        # Studies already indexed whose updated_at equals the watermark
+        self._watermark_ids: set = set()
+        self._last_refresh: Optional[float] = None
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    @property
+    def fitted(self) -> bool:
+        return self._components.shape[0] > 0
+
+    # -- model -------------------------------------------------------------
+
+    def fit(self, rows: Sequence) -> None:
+        """(Re)build the model and all vectors from rows exposing id, title, abstract and keywords"""
+        docs = [(row.id, _weighted_terms(row.title, row.abstract, row.keywords)) for row in rows]
+        df: Dict[str, int] = {}
+        for _, terms in docs:
+            for term in terms:
+                df[term] = df.get(term, 0) + 1
+
+        # Terms seen in one study can't relate studies to each other
+        kept = sorted((t for t, n in df.items() if n > 1), key=lambda t: (-df[t], t))[:self.max_features]
+        vocab = {term: i for i, term in enumerate(sorted(kept))}
+        n_docs = max(len(docs), 1)
+        idf = np.zeros(len(vocab), dtype=np.float32)
+        for term, i in vocab.items():
+            idf[i] = math.log((1 + n_docs) / (1 + df[term])) + 1
+
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        for _, terms in docs:
+            row = sorted((vocab[t], tf) for t, tf in terms.items() if t in vocab)
+            indices.extend(i for i, _ in row)
+            data.extend(tf for _, tf in row)
+            indptr.append(len(indices))
+        matrix = _CSRMatrix(
+            np.asarray(indptr, dtype=np.int64),
+            np.asarray(indices, dtype=np.int32),
+            np.asarray(data, dtype=np.float32),
+            len(vocab),
+        )
+        if vocab:
+            _tfidf_in_place(matrix, idf)
+
+        dim = min(self.dim, *matrix.shape) if docs and vocab else 0
+        if dim == 0:
+            with self._lock:
+                watermark, last_refresh = self._watermark, self._last_refresh
+                self._reset()
+                self._watermark, self._last_refresh = watermark, last_refresh
+            return
+
+        components = randomized_svd(matrix, dim)
+        vectors = _normalize(matrix.matmul(np.ascontiguousarray(components.T)))
+        ids = np.asarray([study_id for study_id, _ in docs], dtype=np.int64)
+
+        with self._lock:
+            self._vocab = vocab
+            self._idf = idf
+            self._components = components
+            self._set_base(vectors, ids)
+            self._fitted_docs = len(ids)
+
+    def _set_base(self, vectors: np.ndarray, ids: np.ndarray):
+        self._vectors = vectors
+        self._extra = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        self._ids = ids
+        self._count = len(ids)
+        self._slot_of = {int(study_id): slot for slot, study_id in enumerate(ids)}
+
+    def embed(self, texts: Sequence[Tuple[Optional[str], Optional[str], Optional[str]]]) -> np.ndarray:
+        """Unit vectors for (title, abstract, keywords) triples; all-zero if nothing is in the vocabulary"""
+        with self._lock:
+            vocab, idf, components = self._vocab, self._idf, self._components
+        out = np.zeros((len(texts), components.shape[0]), dtype=np.float32)
+        for row, (title, abstract, keywords) in enumerate(texts):
+            terms = [(vocab[t], tf) for t, tf in _weighted_terms(title, abstract, keywords).items() if t in vocab]
+            if not terms:
+                continue
+            cols = np.fromiter((i for i, _ in terms), dtype=np.int64, count=len(terms))
+            weights = np.fromiter((tf for _, tf in terms), dtype=np.float32, count=len(terms))
+            weights = (1 + np.log(weights)) * idf[cols]
+            weights /= np.linalg.norm(weights)
+            out[row] = components[:, cols] @ weights
+        return _normalize(out)
+
+    # -- incremental updates ------------------------------------------------
+
+    def add_many(self, rows: Sequence):
+        """Fold rows exposing id, title, abstract and keywords into the index"""
+        if not self.fitted or not rows:
+            return
+        vectors = self.embed([(row.title, row.abstract, row.keywords) for row in rows])
+        with self._lock:
+            for row, vector in zip(rows, vectors):
+                slot = self._slot_of.get(row.id)
+                if slot is None:
+                    slot = self._append_slot(row.id)
+                self._set_vector(slot, vector)
+
+    def _set_vector(self, slot: int, vector: np.ndarray):
+        base = len(self._vectors)
+        if slot < base:
+            # On a copy-on-write memmap this only un-shares one page
+            self._vectors[slot] = vector
+        else:
+            self._extra[slot - base] = vector
+
+    def _append_slot(self, study_id: int) -> int:
+        base = len(self._vectors)
+        if self._count == len(self._ids):
+            # Appends go to a private block so the (shared) base stays untouched
+            used = self._count - base
+            capacity = max(1024, len(self._extra) * 2)
+            extra = np.zeros((capacity, self._vectors.shape[1]), dtype=np.float32)
+            extra[:used] = self._extra[:used]
+            ids = np.full(base + capacity, -1, dtype=np.int64)
+            ids[:self._count] = self._ids[:self._count]
+            self._extra, self._ids = extra, ids
+        slot = self._count
+        self._ids[slot] = study_id
+        self._slot_of[study_id] = slot
+        self._count += 1
+        return slot
+
+    def remove(self, study_id: int):
+        """Drop a study from the index"""
+        with self._lock:
+            slot = self._slot_of.pop(study_id, None)
+            if slot is not None:
+                self._ids[slot] = -1
+
+    def refresh(self, db: Session, force: bool = False):
+        """
+        Bring the index up to date with the `studies` table.
+
+        Loads the on-disk snapshot (or fits from scratch) the first time,
+        then folds in rows whose `updated_at` is past the watermark. Throttled
+        to once per `refresh_interval` seconds unless `force` is set.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            if (
+                not force
+                and self._last_refresh is not None
+                and now - self._last_refresh < self.refresh_interval
+            ):
+                return
+            self._last_refresh = now
+
+            if not self.fitted and self._watermark is None and self.path:
+                self.load(self.path)
+
+            query = db.query(
+                StudyModel.id, StudyModel.title, StudyModel.abstract,
+                StudyModel.keywords, StudyModel.updated_at,
+            )
+            if self._watermark is not None:
+                # >= so rows sharing the watermark timestamp aren't missed
+                query = query.filter(StudyModel.updated_at >= self._watermark)
+            rows = query.order_by(StudyModel.updated_at).all()
+            if self._watermark is not None:
+                # Rows at the watermark itself are usually the ones indexed last time
+                rows = [
+                    row for row in rows
+                    if row.updated_at != self._watermark or row.id not in self._watermark_ids
+                ]
+            watermark = max((row.updated_at for row in rows if row.updated_at), default=self._watermark)
+            at_watermark = {row.id for row in rows if row.updated_at == watermark}
+            if watermark == self._watermark:
+                at_watermark |= self._watermark_ids
+
+            new_ids = sum(1 for row in rows if row.id not in self._slot_of)
+            if not self.fitted or len(self) + new_ids > self._fitted_docs * self.refit_growth:
+                if self._watermark is not None:
+                    rows = db.query(StudyModel.id, StudyModel.title, StudyModel.abstract, StudyModel.keywords).all()
+                self.fit(rows)
+                changed = True
+            else:
+                self.add_many(rows)
+                changed = bool(rows)
+
+            self._watermark = watermark
+            self._watermark_ids = at_watermark
+            if changed and self.path and self.fitted:
+                self.save(self.path)
+        finally:
+            self._refresh_lock.release()
+
+    # -- queries ------------------------------------------------------------
+
+    def search(self, text: str, limit: int = 15, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Return up to `limit` (study_id, cosine) pairs scoring above `min_score`, best first"""
+        return self.search_many([text], limit, min_score)[0]
+
+    def search_many(
+        self, texts: Sequence[str], limit: int = 15, min_score: float = 0.0
+    ) -> List[List[Tuple[int, float]]]:
+        """Batched search: one ranked list per query text"""
+        if not self.fitted or not texts:
+            return [[] for _ in texts]
+        queries = self.embed([(text, None, None) for text in texts])
+        with self._lock:
+            ids = self._ids[:self._count].copy()
+            blocks = list(self._blocks())
+
+        best_scores = np.full((len(texts), 0), -np.inf, dtype=np.float32)
+        best_slots = np.zeros((len(texts), 0), dtype=np.int64)
+        for start, block in blocks:
+            end = start + len(block)
+            scores = queries @ np.asarray(block).T
+            scores[:, ids[start:end] < 0] = -np.inf
+            k = min(limit, end - start)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_slots = np.concatenate([best_slots, top + start], axis=1)
+            if best_scores.shape[1] > limit:
+                keep = np.argpartition(-best_scores, limit - 1, axis=1)[:, :limit]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_slots = np.take_along_axis(best_slots, keep, axis=1)
+
+        results = []
+        for scores, slots, query in zip(best_scores, best_slots, queries):
+            if not query.any():
+                results.append([])
+                continue
+            order = np.argsort(-scores, kind="stable")
+            results.append([
+                (int(ids[slots[i]]), float(scores[i])) for i in order if scores[i] > min_score
+            ])
+        return results
+
+    def _blocks(self):
+        """(first slot, vectors) pairs covering every slot in use"""
+        base = len(self._vectors)
+        for start in range(0, base, _SCORE_BLOCK):
+            yield start, self._vectors[start:start + _SCORE_BLOCK]
+        if self._count > base:
+            yield base, self._extra[:self._count - base]
+
+    # -- persistence --------------------------------------------------------
+
+    def save(self, path: str):
+        """
+        Snapshot the index under `path`.
+
+        Each snapshot goes into a fresh generation directory and `CURRENT`
+        is swapped atomically, so concurrent loaders (and other worker
+        processes saving at the same time) always see a complete snapshot.
+        The generation `CURRENT` pointed to before is kept for loaders that
+        already read it; older ones are deleted once past _SNAPSHOT_GRACE.
+        """
+        with self._lock:
+            live = self._ids[:self._count] >= 0
+            ids = self._ids[:self._count][live]
+            vectors = np.concatenate([np.asarray(block) for _, block in self._blocks()])[live]
+            vocab = sorted(self._vocab, key=self._vocab.get)
+            state = {
+                "version": _SNAPSHOT_VERSION,
+                "dim": int(self._components.shape[0]),
+                "count": int(len(ids)),
+                "fitted_docs": self._fitted_docs,
+                "watermark": self._watermark.isoformat() if self._watermark else None,
+                "watermark_ids": sorted(self._watermark_ids),
+            }
+            idf, components = self._idf, self._components
+
+        os.makedirs(path, exist_ok=True)
+        generation = f"gen-{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        directory = os.path.join(path, generation)
+        os.makedirs(directory)
+        np.savez(os.path.join(directory, "model.npz"), vocab=np.asarray(vocab), idf=idf, components=components)
+        np.save(os.path.join(directory, "ids.npy"), ids)
+        vectors.astype(np.float32).tofile(os.path.join(directory, "vectors.f32"))
+        with open(os.path.join(directory, "state.json"), "w") as f:
+            json.dump(state, f)
+
+        previous = _current_generation(path)
+        pointer = os.path.join(path, f"CURRENT.{generation}")
+        with open(pointer, "w") as f:
+            f.write(generation)
+        os.replace(pointer, os.path.join(path, "CURRENT"))
+
+        _prune_generations(path, keep={generation, previous})
+
+    def load(self, path: str) -> bool:
+        """Load the current snapshot under `path`, memory-mapping the vectors. False if there is none."""
+        try:
+            generation = _current_generation(path)
+            if generation is None:
+                return False
+            directory = os.path.join(path, generation)
+            with open(os.path.join(directory, "state.json")) as f:
+                state = json.load(f)
+            if state["version"] != _SNAPSHOT_VERSION:
+                return False
+            model = np.load(os.path.join(directory, "model.npz"))
+            ids = np.load(os.path.join(directory, "ids.npy"))
+            # Copy-on-write: pages stay shared until this process folds in an update
+            vectors = np.memmap(
+                os.path.join(directory, "vectors.f32"), dtype=np.float32, mode="c",
+                shape=(state["count"], state["dim"]),
+            ) if state["count"] else np.zeros((0, state["dim"]), dtype=np.float32)
+        except (OSError, ValueError, KeyError):
+            return False
+
+        with self._lock:
+            self._vocab = {str(term): i for i, term in enumerate(model["vocab"])}
+            self._idf = model["idf"]
+            self._components = model["components"]
+            self._set_base(vectors, ids)
+            self._fitted_docs = state["fitted_docs"]
+            self._watermark = datetime.fromisoformat(state["watermark"]) if state["watermark"] else None
+            self._watermark_ids = set(state.get("watermark_ids", []))
+        return True
+
+
+def _current_generation(path: str) -> Optional[str]:
+    try:
+        with open(os.path.join(path, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _prune_generations(path: str, keep: set):
+    """
+    Delete snapshot generations other than `keep` that are older than the
+    oldest kept one and past _SNAPSHOT_GRACE. Open memmaps keep their
+    (unlinked) files alive, so processes still searching them are fine.
+    """
+    def mtime(name: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(os.path.join(path, name))
+        except OSError:
+            return None
+
+    kept = [mtime(name) for name in keep if name]
+    cutoff = min([t for t in kept if t is not None] + [time.time() - _SNAPSHOT_GRACE])
+    for name in os.listdir(path):
+        if not name.startswith("gen-") or name in keep:
+            continue
+        modified = mtime(name)
+        if modified is not None and modified < cutoff:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def _tfidf_in_place(matrix: _CSRMatrix, idf: np.ndarray):
+    """Sublinear TF times IDF, each row L2-normalised"""
+    matrix.data = (1 + np.log(matrix.data)) * idf[matrix.indices]
+    row_of = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    norms = np.sqrt(np.bincount(row_of, weights=matrix.data ** 2, minlength=matrix.shape[0]))
+    matrix.data = (matrix.data / np.maximum(norms[row_of], 1e-12)).astype(np.float32)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+# Process-wide index shared by the API routers
+vector_index = VectorIndex()
+
+
+def refresh_vector_index(force: bool = False):
+    """
+    Sync `vector_index` using its own short-lived session.
+
+    Blocking (the first call may fit the model); async callers should run
+    it in a worker thread.
+    """
+    db = SessionLocal()
+    try:
+        vector_index.refresh(db, force=force)
+    finally:
+        db.close()
@@ -0,0 +1,37 @@
+import sys
+sys.path.insert(0, '/app')
+
+import argparse
+import time
+from app.database import SessionLocal, engine
+from app.migrations import run_migrations
+from app.models import Base
+from app.services.study_terms import backfill_study_terms
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Link existing studies to normalized authors and MeSH terms (for the API's filters and facets)"
+    )
+    parser.add_argument('--batch-size', type=int, default=1000, help="Studies linked per transaction")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+    started = time.monotonic()
+    db = SessionLocal()
+    try:
+        linked = backfill_study_terms(
+            db, batch_size=args.batch_size, progress=lambda count: print(f"Linked {count} studies")
+        )
+    finally:
+        db.close()
+
+    print("\n" + "=" * 60)
+    print(f"Linked: {linked} studies")
+    print(f"Elapsed: {time.monotonic() - started:.1f}s")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import sys
+sys.path.insert(0, '/app')
+
+import argparse
+import asyncio
+import time
+from app.database import AsyncSessionLocal, engine
+from app.migrations import run_migrations
+from app.models import Base
+from app.services.batch_summaries import SUMMARY_BATCH_POLL_INTERVAL, SUMMARY_BATCH_SIZE, run_summary_batches
+from app.services.llm_client import LLMClient, close_llm_client, set_llm_client
+from app.services.summary_jobs import enqueue_missing_summaries, summary_job_stats
+
+
+def report(batch, counts):
+    print(
+        f"{batch['id']}: {counts['succeeded']} stored, {counts['retried']} rescheduled, "
+        f"{counts['failed']} failed"
+    )
+
+
+async def main_async(args):
+    if args.backfill:
+        async with AsyncSessionLocal() as db:
+            print(f"Queued {await db.run_sync(enqueue_missing_summaries)} studies without a summary")
+
+    set_llm_client(LLMClient())
+    started = time.monotonic()
+    try:
+        totals = await run_summary_batches(
+            batch_size=args.batch_size,
+            max_batches=args.max_batches,
+            poll_interval=args.poll_interval,
+            on_batch=report,
+        )
+    finally:
+        await close_llm_client()
+    elapsed = time.monotonic() - started
+
+    async with AsyncSessionLocal() as db:
+        stats = await db.run_sync(summary_job_stats)
+
+    print("\n" + "=" * 60)
+    print(f"Batches: {totals['batches']}")
+    print(f"Summaries stored: {totals['succeeded']} ({totals['succeeded'] / max(elapsed, 1e-9):.1f}/s)")
+    print(f"Rescheduled: {totals['retried']}, failed: {totals['failed']}")
+    print(f"Queue: {stats['ready']} ready, {stats['delayed']} backing off, coverage {stats['summary_coverage']:.1%}")
+    print(f"Elapsed: {elapsed:.1f}s")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate queued study summaries through the Message Batches API"
+    )
+    parser.add_argument('--batch-size', type=int, default=SUMMARY_BATCH_SIZE, help="Requests per batch")
+    parser.add_argument('--max-batches', type=int, default=4, help="Batches in flight at once")
+    parser.add_argument('--poll-interval', type=float, default=SUMMARY_BATCH_POLL_INTERVAL,
+                        help="Initial seconds between status checks (backs off)")
+    parser.add_argument('--backfill', action='store_true', help="First queue every study without a summary")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
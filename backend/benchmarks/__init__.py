@@ -0,0 +1,12 @@
+"""
+Benchmark suite: a seeded synthetic corpus, a concurrent load generator
+for the API (with a fake, latency-injecting Anthropic API), micro-
+benchmarks of hot functions, and a comparison of saved results.
+
+Run from backend/ (see the README's Benchmarks section):
+
+    python -m benchmarks.corpus --size 100k
+    python -m benchmarks.load --concurrency 16 --duration 30
+    python -m benchmarks.micro
+    python -m benchmarks.compare benchmarks/results/A.json benchmarks/results/B.json
+"""
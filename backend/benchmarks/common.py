@@ -0,0 +1,70 @@
+"""Percentiles and result files shared by the benchmarks"""
+import json
+import math
+import os
+import platform
+import subprocess
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentile(ordered: Sequence[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of already sorted values"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def latency_summary(latencies: List[float]) -> dict:
+    """Mean, p50/p95/p99 and max of latencies given in seconds, in milliseconds"""
+    ordered = sorted(latencies)
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "mean_ms": ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": ms(percentile(ordered, 0.50)),
+        "p95_ms": ms(percentile(ordered, 0.95)),
+        "p99_ms": ms(percentile(ordered, 0.99)),
+        "max_ms": ms(ordered[-1]) if ordered else None,
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(kind: str, **settings) -> dict:
+    """What a result file was measured on, so runs can be compared fairly"""
+    return {
+        "kind": kind,
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        **settings,
+    }
+
+
+def write_results(meta: dict, results: dict, output: Optional[str] = None) -> str:
+    """
+    Save {"meta", "results"} as JSON, by default under benchmarks/results/
+    named after the kind, time and commit. Returns the path.
+    """
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{meta['kind']}-{stamp}-{meta.get('git_commit') or 'nogit'}.json")
+    with open(output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    return output
@@ -0,0 +1,79 @@
+"""
+Compare two benchmark result files of the same kind:
+
+    python -m benchmarks.compare benchmarks/results/load-A.json benchmarks/results/load-B.json
+
+Every numeric metric present in both is listed with its relative change.
+For latencies (`*_ms`, `*_us`) and error counts lower is better; for
+throughput higher is better. Changes beyond --threshold are marked.
+"""
+import argparse
+import json
+from typing import Dict
+
+LOWER_IS_BETTER = ("_ms", "_us", "errors")
+HIGHER_IS_BETTER = ("_rps",)
+
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    """{"search": {"p95_ms": 12.0}} -> {"search.p95_ms": 12.0}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def verdict(name: str, change: float, threshold: float) -> str:
+    if abs(change) < threshold:
+        return ""
+    if name.endswith(LOWER_IS_BETTER):
+        return "better" if change < 0 else "WORSE"
+    if name.endswith(HIGHER_IS_BETTER):
+        return "better" if change > 0 else "WORSE"
+    return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=5.0, help="Percent change worth marking")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    for label, data in (("baseline", baseline), ("candidate", candidate)):
+        meta = data["meta"]
+        print(f"{label:10s} {meta['kind']} at {meta.get('git_commit')} ({meta['created_at']})")
+    if baseline["meta"]["kind"] != candidate["meta"]["kind"]:
+        parser.error("the files hold different kinds of benchmark")
+    settings = sorted(
+        key for key in baseline["meta"].keys() & candidate["meta"].keys()
+        if key not in ("created_at", "git_commit") and baseline["meta"][key] != candidate["meta"][key]
+    )
+    for key in settings:
+        print(f"  note: {key} differs ({baseline['meta'][key]} vs {candidate['meta'][key]})")
+
+    old, new = flatten(baseline["results"]), flatten(candidate["results"])
+    print(f"\n{'metric':48s} {'baseline':>12s} {'candidate':>12s} {'change':>9s}")
+    for name in sorted(old.keys() & new.keys()):
+        if name.endswith("calls_per_run") or ".statuses." in name:
+            continue
+        before, after = old[name], new[name]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:48s} {before:12.2f} {after:12.2f} {change:+8.1f}%  {verdict(name, change, args.threshold)}")
+    # Whole scenarios or cases run in only one of the files
+    for label, names in (("baseline", old.keys() - new.keys()), ("candidate", new.keys() - old.keys())):
+        groups = sorted({name.split(".")[0] for name in names if ".statuses." not in name})
+        if groups:
+            print(f"\nOnly in {label}: {', '.join(groups)}")
+
+if __name__ == "__main__":
+    main()
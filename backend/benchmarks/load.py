@@ -0,0 +1,276 @@
+"""
+Concurrent load generator for the API.
+
+Each scenario is run on its own for --duration seconds (or --requests
+requests) by --concurrency workers, and reported as throughput, latency
+percentiles and status counts. Results are written as JSON for
+benchmarks.compare.
+
+By default the app runs in this process behind httpx.ASGITransport, with
+the fake Anthropic API (fakes.anthropic) mounted as the LLM transport
+and answering after --llm-latency seconds. This measures the app without
+a network hop, although the client shares its event loop. With
+--base-url, a running server is measured instead. Start it with
+ANTHROPIC_BASE_URL pointing at `uvicorn fakes.anthropic:app` and with
+LLM_MAX_PER_CLIENT raised, or the AI scenarios mostly measure 429s.
+
+Build a corpus first (benchmarks.corpus). Each scenario is preceded by
+--warmup untimed seconds of the same traffic. Read endpoints are served from
+the response cache after the first identical request, as in production.
+Pass --bust-cache to make every read a cache miss.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+import httpx
+from benchmarks.common import latency_summary, run_metadata, write_results
+from fakes.eutils import OUTCOMES, POPULATIONS, TOPICS
+
+SEARCH_TERMS = [
+    "protein", "creatine", "hypertrophy", "\"blood flow\"", "eccentric", "sleep restriction",
+    "muscle thickness", "hypertroph*", "training volume", "older adults",
+]
+SEMANTIC_QUERIES = [
+    "does eating more protein build muscle", "best way to grow muscles with light weights",
+    "does sleep affect gains", "how often should I train each muscle",
+]
+MESH_FILTERS = ["Resistance Training", "Dietary Proteins", "Creatine", "Sleep", "Muscle, Skeletal"]
+DEFAULT_SCENARIOS = [
+    "browse", "browse_cursor", "deep_page", "search", "search_semantic", "filter_facets", "summary", "claim",
+]
+
+
+class Scenario:
+    """
+    One kind of request. `make` builds the next request for a worker:
+    (method, url, json body) from its random generator and state dict.
+    """
+
+    def __init__(self, name: str, make: Callable, on_response: Optional[Callable] = None):
+        self.name = name
+        self.make = make
+        self.on_response = on_response
+
+
+def _read(url: str) -> tuple:
+    return "GET", url, None
+
+
+def build_scenarios(total: int, study_ids: List[int]) -> Dict[str, Scenario]:
+    last_page = max(0, total - 20)
+
+    def follow_cursor(state: dict, response: httpx.Response):
+        # Walk pages with next_cursor, starting over after ~50 pages
+        data = response.json() if response.status_code == 200 else {}
+        state["cursor"] = data.get("next_cursor") if state.get("pages", 0) < 50 else None
+        state["pages"] = state.get("pages", 0) + 1 if state["cursor"] else 0
+
+    def browse_cursor(rng: random.Random, state: dict):
+        cursor = state.get("cursor")
+        return _read(f"/api/studies/?limit=20" + (f"&cursor={cursor}" if cursor else ""))
+
+    claims = [
+        f"{phrase.capitalize()} improves {outcome} in {population}"
+        for _, phrase, _ in TOPICS for outcome in OUTCOMES for population in POPULATIONS
+    ]
+    return {scenario.name: scenario for scenario in [
+        # Shallow pages, as a list view would request
+        Scenario("browse", lambda rng, state: _read(f"/api/studies/?limit=20&skip={20 * rng.randrange(10)}")),
+        Scenario("browse_cursor", browse_cursor, follow_cursor),
+        # OFFSET paging far into the table
+        Scenario("deep_page", lambda rng, state: _read(
+            f"/api/studies/?limit=20&skip={rng.randint(last_page // 2, last_page)}"
+        )),
+        Scenario("search", lambda rng, state: _read(
+            f"/api/studies/?limit=20&search={rng.choice(SEARCH_TERMS)}"
+        )),
+        Scenario("search_semantic", lambda rng, state: _read(
+            f"/api/studies/?limit=20&mode=hybrid&search={rng.choice(SEMANTIC_QUERIES)}"
+        )),
+        Scenario("filter_facets", lambda rng, state: _read(
+            f"/api/studies/?limit=20&facets=true&mesh={rng.choice(MESH_FILTERS)}"
+            f"&year_from={rng.randint(2000, 2020)}"
+        )),
+        # Generated on first request, then read back from the database
+        Scenario("summary", lambda rng, state: (
+            "POST", "/api/summaries/", {"study_id": rng.choice(study_ids)}
+        )),
+        Scenario("claim", lambda rng, state: (
+            "POST", "/api/claims/validate", {"claim": rng.choice(claims)}
+        )),
+    ]}
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, scenario: Scenario, concurrency: int, duration: Optional[float],
+    requests: Optional[int], seed: int, bust_cache: bool,
+) -> dict:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    issued = 0
+    deadline = time.monotonic() + duration if duration else None
+
+    async def worker(number: int):
+        nonlocal issued
+        rng = random.Random(f"{seed}-{scenario.name}-{number}")
+        state: dict = {}
+        while True:
+            if (deadline and time.monotonic() >= deadline) or (requests and issued >= requests):
+                return
+            issued += 1
+            method, url, body = scenario.make(rng, state)
+            if bust_cache and method == "GET":
+                url += f"&_bust={issued}-{number}"
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=body)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                response, status = None, type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+            if response is not None and scenario.on_response:
+                scenario.on_response(state, response)
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = time.monotonic() - started
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "statuses": dict(statuses),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        **latency_summary(latencies),
+    }
+
+
+async def discover(client: httpx.AsyncClient, pages: int = 20) -> tuple:
+    """The corpus size and a sample of study ids, read through the API"""
+    response = await client.get("/api/studies/?limit=100&fields=id")
+    response.raise_for_status()
+    data = response.json()
+    ids = [study["id"] for study in data["studies"]]
+    for _ in range(pages - 1):
+        if not data.get("next_cursor"):
+            break
+        data = (await client.get(f"/api/studies/?limit=100&fields=id&cursor={data['next_cursor']}")).json()
+        ids.extend(study["id"] for study in data["studies"])
+    return data["total"], ids
+
+
+def in_process_client(llm_latency: float) -> tuple:
+    """
+    A client for the app in this process with the fake Anthropic API as
+    its LLM transport. Returns (client, setup), where setup() does the
+    app's startup work and returns its timings.
+    """
+    # One benchmark client is one IP; don't let per-client admission cap it
+    os.environ.setdefault("LLM_MAX_PER_CLIENT", "100000")
+    os.environ.setdefault("LLM_MAX_QUEUE", "100000")
+    from fakes import anthropic as fake_anthropic
+    from app.main import app
+    from app.services.llm_client import LLMClient, set_llm_client
+    from app.services.retrieval import refresh_study_index
+    from app.services.vector_index import refresh_vector_index
+
+    fake_anthropic.FAKE_ANTHROPIC_LATENCY = llm_latency
+
+    async def setup() -> dict:
+        # What the app's lifespan does, which ASGITransport doesn't run
+        set_llm_client(LLMClient(
+            api_key="fake", base_url="http://fake-anthropic",
+            transport=httpx.ASGITransport(app=fake_anthropic.app),
+        ))
+        started = time.monotonic()
+        await asyncio.to_thread(refresh_study_index, True)
+        await asyncio.to_thread(refresh_vector_index, True)
+        return {"index_build_s": round(time.monotonic() - started, 3)}
+
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300)
+    return client, setup
+
+
+async def main_async(args) -> tuple:
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=300)
+        setup = None
+    else:
+        client, setup = in_process_client(args.llm_latency)
+
+    async with client:
+        meta = run_metadata(
+            "load",
+            target=args.base_url or "in-process",
+            database=None if args.base_url else _database_name(),
+            concurrency=args.concurrency,
+            duration_s=args.duration,
+            warmup_s=args.warmup,
+            requests=args.requests,
+            llm_latency_s=None if args.base_url else args.llm_latency,
+            bust_cache=args.bust_cache,
+            seed=args.seed,
+        )
+        if setup:
+            meta.update(await setup())
+        total, study_ids = await discover(client)
+        meta["corpus_size"] = total
+        print(f"Corpus: {total} studies")
+
+        scenarios = build_scenarios(total, study_ids)
+        results = {}
+        for name in args.scenarios:
+            if args.warmup:
+                # Untimed: fill caches and connection pools first
+                await run_scenario(
+                    client, scenarios[name], args.concurrency, args.warmup, None, args.seed + 1, args.bust_cache
+                )
+            result = await run_scenario(
+                client, scenarios[name], args.concurrency, args.duration, args.requests, args.seed, args.bust_cache
+            )
+            results[name] = result
+            print(
+                f"{name:16s} {result['throughput_rps']:8.1f} req/s  p50 {result['p50_ms']:8.1f} ms  "
+                f"p95 {result['p95_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+                f"errors {result['errors']} {result['statuses'] if result['errors'] else ''}"
+            )
+    return meta, results
+
+
+def _database_name() -> str:
+    from app.database import engine
+    return engine.dialect.name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the API and record latency percentiles")
+    parser.add_argument('--scenarios', type=lambda value: value.split(','), default=DEFAULT_SCENARIOS,
+                        help=f"Comma-separated, from: {','.join(DEFAULT_SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent workers per scenario")
+    parser.add_argument('--duration', type=float, default=20, help="Seconds per scenario")
+    parser.add_argument('--warmup', type=float, default=2, help="Untimed seconds before each scenario")
+    parser.add_argument('--requests', type=int, help="Requests per scenario (instead of --duration)")
+    parser.add_argument('--llm-latency', type=float, default=1.0,
+                        help="Seconds the fake Anthropic API takes per call (in-process only)")
+    parser.add_argument('--base-url', help="Measure a running server instead of an in-process app")
+    parser.add_argument('--bust-cache', action='store_true', help="Make every read miss the response cache")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/load-<time>-<commit>.json)")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(DEFAULT_SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.requests:
+        args.duration = None
+
+    meta, results = asyncio.run(main_async(args))
+    path = write_results(meta, results, args.output)
+    print(f"\nResults written to {path}")
+
+if __name__ == "__main__":
+    main()
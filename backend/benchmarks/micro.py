@@ -0,0 +1,108 @@
+"""
+Micro-benchmarks of hot functions, on inputs from the seeded generator:
+claim keyword extraction, PubMed XML parsing, study page serialization
+and response compression.
+
+Each case is timed with timeit over --repeat runs; the best and median
+time per call are reported, in microseconds.
+"""
+import argparse
+import statistics
+import timeit
+from datetime import datetime
+from xml.etree import ElementTree as ET
+import orjson
+from app.api.claims import extract_keywords
+from app.schemas import StudyListResponse
+from app.services.compression import brotli, compress
+from benchmarks.common import run_metadata, write_results
+from benchmarks.corpus import generate_studies
+from fakes.eutils import FIRST_PMID, article_set_xml
+from scrape_pubmed import parse_pubmed_xml
+
+CLAIMS = [
+    "Creatine increases strength",
+    "Higher weekly training volume produces more muscle hypertrophy in trained women",
+    "Blood flow restriction training with light loads builds as much muscle as heavy lifting in older adults",
+]
+
+
+def study_page(size: int) -> dict:
+    """A studies page as list_studies builds it: one dict per row"""
+    now = datetime(2024, 1, 1)
+    studies = [
+        {
+            "id": number + 1, "title": study["title"], "authors": study["authors"], "abstract": study["abstract"],
+            "publication_year": study["publication_year"], "journal": study["journal"], "doi": study["doi"],
+            "pmid": study["pmid"], "pdf_url": None, "keywords": study["keywords"],
+            "created_at": now, "updated_at": now,
+        }
+        for number, study in enumerate(next(generate_studies(size, batch_size=size)))
+    ]
+    return {
+        "total": 100_000, "studies": studies, "page": 1, "page_size": size,
+        "next_cursor": None, "total_estimated": False, "facets": None,
+    }
+
+
+def build_cases(articles: int, page_size: int) -> dict:
+    xml = article_set_xml(list(range(FIRST_PMID, FIRST_PMID + articles)))
+    root = ET.fromstring(xml)
+    page = study_page(page_size)
+    body = orjson.dumps(page)
+
+    cases = {
+        f"extract_keywords[{len(claim.split())} words]": (lambda claim=claim: extract_keywords(claim))
+        for claim in CLAIMS
+    }
+    cases.update({
+        f"xml_fromstring[{articles} articles]": lambda: ET.fromstring(xml),
+        f"parse_pubmed_xml[{articles} articles]": lambda: parse_pubmed_xml(root),
+        # What the endpoint did before rows were serialized directly
+        f"page_pydantic[{page_size} studies]": lambda: StudyListResponse(**page).model_dump_json(),
+        f"page_orjson[{page_size} studies]": lambda: orjson.dumps(page),
+        f"gzip[{len(body) // 1024} KiB page]": lambda: compress(body, "gzip"),
+    })
+    if brotli is not None:
+        cases[f"brotli[{len(body) // 1024} KiB page]"] = lambda: compress(body, "br")
+    return cases
+
+
+def time_case(func, repeat: int, min_time: float) -> dict:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    # autorange aims for 0.2 s per run; stretch it towards min_time
+    number = max(1, int(number * max(1.0, min_time / 0.2)))
+    per_call = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "calls_per_run": number,
+        "best_us": round(min(per_call) * 1e6, 3),
+        "median_us": round(statistics.median(per_call) * 1e6, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time hot functions on generated inputs")
+    parser.add_argument('--articles', type=int, default=500, help="Articles in the parsed PubMed XML")
+    parser.add_argument('--page-size', type=int, default=100, help="Studies in the serialized page")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case")
+    parser.add_argument('--min-time', type=float, default=0.2, help="Approximate seconds per run")
+    parser.add_argument('--filter', help="Only run cases whose name contains this")
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/micro-<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    results = {}
+    for name, func in build_cases(args.articles, args.page_size).items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = time_case(func, args.repeat, args.min_time)
+        print(f"{name:40s} best {results[name]['best_us']:12.1f} us  median {results[name]['median_us']:12.1f} us")
+
+    meta = run_metadata(
+        "micro", articles=args.articles, page_size=args.page_size, repeat=args.repeat, min_time_s=args.min_time,
+    )
+    path = write_results(meta, results, args.output)
+    print(f"\nResults written to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Fake Anthropic API for running summarization and claim validation offline.
+
+Serves the Messages API (plain and streaming) and the Message Batches API
+(create, list, retrieve, cancel and JSONL results) with deterministic canned
+text, simulated latency, and injectable errors. Run it with
+
+    uvicorn fakes.anthropic:app --port 8082
+    ANTHROPIC_BASE_URL=http://localhost:8082 ANTHROPIC_API_KEY=fake python batch_summarize.py
+
+or mount it in-process with httpx.ASGITransport(app=app).
+
+Latency model: a Messages call takes FAKE_ANTHROPIC_LATENCY seconds, plus
+prefill time for its uncached input tokens at FAKE_PREFILL_RATE tokens/s
+before the first token; a batch works through its requests at
+FAKE_BATCH_RATE requests/second.
+
+Prompt caching is simulated: a system prompt ending in a cache_control
+breakpoint and at least FAKE_CACHE_MIN_TOKENS long is written to the
+cache on first use and read back (refreshing its 5 minute TTL) after.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timedelta
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FAKE_ANTHROPIC_LATENCY = float(os.getenv("FAKE_ANTHROPIC_LATENCY", "1.0"))
+# Fraction of Messages calls answered 529, and of batch requests that error
+FAKE_ANTHROPIC_ERROR_RATE = float(os.getenv("FAKE_ANTHROPIC_ERROR_RATE", "0"))
+FAKE_BATCH_RATE = float(os.getenv("FAKE_BATCH_RATE", "100"))
+FAKE_ANTHROPIC_SEED = int(os.getenv("FAKE_ANTHROPIC_SEED", "42"))
+FAKE_PREFILL_RATE = float(os.getenv("FAKE_PREFILL_RATE", "5000"))
+# The API's minimum cacheable prompt for Sonnet models
+FAKE_CACHE_MIN_TOKENS = int(os.getenv("FAKE_CACHE_MIN_TOKENS", "1024"))
+CACHE_TTL = 300
+
+MAX_BATCH_REQUESTS = 100_000
+
+app = FastAPI(title="Fake Anthropic API")
+
+_rng = random.Random(FAKE_ANTHROPIC_SEED)
+_batches = {}
+# Hash of a cached prefix -> expiry (time.monotonic())
+_prompt_cache = {}
+
+_TITLE_RE = re.compile(r"Title: (.+)")
+_STUDY_RE = re.compile(r"Study (\d+):")
+
+
+def _error(status: int, error_type: str, message: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"type": "error", "error": {"type": error_type, "message": message}},
+    )
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content)
+    return content or ""
+
+
+def _prompt(params: dict) -> str:
+    """System prompt and last user message, which the canned replies key off"""
+    return _text(params.get("system")) + "\n\n" + _text(params["messages"][-1]["content"])
+
+
+def _tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def usage(params: dict, prompt: str, output: str) -> dict:
+    """Token counts, with the system prompt served from (or written to) the cache"""
+    counts = {
+        "input_tokens": _tokens(prompt),
+        "output_tokens": _tokens(output),
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 0,
+    }
+    system = params.get("system")
+    if not isinstance(system, list) or not system or "cache_control" not in system[-1]:
+        return counts
+    prefix = _text(system)
+    if _tokens(prefix) < FAKE_CACHE_MIN_TOKENS:
+        return counts
+
+    key = hashlib.sha1(json.dumps([params.get("model"), prefix]).encode()).hexdigest()
+    now = time.monotonic()
+    hit = _prompt_cache.get(key, 0) > now
+    _prompt_cache[key] = now + CACHE_TTL
+    counts["input_tokens"] -= _tokens(prefix)
+    counts["cache_read_input_tokens" if hit else "cache_creation_input_tokens"] = _tokens(prefix)
+    return counts
+
+
+def _prefill_seconds(result: dict) -> float:
+    # Cache reads are close to free; everything else is processed
+    processed = result["usage"]["input_tokens"] + result["usage"]["cache_creation_input_tokens"]
+    return processed / FAKE_PREFILL_RATE
+
+
+def reply_text(prompt: str) -> str:
+    """Canned answer shaped like what the app's prompts ask for"""
+    digest = int(hashlib.sha1(prompt.encode()).hexdigest(), 16)
+    if '"stance"' in prompt:
+        numbers = [int(n) for n in _STUDY_RE.findall(prompt)]
+        stances = ["supporting", "mixed", "refuting", "irrelevant"]
+        return json.dumps({"studies": [
+            {"id": n, "stance": stances[(digest + n) % 4], "finding": f"Study {n} reported a modest effect."}
+            for n in numbers
+        ]})
+    if '"verdict"' in prompt:
+        numbers = sorted({int(n) for n in re.findall(r"Study (\d+)", prompt)})[:3] or [1]
+        result = {
+            "verdict": ["SUPPORTED", "PARTIALLY_SUPPORTED", "NOT_SUPPORTED"][digest % 3],
+            "confidence": ["high", "moderate", "low"][digest % 3],
+            "summary": "The studies point in broadly the same direction.",
+            "evidence": {"supporting": 2, "mixed": 1, "refuting": 0},
+            "bottom_line": "Apply with the usual caveats.",
+        }
+        if '"key_studies": [<study numbers' in prompt:
+            result["key_studies"] = numbers
+        else:
+            result["key_studies"] = [
+                {"id": n, "title": f"Study {n}", "finding": "A modest effect."} for n in numbers
+            ]
+        return json.dumps(result)
+
+    title = _TITLE_RE.search(prompt)
+    title = title.group(1) if title else "this study"
+    return (
+        f"## Study Overview\nThis analysis covers {title}.\n\n"
+        "## Key Findings\nParticipants gained muscle with a moderate effect size.\n\n"
+        "## Practical Applications\nTrain each muscle group twice a week.\n\n"
+        "## Bottom Line\nA useful, if small, study."
+    )
+
+
+def message(params: dict) -> dict:
+    prompt = _prompt(params)
+    text = reply_text(prompt)
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "claude-fake"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": usage(params, prompt, text),
+    }
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+@app.post("/v1/messages")
+async def create_message(request: Request):
+    params = await request.json()
+    if FAKE_ANTHROPIC_ERROR_RATE and _rng.random() < FAKE_ANTHROPIC_ERROR_RATE:
+        return _error(529, "overloaded_error", "Overloaded (injected)")
+    result = message(params)
+
+    if not params.get("stream"):
+        await asyncio.sleep(_prefill_seconds(result) + FAKE_ANTHROPIC_LATENCY)
+        return result
+
+    async def events():
+        text = result["content"][0]["text"]
+        pieces = re.findall(r"\S+\s*", text) or [text]
+        await asyncio.sleep(_prefill_seconds(result))
+        yield _sse({"type": "message_start", "message": {**result, "content": [], "usage": {
+            **result["usage"], "output_tokens": 1
+        }}})
+        yield _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        for piece in pieces:
+            await asyncio.sleep(FAKE_ANTHROPIC_LATENCY / len(pieces))
+            yield _sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}})
+        yield _sse({"type": "content_block_stop", "index": 0})
+        yield _sse({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {
+            "output_tokens": result["usage"]["output_tokens"]
+        }})
+        yield _sse({"type": "message_stop"})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def _processed(batch: dict) -> int:
+    """How many of the batch's requests have been worked through so far"""
+    total = len(batch["requests"])
+    if batch["ended_at"] is not None or batch["canceling"]:
+        return total
+    return min(total, int((time.monotonic() - batch["started"]) * FAKE_BATCH_RATE))
+
+
+def _batch_state(batch: dict) -> dict:
+    """The batch's public object, as of now"""
+    total = len(batch["requests"])
+    processed = _processed(batch)
+    if batch["ended_at"] is None and processed >= total:
+        batch["ended_at"] = datetime.utcnow()
+
+    counts = {"processing": total - processed, "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0}
+    for outcome in batch["outcomes"][:processed]:
+        counts[outcome] += 1
+    ended = batch["ended_at"] is not None
+    return {
+        "id": batch["id"],
+        "type": "message_batch",
+        "processing_status": "ended" if ended else ("canceling" if batch["canceling"] else "in_progress"),
+        "request_counts": counts,
+        "created_at": batch["created_at"].isoformat() + "Z",
+        "expires_at": (batch["created_at"] + timedelta(hours=24)).isoformat() + "Z",
+        "ended_at": batch["ended_at"].isoformat() + "Z" if ended else None,
+        "cancel_initiated_at": None,
+        "archived_at": None,
+        "results_url": f"{batch['base_url']}v1/messages/batches/{batch['id']}/results" if ended else None,
+    }
+
+
+@app.post("/v1/messages/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    requests = body.get("requests") or []
+    if not requests or len(requests) > MAX_BATCH_REQUESTS:
+        return _error(400, "invalid_request_error", f"requests must hold 1-{MAX_BATCH_REQUESTS} items")
+    custom_ids = [item.get("custom_id") for item in requests]
+    if len(set(custom_ids)) != len(custom_ids):
+        return _error(400, "invalid_request_error", "custom_id values must be unique")
+
+    outcomes = []
+    for item in requests:
+        if "messages" not in item.get("params", {}):
+            outcomes.append("errored")
+        elif FAKE_ANTHROPIC_ERROR_RATE and _rng.random() < FAKE_ANTHROPIC_ERROR_RATE:
+            outcomes.append("errored")
+        else:
+            outcomes.append("succeeded")
+
+    batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+    _batches[batch_id] = {
+        "id": batch_id,
+        "requests": requests,
+        "outcomes": outcomes,
+        "started": time.monotonic(),
+        "created_at": datetime.utcnow(),
+        "ended_at": None,
+        "canceling": False,
+        "base_url": str(request.base_url),
+    }
+    return _batch_state(_batches[batch_id])
+
+
+@app.get("/v1/messages/batches")
+async def list_batches(limit: int = 20, after_id: str = None):
+    """Newest first, paged with after_id like the API"""
+    ordered = sorted(_batches.values(), key=lambda batch: batch["started"], reverse=True)
+    ids = [batch["id"] for batch in ordered]
+    if after_id in ids:
+        ordered = ordered[ids.index(after_id) + 1:]
+    page = [_batch_state(batch) for batch in ordered[:limit]]
+    return {
+        "data": page,
+        "has_more": len(ordered) > limit,
+        "first_id": page[0]["id"] if page else None,
+        "last_id": page[-1]["id"] if page else None,
+    }
+
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def retrieve_batch(batch_id: str):
+    batch = _batches.get(batch_id)
+    if batch is None:
+        return _error(404, "not_found_error", "Batch not found")
+    return _batch_state(batch)
+
+
+@app.post("/v1/messages/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str):
+    batch = _batches.get(batch_id)
+    if batch is None:
+        return _error(404, "not_found_error", "Batch not found")
+    if batch["ended_at"] is None:
+        processed = _processed(batch)
+        batch["outcomes"][processed:] = ["canceled"] * (len(batch["requests"]) - processed)
+        batch["canceling"] = True
+    return _batch_state(batch)
+
+
+@app.get("/v1/messages/batches/{batch_id}/results")
+async def batch_results(batch_id: str):
+    batch = _batches.get(batch_id)
+    if batch is None:
+        return _error(404, "not_found_error", "Batch not found")
+    if _batch_state(batch)["processing_status"] != "ended":
+        return _error(400, "invalid_request_error", "Batch has not ended yet")
+
+    def lines():
+        for item, outcome in zip(batch["requests"], batch["outcomes"]):
+            if outcome == "succeeded":
+                result = {"type": "succeeded", "message": message(item["params"])}
+            elif outcome == "errored":
+                invalid = "messages" not in item.get("params", {})
+                error_type = "invalid_request_error" if invalid else _rng.choice(["api_error", "overloaded_error"])
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": error_type, "message": f"{error_type} (injected)"
+                }}}
+            else:
+                result = {"type": outcome}
+            yield json.dumps({"custom_id": item["custom_id"], "result": result}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/binary")
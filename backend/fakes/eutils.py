@@ -0,0 +1,195 @@
+"""
+Fake NCBI E-utilities server for running the PubMed harvester offline.
+
+Serves deterministic, PubMed-shaped ESearch/EFetch responses (including
+WebEnv/query_key history paging) and can inject 429/5xx errors. Run it
+with
+
+    uvicorn fakes.eutils:app --port 8081
+    EUTILS_BASE_URL=http://localhost:8081 python harvest_pubmed.py
+
+or mount it in-process with httpx.ASGITransport(app=app).
+"""
+import hashlib
+import os
+import random
+import uuid
+from datetime import date
+from typing import List, Optional
+from xml.sax.saxutils import escape
+from fastapi import FastAPI, Request, Response
+
+FAKE_EUTILS_TOTAL = int(os.getenv("FAKE_EUTILS_TOTAL", "1000"))
+FAKE_EUTILS_ERROR_RATE = float(os.getenv("FAKE_EUTILS_ERROR_RATE", "0"))
+FAKE_EUTILS_SEED = int(os.getenv("FAKE_EUTILS_SEED", "42"))
+
+FIRST_PMID = 30000000
+
+TOPICS = [
+    ("Resistance training volume", "training volume", "Resistance Training"),
+    ("Protein supplementation", "protein intake", "Dietary Proteins"),
+    ("Training frequency", "weekly frequency", "Exercise"),
+    ("Muscle protein synthesis", "myofibrillar protein synthesis", "Muscle Proteins"),
+    ("Blood flow restriction", "low-load occlusion training", "Blood Flow Restriction Therapy"),
+    ("Creatine supplementation", "creatine monohydrate", "Creatine"),
+    ("Eccentric loading", "eccentric contractions", "Muscle Contraction"),
+    ("Sleep and recovery", "sleep restriction", "Sleep"),
+]
+POPULATIONS = ["untrained men", "trained women", "older adults", "adolescent athletes", "recreationally active adults"]
+OUTCOMES = ["muscle hypertrophy", "cross-sectional area", "lean body mass", "maximal strength", "muscle thickness"]
+JOURNALS = [
+    "Journal of strength and conditioning research",
+    "Medicine and science in sports and exercise",
+    "European journal of applied physiology",
+    "Sports medicine (Auckland, N.Z.)",
+    "Journal of applied physiology (Bethesda, Md. : 1985)",
+]
+LAST_NAMES = ["Schoenfeld", "Phillips", "Morton", "Krieger", "Helms", "Grgic", "Ogborn", "Haun", "Damas", "Nippard"]
+MESH = [
+    "Muscle, Skeletal", "Hypertrophy", "Humans", "Male", "Female", "Adult",
+    "Muscle Strength", "Resistance Training", "Young Adult", "Exercise",
+]
+
+app = FastAPI(title="Fake E-utilities")
+
+_rng = random.Random(FAKE_EUTILS_SEED)
+_history = {}
+
+
+def article_date(pmid: int) -> date:
+    offset = pmid - FIRST_PMID
+    return date(2000 + offset % 25, 1 + offset % 12, 1 + offset % 28)
+
+
+def article_xml(pmid: int) -> str:
+    """Deterministic PubmedArticle element for a PMID"""
+    rng = random.Random(pmid)
+    topic, phrase, mesh_topic = rng.choice(TOPICS)
+    population = rng.choice(POPULATIONS)
+    outcome = rng.choice(OUTCOMES)
+    published = article_date(pmid)
+    participants = rng.randint(12, 120)
+    weeks = rng.randint(6, 24)
+    authors = "".join(
+        f"<Author ValidYN=\"Y\"><LastName>{rng.choice(LAST_NAMES)}</LastName>"
+        f"<ForeName>A</ForeName><Initials>{chr(65 + rng.randrange(26))}{chr(65 + rng.randrange(26))}</Initials></Author>"
+        for _ in range(rng.randint(1, 8))
+    )
+    mesh = "".join(
+        f"<MeshHeading><DescriptorName UI=\"D{rng.randrange(10**6):06d}\">{escape(term)}</DescriptorName></MeshHeading>"
+        for term in [mesh_topic] + rng.sample(MESH, rng.randint(2, 6))
+    )
+    abstract = (
+        f"<AbstractText Label=\"BACKGROUND\">{topic} is thought to influence {outcome} in {population}.</AbstractText>"
+        f"<AbstractText Label=\"METHODS\">{participants} participants completed {weeks} weeks "
+        f"of training with manipulated {phrase}.</AbstractText>"
+        f"<AbstractText Label=\"RESULTS\">{outcome.capitalize()} increased by {rng.uniform(1, 15):.1f}% "
+        f"(p = {rng.uniform(0.001, 0.2):.3f}).</AbstractText>"
+        f"<AbstractText Label=\"CONCLUSIONS\">{phrase.capitalize()} {'does' if rng.random() > 0.3 else 'does not'} "
+        f"meaningfully affect {outcome}.</AbstractText>"
+    )
+    return (
+        "<PubmedArticle>"
+        "<MedlineCitation Status=\"MEDLINE\" Owner=\"NLM\">"
+        f"<PMID Version=\"1\">{pmid}</PMID>"
+        "<Article PubModel=\"Print\">"
+        f"<Journal><JournalIssue CitedMedium=\"Internet\"><PubDate><Year>{published.year}</Year>"
+        f"<Month>{published.month:02d}</Month></PubDate></JournalIssue>"
+        f"<Title>{escape(rng.choice(JOURNALS))}</Title></Journal>"
+        f"<ArticleTitle>Effects of {weeks} weeks of {phrase} on {outcome} in {participants} {population}: "
+        "a randomized trial.</ArticleTitle>"
+        f"<Abstract>{abstract}</Abstract>"
+        f"<AuthorList CompleteYN=\"Y\">{authors}</AuthorList>"
+        "</Article>"
+        f"<MeshHeadingList>{mesh}</MeshHeadingList>"
+        "</MedlineCitation>"
+        "<PubmedData>"
+        "<ArticleIdList>"
+        f"<ArticleId IdType=\"pubmed\">{pmid}</ArticleId>"
+        f"<ArticleId IdType=\"doi\">10.5555/fake.{pmid}</ArticleId>"
+        "</ArticleIdList>"
+        "<ReferenceList><Reference><Citation>Cited work</Citation>"
+        "<AuthorList><Author><LastName>Referenced</LastName><Initials>ZZ</Initials></Author></AuthorList>"
+        "</Reference></ReferenceList>"
+        "</PubmedData>"
+        "</PubmedArticle>"
+    )
+
+
+def article_set_xml(pmids: List[int]) -> str:
+    return (
+        "<?xml version=\"1.0\" ?>\n<PubmedArticleSet>"
+        + "".join(article_xml(pmid) for pmid in pmids)
+        + "</PubmedArticleSet>"
+    )
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    parts = [int(p) for p in value.replace("-", "/").split("/")]
+    return date(parts[0], parts[1] if len(parts) > 1 else 1, parts[2] if len(parts) > 2 else 1)
+
+
+def matching_pmids(term: str, mindate: Optional[str] = None, maxdate: Optional[str] = None) -> List[int]:
+    """Each distinct term matches its own deterministic slice of the fake corpus"""
+    offset = int(hashlib.sha1(term.encode()).hexdigest(), 16) % 1000
+    pmids = range(FIRST_PMID + offset, FIRST_PMID + offset + FAKE_EUTILS_TOTAL)
+    low, high = _parse_date(mindate), _parse_date(maxdate)
+    return [
+        pmid for pmid in pmids
+        if (low is None or article_date(pmid) >= low) and (high is None or article_date(pmid) <= high)
+    ]
+
+
+def _injected_error() -> Optional[Response]:
+    if FAKE_EUTILS_ERROR_RATE and _rng.random() < FAKE_EUTILS_ERROR_RATE:
+        status = _rng.choice([429, 500, 502, 503])
+        return Response(status_code=status, content='{"error":"injected failure"}', media_type="application/json")
+    return None
+
+
+async def _params(request: Request) -> dict:
+    params = dict(request.query_params)
+    if request.method == "POST":
+        params.update(dict(await request.form()))
+    return params
+
+
+@app.api_route("/esearch.fcgi", methods=["GET", "POST"])
+async def esearch(request: Request):
+    error = _injected_error()
+    if error:
+        return error
+    params = await _params(request)
+    pmids = matching_pmids(params.get("term", ""), params.get("mindate"), params.get("maxdate"))
+    retstart = int(params.get("retstart", 0))
+    retmax = int(params.get("retmax", 20))
+    result = {
+        "count": str(len(pmids)),
+        "retmax": str(min(retmax, max(len(pmids) - retstart, 0))),
+        "retstart": str(retstart),
+        "idlist": [str(pmid) for pmid in pmids[retstart:retstart + retmax]],
+    }
+    if params.get("usehistory") == "y":
+        webenv = uuid.uuid4().hex
+        _history[webenv] = pmids
+        result.update(webenv=webenv, querykey="1")
+    return {"header": {"type": "esearch", "version": "0.3"}, "esearchresult": result}
+
+
+@app.api_route("/efetch.fcgi", methods=["GET", "POST"])
+async def efetch(request: Request):
+    error = _injected_error()
+    if error:
+        return error
+    params = await _params(request)
+    if params.get("WebEnv"):
+        pmids = _history.get(params["WebEnv"])
+        if pmids is None:
+            return Response(status_code=400, content="<ERROR>Unable to obtain query #1</ERROR>")
+        retstart = int(params.get("retstart", 0))
+        pmids = pmids[retstart:retstart + int(params.get("retmax", 20))]
+    else:
+        pmids = [int(pmid) for pmid in params.get("id", "").split(",") if pmid]
+    return Response(content=article_set_xml(pmids), media_type="text/xml")
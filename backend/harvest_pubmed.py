@@ -0,0 +1,245 @@
+import sys
+sys.path.insert(0, '/app')
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import httpx
+from scrape_pubmed import PubmedArticleStream, save_studies_to_db, DEFAULT_QUERIES
+
+# Point this at a fake server (see fakes/eutils.py) to run offline
+EUTILS_BASE_URL = os.getenv("EUTILS_BASE_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+NCBI_API_KEY = os.getenv("NCBI_API_KEY")
+NCBI_EMAIL = os.getenv("NCBI_EMAIL")
+
+# NCBI allows 3 requests/second without an API key and 10 with one
+RATE_WITHOUT_KEY = 3
+RATE_WITH_KEY = 10
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PubMedHarvester:
+    """
+    Concurrent, rate-limited PubMed client.
+
+    Uses the ESearch history server (WebEnv/query_key) so large result
+    sets are paged through EFetch without shipping PMID lists back and
+    forth, keeps several EFetch batches in flight at once, and retries
+    429/5xx and network errors with jittered exponential backoff. All
+    requests share one token bucket sized to NCBI's published limits.
+    """
+
+    def __init__(
+        self,
+        base_url: str = EUTILS_BASE_URL,
+        api_key: str = NCBI_API_KEY,
+        concurrency: int = 3,
+        batch_size: int = 500,
+        max_retries: int = 5,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(RATE_WITH_KEY if api_key else RATE_WITHOUT_KEY)
+        self.requests_made = 0
+        self.retries = 0
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(max_connections=concurrency + 1),
+            transport=transport,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._client.aclose()
+
+    def _common_params(self) -> dict:
+        params = {'db': 'pubmed', 'tool': 'hypertrophy-research-explorer'}
+        if self.api_key:
+            params['api_key'] = self.api_key
+        if NCBI_EMAIL:
+            params['email'] = NCBI_EMAIL
+        return params
+
+    async def _request(self, endpoint: str, params: dict, consume=None):
+        """
+        POST to an E-utility, rate limited and retried.
+
+        Returns the fully read response, or, given `consume`, awaits
+        `consume(response)` on the still-streaming body and returns its
+        result. A failure part way through the body retries the whole
+        request, so `consume` must start from scratch on every call.
+        """
+        data = {**self._common_params(), **params}
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            self.requests_made += 1
+            try:
+                async with self._client.stream('POST', endpoint, data=data) as response:
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        if response.is_error or consume is None:
+                            await response.aread()
+                        response.raise_for_status()
+                        return await consume(response) if consume else response
+                    error = httpx.HTTPStatusError(
+                        f"{response.status_code} from {endpoint}", request=response.request, response=response
+                    )
+            except httpx.TransportError as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            self.retries += 1
+            await asyncio.sleep(random.uniform(0, min(30.0, 1.0 * 2 ** attempt)))
+
+    async def esearch(self, query: str, **filters) -> dict:
+        """
+        Run a search on the history server. Returns the ESearch result with
+        `count`, `webenv` and `querykey`. Extra keyword arguments (e.g.
+        mindate/maxdate/datetype) are passed through as filters.
+        """
+        response = await self._request('esearch.fcgi', {
+            'term': query,
+            'usehistory': 'y',
+            'retmax': 0,
+            'retmode': 'json',
+            **filters,
+        })
+        return response.json()['esearchresult']
+
+    async def efetch_page(self, webenv: str, query_key: str, retstart: int, retmax: int):
+        """Fetch one page of a history-server result set, parsing it as it downloads"""
+        async def parse(response: httpx.Response):
+            stream = PubmedArticleStream()
+            studies = []
+            async for chunk in response.aiter_bytes():
+                studies.extend(stream.feed(chunk))
+            studies.extend(stream.close())
+            return studies
+
+        return await self._request('efetch.fcgi', {
+            'WebEnv': webenv,
+            'query_key': query_key,
+            'retstart': retstart,
+            'retmax': retmax,
+            'retmode': 'xml',
+        }, consume=parse)
+
+    async def harvest(self, query: str, max_results: int = None, on_batch=None, **filters):
+        """
+        Fetch every study matching `query` (up to `max_results`).
+
+        `on_batch(studies)` is awaited for each parsed page as it arrives,
+        so callers can persist results without holding the whole set in
+        memory; without it, all studies are returned as a list.
+        """
+        result = await self.esearch(query, **filters)
+        total = int(result.get('count', 0))
+        if max_results is not None:
+            total = min(total, max_results)
+        print(f"Found {result.get('count', 0)} studies matching: {query}")
+        if total == 0:
+            return []
+
+        webenv, query_key = result['webenv'], result['querykey']
+        semaphore = asyncio.Semaphore(self.concurrency)
+        collected = []
+
+        async def fetch(retstart):
+            async with semaphore:
+                retmax = min(self.batch_size, total - retstart)
+                studies = await self.efetch_page(webenv, query_key, retstart, retmax)
+                print(f"Fetched records {retstart + 1} to {retstart + retmax}")
+            if on_batch:
+                await on_batch(studies)
+            else:
+                collected.extend(studies)
+
+        await asyncio.gather(*(fetch(start) for start in range(0, total, self.batch_size)))
+        return collected
+
+
+async def harvest_to_db(queries, max_results=None, concurrency=3, batch_size=500, **filters):
+    """Harvest all queries as one combined search and save each batch as it arrives"""
+    totals = {'added': 0, 'skipped': 0}
+
+    async def save(studies):
+        added, skipped = await asyncio.to_thread(save_studies_to_db, studies)
+        totals['added'] += added
+        totals['skipped'] += skipped
+
+    # One OR-ed search means one WebEnv and no cross-query duplicates
+    combined = ' OR '.join(f'({query})' for query in queries)
+    async with PubMedHarvester(concurrency=concurrency, batch_size=batch_size) as harvester:
+        await harvester.harvest(combined, max_results=max_results, on_batch=save, **filters)
+        totals['requests'] = harvester.requests_made
+        totals['retries'] = harvester.retries
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent PubMed harvester")
+    parser.add_argument('queries', nargs='*', help="Search queries (default: the scraper's hypertrophy queries)")
+    parser.add_argument('--max-results', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, default=3, help="EFetch batches in flight")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--mindate', help="YYYY/MM/DD, filters on --datetype")
+    parser.add_argument('--maxdate', help="YYYY/MM/DD, filters on --datetype")
+    parser.add_argument('--datetype', default='edat')
+    args = parser.parse_args()
+
+    filters = {}
+    if args.mindate or args.maxdate:
+        filters = {
+            'datetype': args.datetype,
+            'mindate': args.mindate or '1800/01/01',
+            'maxdate': args.maxdate or '3000/12/31',
+        }
+
+    started = time.monotonic()
+    totals = asyncio.run(harvest_to_db(
+        args.queries or DEFAULT_QUERIES,
+        max_results=args.max_results,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        **filters,
+    ))
+
+    print("\n" + "=" * 60)
+    print(f"Added: {totals['added']} new studies")
+    print(f"Skipped: {totals['skipped']} duplicates")
+    print(f"Requests: {totals['requests']} ({totals['retries']} retries)")
+    print(f"Elapsed: {time.monotonic() - started:.1f}s")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
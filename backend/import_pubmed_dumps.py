@@ -0,0 +1,199 @@
+import sys
+sys.path.insert(0, '/app')
+
+import argparse
+import gzip
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from glob import glob
+from app.database import SessionLocal
+from app.services.ingest import bulk_upsert_studies, delete_studies_by_pmid
+from app.services.search import parse_search_query
+from app.services.sync_state import get_watermarks, set_watermarks
+from scrape_pubmed import PubmedArticleStream
+
+# Completed files are recorded in sync_state under this prefix, so an
+# interrupted import picks up at the first unfinished file
+SYNC_KEY_PREFIX = 'pubmed-dump:'
+
+READ_SIZE = 1 << 20
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def find_dump_files(paths):
+    """Expand directories into their pubmed*.xml(.gz) files, in PubMed's file order"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob(os.path.join(path, 'pubmed*.xml.gz')))
+            files.extend(glob(os.path.join(path, 'pubmed*.xml')))
+        else:
+            files.append(path)
+    # Baseline and update files share one numbering, and updates must be
+    # applied in order
+    return sorted(set(files), key=os.path.basename)
+
+
+def make_filter(mesh_terms=None, query=None):
+    """
+    Build a predicate over parsed study dicts.
+
+    A study passes if it has any of `mesh_terms` as a MeSH descriptor
+    (case-insensitive) and matches every term of `query`, using the API's
+    search syntax ("quoted phrases", prefix*) over title, abstract and
+    keywords.
+    """
+    wanted_mesh = {term.lower() for term in mesh_terms or []}
+    terms = parse_search_query(query) if query else []
+
+    def term_matches(term, words):
+        size = len(term.words)
+        for i in range(len(words) - size + 1):
+            window = words[i:i + size]
+            if term.prefix:
+                if window[:-1] == list(term.words[:-1]) and window[-1].startswith(term.words[-1]):
+                    return True
+            elif window == list(term.words):
+                return True
+        return False
+
+    def matches(study):
+        if wanted_mesh and not wanted_mesh.intersection(
+            term.lower() for term in study.get('mesh_terms') or []
+        ):
+            return False
+        if terms:
+            text = ' '.join(filter(None, (study['title'], study['abstract'], study['keywords'])))
+            words = _WORD_RE.findall(text.lower())
+            return all(term_matches(term, words) for term in terms)
+        return True
+
+    return matches
+
+
+def parse_dump(path, mesh_terms=None, query=None):
+    """
+    Parse one dump file (runs in a worker process).
+
+    Returns the studies passing the filters, the PMIDs of DeleteCitation
+    records and the number of articles parsed.
+    """
+    matches = make_filter(mesh_terms, query)
+    stream = PubmedArticleStream()
+    studies = []
+    parsed = 0
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as source:
+        while True:
+            chunk = source.read(READ_SIZE)
+            batch = stream.feed(chunk) if chunk else stream.close()
+            parsed += len(batch)
+            studies.extend(study for study in batch if matches(study))
+            if not chunk:
+                break
+    return {'studies': studies, 'deleted': stream.deleted, 'parsed': parsed}
+
+
+def apply_dump(path, result, batch_size):
+    """Write one parsed file to the database and mark it done"""
+    db = SessionLocal()
+    try:
+        totals = bulk_upsert_studies(db, result['studies'], chunk_size=batch_size, on_conflict='update')
+        totals['deleted'] = delete_studies_by_pmid(db, result['deleted'])
+        set_watermarks(db, [SYNC_KEY_PREFIX + os.path.basename(path)], datetime.utcnow())
+    finally:
+        db.close()
+    return totals
+
+
+def import_dumps(paths, workers=None, mesh_terms=None, query=None, batch_size=5000, force=False):
+    """
+    Import PubMed baseline/update files.
+
+    Files are parsed in parallel by a process pool but written to the
+    database strictly in file order, so a later file's revisions and
+    deletions always win. At most `workers + 2` parsed files are held at
+    once, which bounds memory when writing falls behind parsing.
+    """
+    files = find_dump_files(paths)
+    if not force:
+        db = SessionLocal()
+        try:
+            done = get_watermarks(db, [SYNC_KEY_PREFIX + os.path.basename(path) for path in files])
+        finally:
+            db.close()
+        skipped = {path for path in files if SYNC_KEY_PREFIX + os.path.basename(path) in done}
+        if skipped:
+            print(f"Skipping {len(skipped)} files imported by an earlier run")
+        files = [path for path in files if path not in skipped]
+
+    workers = workers or os.cpu_count() or 1
+    totals = {'files': 0, 'parsed': 0, 'added': 0, 'updated': 0, 'skipped': 0, 'deleted': 0}
+    remaining = iter(files)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def submit_next():
+            path = next(remaining, None)
+            if path is not None:
+                pending.append((path, pool.submit(parse_dump, path, mesh_terms, query)))
+
+        for _ in range(workers + 2):
+            submit_next()
+
+        while pending:
+            path, future = pending.popleft()
+            result = future.result()
+            submit_next()
+
+            counts = apply_dump(path, result, batch_size)
+            totals['files'] += 1
+            totals['parsed'] += result['parsed']
+            for key in ('added', 'updated', 'skipped', 'deleted'):
+                totals[key] += counts[key]
+            print(
+                f"{os.path.basename(path)}: {result['parsed']} parsed, {len(result['studies'])} matched, "
+                f"{counts['added']} added, {counts['updated']} updated, {counts['deleted']} deleted"
+            )
+
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import PubMed baseline/update XML dumps")
+    parser.add_argument('paths', nargs='+', help="pubmed*.xml.gz files or directories containing them")
+    parser.add_argument('--workers', type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument('--mesh', action='append', default=[],
+                        help="Only import articles with this MeSH descriptor (repeatable; any matches)")
+    parser.add_argument('--query', help='Only import articles matching this search, e.g. \'"muscle hypertrophy" resist*\'')
+    parser.add_argument('--batch-size', type=int, default=5000, help="Studies per database commit")
+    parser.add_argument('--force', action='store_true', help="Re-import files already marked as done")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    totals = import_dumps(
+        args.paths,
+        workers=args.workers,
+        mesh_terms=args.mesh,
+        query=args.query,
+        batch_size=args.batch_size,
+        force=args.force,
+    )
+    elapsed = time.monotonic() - started
+
+    print("\n" + "=" * 60)
+    print(f"Files: {totals['files']}")
+    print(f"Parsed: {totals['parsed']} articles ({totals['parsed'] / max(elapsed, 1e-9):.0f}/s)")
+    print(f"Added: {totals['added']}, updated: {totals['updated']}, "
+          f"skipped: {totals['skipped']}, deleted: {totals['deleted']}")
+    print(f"Elapsed: {elapsed:.1f}s")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
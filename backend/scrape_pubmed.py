@@ -1,185 +1,362 @@
 import sys
 sys.path.insert(0, '/app')
 
+import argparse
 import requests
 import time
+from datetime import datetime, timedelta
 from xml.etree import ElementTree as ET
 from app.database import SessionLocal
 from app.models import Study
+from app.services.ingest import bulk_upsert_studies
+from app.services.summary_jobs import SUMMARY_PRIORITY_INGESTED, enqueue_missing_summaries
+from app.services.sync_state import get_watermarks, set_watermarks
 
 # PubMed E-utilities base URLs
 ESEARCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
 EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
 
-def search_pubmed(query, max_results=100):
-    """Search PubMed and return list of PMIDs"""
+# Search queries for hypertrophy research
+DEFAULT_QUERIES = [
+    'muscle hypertrophy resistance training',
+    'muscle growth strength training',
+    'skeletal muscle hypertrophy mechanisms',
+    'resistance training volume hypertrophy',
+    'resistance training frequency hypertrophy',
+    'muscle protein synthesis resistance exercise',
+]
+
+# Sync-state keys are namespaced so other sources can share the table
+SYNC_KEY_PREFIX = 'pubmed:'
+
+# Entrez dates are day-granular, so incremental searches overlap the
+# previous run by a day; already-stored PMIDs are dropped before efetch
+WATERMARK_OVERLAP = timedelta(days=1)
+
+# ESearch can't list ids past the first 10,000 matches of a search, so
+# bigger incremental searches are split into date ranges
+ESEARCH_MAX_RESULTS = 10000
+ESEARCH_PAGE_SIZE = 5000
+
+def _esearch(query, retstart, retmax, mindate, datetype, sort, maxdate=None):
     params = {
         'db': 'pubmed',
         'term': query,
-        'retmax': max_results,
+        'retstart': retstart,
+        'retmax': retmax,
         'retmode': 'json',
-        'sort': 'relevance'
+        'sort': sort
     }
+    if mindate:
+        params.update({
+            'datetype': datetype,
+            'mindate': mindate.strftime('%Y/%m/%d'),
+            'maxdate': maxdate.strftime('%Y/%m/%d') if maxdate else '3000/12/31',
+        })
     
     response = requests.get(ESEARCH_URL, params=params)
     response.raise_for_status()
-    data = response.json()
-    
-    pmids = data.get('esearchresult', {}).get('idlist', [])
+    return response.json().get('esearchresult', {})
+
+def search_pubmed(query, max_results=100, mindate=None, datetype='edat'):
+    """
+    Search PubMed and return list of PMIDs
+
+    With `mindate`, only records whose `datetype` date (by default the
+    Entrez date, i.e. when the record was added) is on or after it match.
+    """
+    pmids = _esearch(query, 0, max_results, mindate, datetype, 'relevance').get('idlist', [])
     print(f"Found {len(pmids)} studies matching: {query}")
     return pmids
 
-def fetch_study_details(pmids):
+def search_pubmed_since(query, mindate, datetype='edat', maxdate=None, page_size=None):
+    """
+    Every PMID whose `datetype` date is between `mindate` and `maxdate`
+    (open-ended by default), paging with retstart up to ESearch's `count`.
+
+    A date range with more matches than ESearch can list is split in two
+    until each half fits. Returns (pmids, complete); `complete` is False
+    only if a single day still has too many, in which case the caller must
+    not move the query's watermark past it.
+    """
+    page_size = min(page_size or ESEARCH_PAGE_SIZE, ESEARCH_MAX_RESULTS)
+    result = _esearch(query, 0, page_size, mindate, datetype, 'pub_date', maxdate)
+    count = int(result.get('count', 0))
+    if count > ESEARCH_MAX_RESULTS:
+        days = ((maxdate or datetime.utcnow()) - mindate).days
+        if days >= 1:
+            middle = mindate + timedelta(days=(days + 1) // 2)
+            time.sleep(0.5)  # Rate limiting
+            older, older_complete = search_pubmed_since(
+                query, mindate, datetype, middle - timedelta(days=1), page_size
+            )
+            newer, newer_complete = search_pubmed_since(query, middle, datetype, maxdate, page_size)
+            return older + newer, older_complete and newer_complete
+
+    pmids = list(result.get('idlist', []))
+    while result.get('idlist') and len(pmids) < min(count, ESEARCH_MAX_RESULTS):
+        time.sleep(0.5)  # Rate limiting
+        # Records added meanwhile push later pages down, which repeats
+        # ids at a page boundary but never skips any
+        retmax = min(page_size, ESEARCH_MAX_RESULTS - len(pmids))
+        result = _esearch(query, len(pmids), retmax, mindate, datetype, 'pub_date', maxdate)
+        pmids.extend(result.get('idlist', []))
+    time.sleep(0.5)  # Rate limiting
+    until = f" to {maxdate:%Y-%m-%d}" if maxdate else ""
+    print(f"Found {len(pmids)} of {count} studies added {mindate:%Y-%m-%d}{until} matching: {query}")
+    return pmids, len(pmids) >= count
+
+def filter_known_pmids(pmids, batch_size=1000):
+    """Drop PMIDs that are already stored, so they aren't fetched again"""
+    pmids = list(pmids)
+    known = set()
+    db = SessionLocal()
+    try:
+        for i in range(0, len(pmids), batch_size):
+            batch = pmids[i:i + batch_size]
+            known.update(pmid for (pmid,) in db.query(Study.pmid).filter(Study.pmid.in_(batch)))
+    finally:
+        db.close()
+    return [pmid for pmid in pmids if pmid not in known]
+
+def fetch_study_details(pmids, batch_size=500):
     """Fetch detailed information for a list of PMIDs"""
     if not pmids:
         return []
     
-    # PubMed API recommends batches of 200 or fewer
-    batch_size = 200
     all_studies = []
     
     for i in range(0, len(pmids), batch_size):
         batch = pmids[i:i + batch_size]
         pmid_str = ','.join(batch)
         
-        params = {
+        data = {
             'db': 'pubmed',
             'id': pmid_str,
             'retmode': 'xml'
         }
         
         print(f"Fetching details for PMIDs {i+1} to {min(i+batch_size, len(pmids))}...")
-        response = requests.get(EFETCH_URL, params=params)
+        # POST so large id lists fit; stream so the XML is parsed as it downloads
+        response = requests.post(EFETCH_URL, data=data, stream=True)
         response.raise_for_status()
-        
-        # Parse XML response
-        root = ET.fromstring(response.content)
-        studies = parse_pubmed_xml(root)
-        all_studies.extend(studies)
+        response.raw.decode_content = True
+        all_studies.extend(iter_pubmed_articles(response.raw))
         
         # Be nice to PubMed API - rate limit
         time.sleep(0.5)
     
     return all_studies
 
+class PubmedArticleStream:
+    """
+    Incremental PubmedArticleSet parser.
+    
+    feed() raw XML bytes as they arrive and get back a study dict for every
+    PubmedArticle completed so far. Each top-level element is parsed,
+    cleared and detached from the root as soon as it ends, so memory stays
+    flat no matter how large the response is.
+    
+    PMIDs listed in DeleteCitation elements (PubMed update files) are
+    collected in `deleted`.
+    """
+    
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._root = None
+        self._depth = 0
+        self.deleted = []
+    
+    def feed(self, data):
+        self._parser.feed(data)
+        return self._drain()
+    
+    def close(self):
+        self._parser.close()
+        return self._drain()
+    
+    def _drain(self):
+        studies = []
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                if self._root is None:
+                    self._root = elem
+                self._depth += 1
+                continue
+            self._depth -= 1
+            if self._depth != 1:
+                continue
+            # A direct child of the root (e.g. of PubmedArticleSet) has ended
+            if elem.tag == 'PubmedArticle':
+                study = parse_pubmed_article(elem)
+                if study:
+                    studies.append(study)
+            elif elem.tag == 'DeleteCitation':
+                self.deleted.extend(pmid.text for pmid in elem.iterfind('PMID'))
+            elem.clear()
+            self._root.remove(elem)
+        return studies
+
+def iter_pubmed_articles(source, chunk_size=64 * 1024):
+    """Yield one study dict per PubmedArticle read from a binary file-like object"""
+    stream = PubmedArticleStream()
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        yield from stream.feed(chunk)
+    yield from stream.close()
+
 def parse_pubmed_xml(root):
     """Parse PubMed XML response and extract study information"""
     studies = []
+    for article in root.iterfind('PubmedArticle'):
+        study = parse_pubmed_article(article)
+        if study:
+            studies.append(study)
+    return studies
+
+def _element_text(elem):
+    return ''.join(elem.itertext()) if elem is not None else None
+
+def parse_pubmed_article(article):
+    """
+    Extract study fields from one PubmedArticle element.
     
-    for article in root.findall('.//PubmedArticle'):
-        try:
-            # Extract title
-            title_elem = article.find('.//ArticleTitle')
-            title = ''.join(title_elem.itertext()) if title_elem is not None else "No title"
-            
-            # Extract authors
-            author_list = article.findall('.//Author')
-            authors = []
-            for author in author_list[:10]:  # Limit to first 10 authors
-                last_name = author.find('LastName')
-                initials = author.find('Initials')
-                if last_name is not None:
-                    author_str = last_name.text
-                    if initials is not None:
-                        author_str += f" {initials.text}"
-                    authors.append(author_str)
-            authors_str = ', '.join(authors) if authors else None
-            
-            # Extract abstract
-            abstract_elem = article.find('.//AbstractText')
-            abstract = ''.join(abstract_elem.itertext()) if abstract_elem is not None else None
-            
-            # Extract publication year
-            pub_date = article.find('.//PubDate/Year')
-            pub_year = int(pub_date.text) if pub_date is not None else None
-            
-            # Extract journal
-            journal_elem = article.find('.//Journal/Title')
-            journal = journal_elem.text if journal_elem is not None else None
-            
-            # Extract DOI
-            doi = None
-            for article_id in article.findall('.//ArticleId'):
-                if article_id.get('IdType') == 'doi':
-                    doi = article_id.text
+    Uses direct child paths only, so e.g. authors of cited references under
+    PubmedData/ReferenceList are never mistaken for the article's authors.
+    Returns None if the article can't be parsed.
+    """
+    try:
+        citation = article.find('MedlineCitation')
+        article_elem = citation.find('Article')
+        
+        # Extract title
+        title = _element_text(article_elem.find('ArticleTitle')) or "No title"
+        
+        # Extract authors
+        authors = []
+        for author in article_elem.iterfind('AuthorList/Author'):
+            last_name = author.findtext('LastName')
+            if last_name:
+                initials = author.findtext('Initials')
+                authors.append(f"{last_name} {initials}" if initials else last_name)
+                if len(authors) == 10:  # Limit to first 10 authors
                     break
-            
-            # Extract PMID for URL
-            pmid_elem = article.find('.//PMID')
-            pmid = pmid_elem.text if pmid_elem is not None else None
-            pdf_url = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/" if pmid else None
-            
-            # Extract keywords/mesh terms
-            mesh_terms = article.findall('.//MeshHeading/DescriptorName')
-            keywords = ', '.join([term.text for term in mesh_terms[:10]]) if mesh_terms else None
-            
-            study_data = {
-                'title': title,
-                'authors': authors_str,
-                'abstract': abstract,
-                'publication_year': pub_year,
-                'journal': journal,
-                'doi': doi,
-                'pdf_url': pdf_url,
-                'keywords': keywords
-            }
-            
-            studies.append(study_data)
-            
-        except Exception as e:
-            print(f"Error parsing article: {e}")
-            continue
-    
-    return studies
+        authors_str = ', '.join(authors) if authors else None
+        
+        # Extract abstract, keeping every section of structured abstracts
+        sections = []
+        for section in article_elem.iterfind('Abstract/AbstractText'):
+            text = _element_text(section)
+            if text:
+                label = section.get('Label')
+                sections.append(f"{label}: {text}" if label else text)
+        abstract = ' '.join(sections) if sections else None
+        
+        # Extract publication year (MedlineDate looks like "2019 Jan-Feb")
+        journal_elem = article_elem.find('Journal')
+        pub_year = None
+        if journal_elem is not None:
+            year_text = (
+                journal_elem.findtext('JournalIssue/PubDate/Year')
+                or (journal_elem.findtext('JournalIssue/PubDate/MedlineDate') or '')[:4]
+            )
+            pub_year = int(year_text) if year_text.isdigit() else None
+        
+        # Extract journal
+        journal = journal_elem.findtext('Title') if journal_elem is not None else None
+        
+        # Extract DOI
+        doi = None
+        for article_id in article.iterfind('PubmedData/ArticleIdList/ArticleId'):
+            if article_id.get('IdType') == 'doi':
+                doi = article_id.text
+                break
+        if doi is None:
+            for location in article_elem.iterfind('ELocationID'):
+                if location.get('EIdType') == 'doi':
+                    doi = location.text
+                    break
+        
+        # Extract PMID for URL
+        pmid = citation.findtext('PMID')
+        pdf_url = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/" if pmid else None
+        
+        # Extract keywords/mesh terms
+        mesh_terms = [
+            term.text for term in citation.iterfind('MeshHeadingList/MeshHeading/DescriptorName')
+        ]
+        keywords = ', '.join(mesh_terms[:10]) if mesh_terms else None
+        
+        return {
+            'title': title,
+            'authors': authors_str,
+            'abstract': abstract,
+            'publication_year': pub_year,
+            'journal': journal,
+            'doi': doi,
+            'pmid': pmid,
+            'pdf_url': pdf_url,
+            'keywords': keywords,
+            # Every MeSH descriptor, stored as the study's MeSH term links
+            'mesh_terms': mesh_terms
+        }
+        
+    except Exception as e:
+        print(f"Error parsing article: {e}")
+        return None
 
 def save_studies_to_db(studies):
-    """Save studies to database, skipping duplicates"""
+    """Save studies to database in bulk, skipping duplicates (by DOI, then title)"""
     db = SessionLocal()
-    added = 0
-    skipped = 0
-    
-    for study_data in studies:
-        try:
-            # Check if study already exists (by DOI or title)
-            existing = None
-            if study_data['doi']:
-                existing = db.query(Study).filter(Study.doi == study_data['doi']).first()
-            
-            if not existing and study_data['title']:
-                existing = db.query(Study).filter(Study.title == study_data['title']).first()
-            
-            if existing:
-                skipped += 1
-                continue
-            
-            # Create new study
-            study = Study(**study_data)
-            db.add(study)
-            db.commit()
-            added += 1
-            
-        except Exception as e:
-            print(f"Error saving study: {e}")
-            db.rollback()
-            continue
-    
-    db.close()
-    return added, skipped
+    try:
+        result = bulk_upsert_studies(db, studies)
+    finally:
+        db.close()
+    return result['added'], result['skipped']
+
+def queue_summaries(since):
+    """Queue summary pre-generation for the studies added since `since`"""
+    db = SessionLocal()
+    try:
+        return enqueue_missing_summaries(db, priority=SUMMARY_PRIORITY_INGESTED, since=since)
+    finally:
+        db.close()
+
+def load_watermarks(queries):
+    db = SessionLocal()
+    try:
+        watermarks = get_watermarks(db, [SYNC_KEY_PREFIX + query for query in queries])
+    finally:
+        db.close()
+    return {query: watermarks.get(SYNC_KEY_PREFIX + query) for query in queries}
+
+def save_watermarks(queries, started_at):
+    if not queries:
+        return
+    db = SessionLocal()
+    try:
+        set_watermarks(db, [SYNC_KEY_PREFIX + query for query in queries], started_at)
+    finally:
+        db.close()
 
 def main():
     """Main function to scrape and save studies"""
+    parser = argparse.ArgumentParser(description="PubMed hypertrophy study scraper")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only search for records added since each query's last run")
+    parser.add_argument('--max-results', type=int, default=50,
+                        help="PMIDs per query (incremental runs fetch every new PMID once a query has a watermark)")
+    args = parser.parse_args()
     
-    # Define search queries for hypertrophy research
-    queries = [
-        'muscle hypertrophy resistance training',
-        'muscle growth strength training',
-        'skeletal muscle hypertrophy mechanisms',
-        'resistance training volume hypertrophy',
-        'resistance training frequency hypertrophy',
-        'muscle protein synthesis resistance exercise',
-    ]
+    queries = DEFAULT_QUERIES
+    started_at = datetime.utcnow()
+    watermarks = load_watermarks(queries) if args.incremental else {}
     
     all_pmids = set()
+    # Queries whose every new match was listed; only these advance
+    synced = []
     
     print("=" * 60)
     print("PubMed Hypertrophy Study Scraper")
@@ -187,25 +364,39 @@ def main():
     
     # Search for studies
     for query in queries:
-        pmids = search_pubmed(query, max_results=50)
+        watermark = watermarks.get(query)
+        mindate = watermark - WATERMARK_OVERLAP if watermark else None
+        if mindate:
+            pmids, complete = search_pubmed_since(query, mindate)
+            if not complete:
+                print(f"Not every new record could be listed; keeping the watermark for: {query}")
+        else:
+            pmids, complete = search_pubmed(query, max_results=args.max_results), True
+            time.sleep(0.5)  # Rate limiting
         all_pmids.update(pmids)
-        time.sleep(0.5)  # Rate limiting
+        if complete:
+            synced.append(query)
     
     print(f"\nTotal unique studies found: {len(all_pmids)}")
+    new_pmids = filter_known_pmids(all_pmids)
+    print(f"Not yet in database: {len(new_pmids)}")
     
     # Fetch detailed information
     print("\nFetching study details...")
-    studies = fetch_study_details(list(all_pmids))
+    studies = fetch_study_details(new_pmids)
     print(f"Successfully parsed {len(studies)} studies")
     
     # Save to database
     print("\nSaving to database...")
     added, skipped = save_studies_to_db(studies)
+    save_watermarks(synced, started_at)
+    queued = queue_summaries(started_at)
     
     print("\n" + "=" * 60)
     print(f"Added: {added} new studies")
     print(f"Skipped: {skipped} duplicates")
-    print(f"Total in database: {added + skipped}")
+    print(f"Already stored: {len(all_pmids) - len(new_pmids)}")
+    print(f"Queued for summaries: {queued}")
     print("=" * 60)
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+import sys
+sys.path.insert(0, '/app')
+
+import argparse
+import asyncio
+import signal
+import time
+from app.database import AsyncSessionLocal, engine
+from app.migrations import run_migrations
+from app.models import Base
+from app.services.llm_client import LLMClient, close_llm_client, set_llm_client
+from app.services.summary_jobs import (
+    claim_summary_jobs, complete_summary_job, enqueue_missing_summaries, fail_summary_job,
+    retry_failed_summary_jobs, summary_job_stats
+)
+from app.services.summary_store import StudyNotFoundError, get_or_create_summary
+
+POLL_INTERVAL = 5.0
+PROGRESS_INTERVAL = 30.0
+
+
+async def run_job(job):
+    """Generate one job's summary and record the outcome"""
+    error, retry = None, True
+    try:
+        await get_or_create_summary(job.study_id)
+    except StudyNotFoundError:
+        error, retry = "Study not found", False
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    async with AsyncSessionLocal() as db:
+        if error is None:
+            await db.run_sync(lambda session: complete_summary_job(session, job.id))
+            return True
+        await db.run_sync(lambda session: fail_summary_job(session, job, error, retry=retry))
+    print(f"Study {job.study_id}: attempt {job.attempts} failed: {error}")
+    return False
+
+
+async def work(concurrency=4, once=False):
+    """
+    Work the queue with at most `concurrency` generations in flight.
+
+    Stops claiming on SIGINT/SIGTERM and waits for the running jobs; a
+    worker killed outright leaves its jobs to be reclaimed when their
+    leases expire. With `once`, exits when nothing is left to claim.
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    running = set()
+    totals = {'done': 0, 'failed': 0}
+    last_progress = time.monotonic()
+
+    def finished(task):
+        running.discard(task)
+        if not task.cancelled() and task.exception() is None:
+            totals['done' if task.result() else 'failed'] += 1
+
+    while not stop.is_set():
+        free = concurrency - len(running)
+        jobs = []
+        if free > 0:
+            async with AsyncSessionLocal() as db:
+                jobs = await db.run_sync(lambda session: claim_summary_jobs(session, limit=free))
+        for job in jobs:
+            task = asyncio.create_task(run_job(job))
+            running.add(task)
+            task.add_done_callback(finished)
+
+        if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+            await print_progress(totals)
+            last_progress = time.monotonic()
+
+        if not jobs and not running and once:
+            break
+        if jobs and len(running) < concurrency:
+            continue
+        # Wake when a slot frees up, on shutdown, or to poll for new work
+        waiters = [asyncio.ensure_future(stop.wait()), *running]
+        await asyncio.wait(waiters, timeout=POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+        waiters[0].cancel()
+
+    if running:
+        print(f"Waiting for {len(running)} running jobs...")
+        await asyncio.gather(*running, return_exceptions=True)
+    return totals
+
+
+async def print_progress(totals):
+    async with AsyncSessionLocal() as db:
+        stats = await db.run_sync(summary_job_stats)
+    print(
+        f"Generated {totals['done']} ({totals['failed']} failed attempts) | "
+        f"queue: {stats['ready']} ready, {stats['delayed']} backing off, {stats['running']} running | "
+        f"coverage {stats['summary_coverage']:.1%}"
+    )
+
+
+async def main_async(args):
+    if args.backfill or args.retry_failed:
+        async with AsyncSessionLocal() as db:
+            if args.retry_failed:
+                print(f"Re-queued {await db.run_sync(retry_failed_summary_jobs)} failed jobs")
+            if args.backfill:
+                print(f"Queued {await db.run_sync(enqueue_missing_summaries)} studies without a summary")
+
+    if args.stats:
+        async with AsyncSessionLocal() as db:
+            for key, value in (await db.run_sync(summary_job_stats)).items():
+                print(f"{key}: {value}")
+        return
+
+    set_llm_client(LLMClient())
+    started = time.monotonic()
+    try:
+        totals = await work(concurrency=args.concurrency, once=args.once)
+    finally:
+        await close_llm_client()
+
+    print("\n" + "=" * 60)
+    print(f"Generated: {totals['done']} summaries")
+    print(f"Failed attempts: {totals['failed']}")
+    print(f"Elapsed: {time.monotonic() - started:.1f}s")
+    print("=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate study summaries from the summary_jobs queue")
+    parser.add_argument('--concurrency', type=int, default=4, help="Summaries generated at once")
+    parser.add_argument('--backfill', action='store_true', help="First queue every study without a summary")
+    parser.add_argument('--retry-failed', action='store_true', help="Re-queue jobs that ran out of attempts")
+    parser.add_argument('--once', action='store_true', help="Exit once no job is ready instead of polling")
+    parser.add_argument('--stats', action='store_true', help="Print queue stats and exit")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
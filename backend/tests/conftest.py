@@ -0,0 +1,67 @@
+"""
+Tests run against a throwaway SQLite database (TEST_DATABASE_URL to use
+another) and the in-process fakes in fakes/, so no network or API keys
+are needed:
+
+    cd backend && python -m pytest
+"""
+import os
+import tempfile
+import httpx
+import pytest
+
+# Before anything imports app.database
+_scratch = tempfile.mkdtemp(prefix="hypertrophy-tests-")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL", f"sqlite:///{_scratch}/test.db")
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["VECTOR_INDEX_PATH"] = os.path.join(_scratch, "vector_index")
+
+
+@pytest.fixture
+async def api():
+    """An HTTP client for the API app (its tables are created on import)"""
+    from app.main import app
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def db():
+    """
+    A session on the test database, with every table emptied first and
+    the in-process caches of earlier tests dropped
+    """
+    from app.database import SessionLocal, engine
+    from app.migrations import run_migrations
+    from app.models import Base
+    from app.services.pagination import study_counts
+    from app.services.response_cache import response_cache
+    from app.services.search import install_search_index
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    install_search_index(engine)
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    study_counts.invalidate()
+    response_cache.invalidate_studies()
+    response_cache.invalidate_summaries()
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+async def fake_anthropic(monkeypatch):
+    """The fake Anthropic API (fakes.anthropic) as the shared LLM client, answering at once"""
+    from app.services.llm_client import LLMClient, close_llm_client, set_llm_client
+    from fakes import anthropic as fake
+    monkeypatch.setattr(fake, "_batches", {})
+    monkeypatch.setattr(fake, "FAKE_ANTHROPIC_LATENCY", 0.0)
+    monkeypatch.setattr(fake, "FAKE_ANTHROPIC_ERROR_RATE", 0.0)
+    monkeypatch.setattr(fake, "FAKE_BATCH_RATE", 1000.0)
+    set_llm_client(LLMClient(
+        api_key="fake", base_url="http://fake-anthropic", transport=httpx.ASGITransport(app=fake.app),
+    ))
+    yield fake
+    await close_llm_client()
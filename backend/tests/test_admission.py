@@ -0,0 +1,164 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app.api import claims
+from app.models import Study
+from app.services.admission import MAX_RETRY_AFTER, AdmissionController, AdmissionRejected
+from app.services.llm_client import LLMClient, set_llm_client
+from app.services.retrieval import refresh_study_index
+from app.services.validation_cache import ValidationCache
+
+
+async def settle():
+    # Let queued acquire() calls reach their wait
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+async def test_per_client_limit_counts_running_and_queued_requests():
+    controller = AdmissionController(max_concurrent=1, max_per_client=2, max_queue=10)
+    ticket = await controller.acquire("a")
+    queued = asyncio.create_task(controller.acquire("a"))
+    await settle()
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire("a")
+    assert rejected.value.status_code == 429
+    # Other clients, and internal callers, still queue
+    other = asyncio.create_task(controller.acquire("b"))
+    internal = asyncio.create_task(controller.acquire(None))
+    await settle()
+    assert controller.stats()["waiting"] == 3
+
+    controller.release("a", ticket)
+    controller.release("a", await queued)
+    controller.release("b", await other)
+    controller.release(None, await internal)
+    assert controller.stats() | {"service_time": None} == {
+        "running": 0, "waiting": 0, "clients": 0, "admitted": 4, "rejected": {"client": 1}, "service_time": None,
+    }
+
+
+async def test_full_queue_is_rejected_and_waiters_run_in_order():
+    controller = AdmissionController(max_concurrent=1, max_per_client=10, max_queue=2)
+    ticket = await controller.acquire("a")
+    order = []
+
+    async def wait(client):
+        ticket = await controller.acquire(client)
+        order.append(client)
+        controller.release(client, ticket)
+
+    waiters = [asyncio.create_task(wait(client)) for client in ("b", "c")]
+    await settle()
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire("d")
+    assert rejected.value.status_code == 503 and rejected.value.detail == "AI service is at capacity"
+
+    controller.release("a", ticket)
+    await asyncio.gather(*waiters)
+    assert order == ["b", "c"]
+
+
+async def test_queue_timeout_frees_the_client_share():
+    controller = AdmissionController(max_concurrent=1, max_per_client=1, queue_timeout=0.01)
+    ticket = await controller.acquire("a")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire("b")
+    assert rejected.value.status_code == 503
+    assert controller.stats()["clients"] == 1 and controller.rejected["timeout"] == 1
+
+    controller.release("a", ticket)
+    controller.release("b", await controller.acquire("b"))
+
+
+async def test_retry_after_scales_with_queue_and_service_time():
+    controller = AdmissionController(max_concurrent=2, max_per_client=10, max_queue=10)
+    # Default estimate of 10 s per request, one wave for the next caller
+    assert controller.retry_after() == 5
+
+    for client in "ab":
+        await controller.acquire(client)
+    waiters = [asyncio.create_task(controller.acquire(client)) for client in "cde"]
+    await settle()
+    # Four callers ahead including the next one: two waves of 10 s
+    assert controller.retry_after() == 20
+
+    # A ticket is the admission time; this request ran for about 60 s
+    controller.release("a", time.monotonic() - 59.9)
+    await settle()
+    # One waiter admitted; service time moves a fifth of the way towards 60 s
+    assert controller.stats()["service_time"] == pytest.approx(20.0, abs=0.05)
+    assert controller.retry_after() == 30
+
+    controller.release("b", time.monotonic() - 1000)
+    await settle()
+    assert controller.retry_after() == MAX_RETRY_AFTER
+    for client, waiter in zip("cde", waiters):
+        controller.release(client, await waiter)
+
+
+@pytest.fixture
+def claim_studies(db, monkeypatch):
+    monkeypatch.setattr(claims, "CLAIM_RETRIEVAL", "bm25")
+    monkeypatch.setattr(claims, "validation_cache", ValidationCache())
+    db.add(Study(title="Creatine supplementation and strength", abstract="Strength rose with creatine."))
+    db.commit()
+    refresh_study_index(force=True)
+    db.commit()
+
+
+def validate(api, claim="Creatine supplementation increases strength"):
+    return api.post("/api/claims/validate", json={"claim": claim})
+
+
+async def test_api_answers_429_and_503_with_retry_after(api, claim_studies, monkeypatch):
+    controller = AdmissionController(max_concurrent=1, max_per_client=1, max_queue=0)
+    monkeypatch.setattr(claims, "llm_admission", controller)
+    release = asyncio.Event()
+
+    async def slow_model(request):
+        await release.wait()
+        return httpx.Response(200, json={
+            "content": [{"type": "text", "text": '{"verdict": "SUPPORTED", "confidence": "low", "summary": "",'
+                         ' "evidence": {"supporting": 1, "mixed": 0, "refuting": 0}, "key_studies": [],'
+                         ' "bottom_line": ""}'}],
+            "usage": {"input_tokens": 10, "output_tokens": 10},
+        })
+
+    set_llm_client(LLMClient(api_key="test", base_url="http://anthropic", transport=httpx.MockTransport(slow_model)))
+    running = asyncio.create_task(validate(api))
+    while controller.stats()["running"] == 0:
+        await asyncio.sleep(0.01)
+
+    # Same client over its share
+    over_share = await validate(api, "Creatine supplementation increases power")
+    assert over_share.status_code == 429
+    assert over_share.json() == {"detail": "Too many concurrent AI requests from this client"}
+    assert 1 <= int(over_share.headers["retry-after"]) <= MAX_RETRY_AFTER
+
+    # Any client once the process is at capacity with no queue
+    controller.max_per_client = 10
+    at_capacity = await validate(api, "Creatine supplementation increases power")
+    assert at_capacity.status_code == 503
+    assert int(at_capacity.headers["retry-after"]) >= 1
+
+    release.set()
+    assert (await running).status_code == 200
+    assert controller.stats()["running"] == 0
+
+
+async def test_api_passes_on_upstream_retry_after(api, claim_studies):
+    def overloaded(request):
+        return httpx.Response(529, headers={"retry-after": "7"}, json={"type": "error"})
+
+    set_llm_client(LLMClient(
+        api_key="test", base_url="http://anthropic", transport=httpx.MockTransport(overloaded), max_retries=0,
+    ))
+    response = await validate(api)
+
+    assert response.status_code == 503
+    assert response.json() == {"detail": "AI service is temporarily overloaded"}
+    assert response.headers["retry-after"] == "7"
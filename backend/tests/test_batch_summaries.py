@@ -0,0 +1,118 @@
+import random
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import func, select, update
+from app.models import Study, Summary, SummaryJob
+from app.services import batch_summaries
+from app.services.batch_summaries import run_summary_batches, submit_summary_batch
+from app.services.leases import WORKER_ID
+from app.services.summary_jobs import claim_summary_jobs, enqueue_missing_summaries
+from fakes import anthropic as fake
+
+STUDIES = 25
+
+
+@pytest.fixture
+def queued(db):
+    db.add_all([
+        Study(title=f"Effects of training volume {n} on hypertrophy", abstract="Volume increased CSA.", authors="Doe J")
+        for n in range(STUDIES)
+    ])
+    db.commit()
+    enqueue_missing_summaries(db)
+    return db
+
+
+def statuses(db) -> dict:
+    db.expire_all()
+    return dict(db.execute(select(SummaryJob.status, func.count()).group_by(SummaryJob.status)).all())
+
+
+def summary_count(db) -> int:
+    return db.execute(select(func.count()).select_from(Summary)).scalar()
+
+
+async def test_submits_polls_and_collects(queued, fake_anthropic):
+    collected = []
+    totals = await run_summary_batches(
+        batch_size=10, poll_interval=0.01, on_batch=lambda batch, counts: collected.append(counts),
+    )
+
+    assert totals == {"batches": 3, "succeeded": STUDIES, "retried": 0, "failed": 0}
+    assert sorted(counts["succeeded"] for counts in collected) == [5, 10, 10]
+    assert len(fake_anthropic._batches) == 3
+    assert summary_count(queued) == STUDIES
+    assert statuses(queued) == {"done": STUDIES}
+
+
+async def test_errored_requests_are_rescheduled(queued, fake_anthropic, monkeypatch):
+    monkeypatch.setattr(fake, "FAKE_ANTHROPIC_ERROR_RATE", 0.4)
+    monkeypatch.setattr(fake, "_rng", random.Random(3))
+
+    totals = await run_summary_batches(batch_size=10, poll_interval=0.01)
+
+    assert 0 < totals["retried"] < STUDIES
+    assert totals["succeeded"] + totals["retried"] == STUDIES and totals["failed"] == 0
+    assert summary_count(queued) == totals["succeeded"]
+    assert statuses(queued) == {"done": totals["succeeded"], "pending": totals["retried"]}
+    # Backing off, with the error recorded and the attempt counted
+    retried = queued.execute(select(SummaryJob).where(SummaryJob.status == "pending")).scalars().all()
+    assert all(job.run_after > datetime.utcnow() and job.attempts == 1 for job in retried)
+    assert all(job.last_error.split(":")[0] in ("api_error", "overloaded_error") for job in retried)
+
+
+async def test_resumes_in_flight_batch_after_restart(queued, fake_anthropic):
+    # A run that submitted a batch and died while polling it
+    batch_id = await submit_summary_batch(10)
+    in_batch = queued.execute(select(SummaryJob).where(SummaryJob.batch_id == batch_id)).scalars().all()
+    assert len(in_batch) == 10
+    assert all(job.locked_until > datetime.utcnow() + timedelta(hours=24) for job in in_batch)
+
+    totals = await run_summary_batches(batch_size=100, poll_interval=0.01)
+
+    assert totals == {"batches": 2, "succeeded": STUDIES, "retried": 0, "failed": 0}
+    # The resumed batch was collected, not submitted again
+    assert len(fake_anthropic._batches) == 2
+    assert statuses(queued) == {"done": STUDIES}
+
+
+async def test_adopts_batch_whose_id_was_never_recorded(queued, fake_anthropic, monkeypatch):
+    # A run that died after the API accepted the batch, before recording its id
+    with monkeypatch.context() as patch:
+        def die(*args, **kwargs):
+            raise RuntimeError("killed")
+
+        patch.setattr(batch_summaries, "assign_summary_batch", die)
+        with pytest.raises(RuntimeError):
+            await submit_summary_batch(10)
+    orphaned = queued.execute(select(SummaryJob).where(SummaryJob.status == "running")).scalars().all()
+    assert len(orphaned) == 10 and all(job.batch_id is None for job in orphaned)
+    # Only the short lease, so they aren't stuck if the batch never reached the API
+    assert all(job.locked_until < datetime.utcnow() + timedelta(hours=1) for job in orphaned)
+
+    totals = await run_summary_batches(batch_size=100, poll_interval=0.01)
+
+    assert totals == {"batches": 2, "succeeded": STUDIES, "retried": 0, "failed": 0}
+    assert len(fake_anthropic._batches) == 2
+    assert summary_count(queued) == STUDIES
+    assert statuses(queued) == {"done": STUDIES}
+
+
+async def test_jobs_the_summary_worker_is_running_are_not_adopted(queued, fake_anthropic, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(fake, "FAKE_ANTHROPIC_ERROR_RATE", 0.4)
+        patch.setattr(fake, "_rng", random.Random(3))
+        first = await run_summary_batches(batch_size=10, poll_interval=0.01)
+    # The summary worker takes the rescheduled jobs once their backoff passes
+    queued.execute(update(SummaryJob).where(SummaryJob.status == "pending").values(run_after=datetime.utcnow()))
+    queued.commit()
+    working = claim_summary_jobs(queued, limit=STUDIES)
+    assert len(working) == first["retried"] > 0
+
+    # Their errored results are still in the earlier batches
+    totals = await run_summary_batches(batch_size=10, poll_interval=0.01)
+
+    assert totals == {"batches": 0, "succeeded": 0, "retried": 0, "failed": 0}
+    queued.expire_all()
+    jobs = queued.execute(select(SummaryJob).where(SummaryJob.id.in_([job.id for job in working]))).scalars().all()
+    assert all(job.status == "running" and job.worker == WORKER_ID for job in jobs)
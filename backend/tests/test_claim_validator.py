@@ -0,0 +1,174 @@
+import asyncio
+import json
+import re
+import httpx
+import pytest
+from app.models import Study
+from app.services import claim_validator
+from app.services.claim_validator import (
+    MAP_SYSTEM_PROMPT, REDUCE_SYSTEM_PROMPT, parse_json_response, validate_claim_against_studies,
+    validate_claim_map_reduce,
+)
+from app.services.llm_client import LLMClient, close_llm_client, set_llm_client
+
+CLAIM = "Higher training volume increases muscle hypertrophy"
+_RANGE_RE = re.compile(r"STUDIES \(Study (\d+)-(\d+)\)")
+
+
+def make_studies(count: int) -> list:
+    return [
+        Study(
+            id=1000 + number, title=f"Volume study {number}", publication_year=2020, authors="Doe J",
+            abstract=f"{number * 2} sets per week increased muscle thickness.",
+        )
+        for number in range(1, count + 1)
+    ]
+
+
+def stance(number: int) -> str:
+    if number % 7 == 0:
+        return "irrelevant"
+    return "refuting" if number % 5 == 0 else "supporting"
+
+
+def reply(data: dict) -> httpx.Response:
+    return httpx.Response(200, json={
+        "content": [{"type": "text", "text": json.dumps(data)}],
+        "usage": {"input_tokens": 100, "output_tokens": 20},
+    })
+
+
+class FakeModel:
+    """Answers map and reduce calls like the model would, recording them"""
+
+    def __init__(self, key_studies=(1, 2, 3)):
+        self.key_studies = list(key_studies)
+        self.maps = []
+        self.reduces = []
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content)
+        system, prompt = payload["system"][-1]["text"], payload["messages"][0]["content"]
+        if system == MAP_SYSTEM_PROMPT:
+            first, last = map(int, _RANGE_RE.search(prompt).groups())
+            self.maps.append((first, last, payload["max_tokens"]))
+            return reply({"studies": [
+                {"id": number, "stance": stance(number), "finding": f"Finding {number}"}
+                for number in range(first, last + 1)
+            ]})
+        assert system == REDUCE_SYSTEM_PROMPT
+        self.reduces.append(prompt)
+        return reply({
+            "verdict": "SUPPORTED", "confidence": "high", "summary": "Most studies agree.",
+            "key_studies": self.key_studies, "bottom_line": "Add sets.",
+        })
+
+
+@pytest.fixture
+async def model():
+    fake = FakeModel()
+    set_llm_client(LLMClient(
+        api_key="test", base_url="http://anthropic", transport=httpx.MockTransport(fake), max_retries=0,
+    ))
+    yield fake
+    await close_llm_client()
+
+
+def test_parse_json_response_strips_code_fences():
+    for text in ('{"verdict": "SUPPORTED"}', '```json\n{"verdict": "SUPPORTED"}\n```', '```\n{"verdict": "SUPPORTED"}```'):
+        assert parse_json_response({"content": [{"type": "text", "text": text}]}) == {"verdict": "SUPPORTED"}
+
+
+async def test_map_reduce_chunks_studies(model):
+    studies = make_studies(35)
+    result = await validate_claim_map_reduce(CLAIM, studies, chunk_size=10)
+
+    assert sorted((first, last) for first, last, _ in model.maps) == [(1, 10), (11, 20), (21, 30), (31, 35)]
+    # Output budget scales with the chunk
+    assert sorted(max_tokens for *_, max_tokens in model.maps) == [850, 1600, 1600, 1600]
+    assert len(model.reduces) == 1
+    # Tallied from the classifications; irrelevant studies are left out of the reduce prompt
+    assert result["evidence"] == {"supporting": 24, "mixed": 0, "refuting": 6}
+    assert "Study 7 " not in model.reduces[0] and "Study 5 [refuting]" in model.reduces[0]
+    assert result["usage"]["llm_calls"] == 5
+    assert result["usage"]["input_tokens"] == 500
+
+
+async def test_map_reduce_limits_concurrency(model):
+    running = peak = 0
+    inner = model.__call__
+
+    async def slow_model(request):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return await inner(request)
+
+    set_llm_client(LLMClient(api_key="test", base_url="http://anthropic", transport=httpx.MockTransport(slow_model)))
+    await validate_claim_map_reduce(CLAIM, make_studies(60), chunk_size=10, concurrency=2)
+    assert len(model.maps) == 6 and peak == 2
+
+
+async def test_reduce_key_studies_map_to_database_ids(model):
+    # Study numbers as ints or objects; irrelevant (7) and unknown (99) ones are dropped
+    model.key_studies = [3, {"id": 12}, 7, 99]
+    studies = make_studies(20)
+    result = await validate_claim_map_reduce(CLAIM, studies, chunk_size=10)
+
+    assert result["key_studies"] == [
+        {"id": studies[2].id, "title": "Volume study 3", "finding": "Finding 3"},
+        {"id": studies[11].id, "title": "Volume study 12", "finding": "Finding 12"},
+    ]
+    assert result["verdict"] == "SUPPORTED"
+
+
+async def test_failed_chunk_cancels_its_siblings():
+    started, cancelled = set(), set()
+
+    async def handler(request):
+        first = int(_RANGE_RE.search(json.loads(request.content)["messages"][0]["content"]).group(1))
+        started.add(first)
+        if first == 1:
+            await asyncio.sleep(0.01)
+            return httpx.Response(400, json={"type": "error", "error": {"type": "invalid_request_error"}})
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.add(first)
+            raise
+        return reply({"studies": []})
+
+    set_llm_client(LLMClient(api_key="test", base_url="http://anthropic", transport=httpx.MockTransport(handler)))
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            await asyncio.wait_for(validate_claim_map_reduce(CLAIM, make_studies(30), chunk_size=10), timeout=5)
+    finally:
+        await close_llm_client()
+    assert started == {1, 11, 21}
+    assert cancelled == {11, 21}
+
+
+async def test_auto_mode_switches_above_threshold(model, monkeypatch):
+    monkeypatch.setattr(claim_validator, "CLAIM_VALIDATION_MODE", "auto")
+    monkeypatch.setattr(claim_validator, "CLAIM_MAP_REDUCE_THRESHOLD", 15)
+
+    result = await validate_claim_against_studies(CLAIM, make_studies(16))
+    assert len(model.maps) == 2 and result["usage"]["llm_calls"] == 3
+
+    single = []
+
+    async def single_model(request):
+        single.append(json.loads(request.content)["system"][-1]["text"])
+        return reply({
+            "verdict": "SUPPORTED", "confidence": "moderate", "summary": "", "bottom_line": "",
+            "evidence": {"supporting": 1, "mixed": 0, "refuting": 0},
+            "key_studies": [{"id": 2, "title": "Volume study 2", "finding": "More sets, more growth"}],
+        })
+
+    set_llm_client(LLMClient(api_key="test", base_url="http://anthropic", transport=httpx.MockTransport(single_model)))
+    studies = make_studies(15)
+    result = await validate_claim_against_studies(CLAIM, studies)
+    assert len(single) == 1 and single[0] not in (MAP_SYSTEM_PROMPT, REDUCE_SYSTEM_PROMPT)
+    assert result["key_studies"][0]["id"] == studies[1].id
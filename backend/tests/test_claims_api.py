@@ -0,0 +1,36 @@
+import pytest
+from app.api import claims
+from app.models import Study
+from app.services.retrieval import refresh_study_index
+
+CLAIM = "Creatine supplementation increases strength"
+
+
+@pytest.fixture
+def creatine_studies(db, monkeypatch):
+    monkeypatch.setattr(claims, "CLAIM_RETRIEVAL", "bm25")
+    db.add_all([
+        Study(
+            title=f"Creatine supplementation and strength in cohort {number}", publication_year=2020,
+            abstract=f"Creatine increased strength by {number}% over placebo.", authors="Doe J",
+        )
+        for number in range(30)
+    ])
+    db.commit()
+    refresh_study_index(force=True)
+
+
+async def test_validation_makes_one_model_call_by_default(api, creatine_studies, fake_anthropic):
+    response = await api.post("/api/claims/validate", json={"claim": CLAIM})
+
+    assert response.status_code == 200
+    assert response.json()["usage"]["llm_calls"] == 1
+
+
+async def test_raising_the_evidence_limit_opts_into_map_reduce(api, creatine_studies, fake_anthropic, monkeypatch):
+    monkeypatch.setattr(claims, "CLAIM_EVIDENCE_LIMIT", 30)
+    response = await api.post("/api/claims/validate", json={"claim": CLAIM})
+
+    assert response.status_code == 200
+    # Three chunks of 10, then the reduce call
+    assert response.json()["usage"]["llm_calls"] == 4
@@ -0,0 +1,127 @@
+import random
+import time
+import httpx
+import pytest
+import harvest_pubmed
+from fakes import eutils
+from harvest_pubmed import PubMedHarvester, TokenBucket
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    The fake E-utilities app, recording (time, path, form) per request.
+    `failures` maps a path to the statuses its first requests get.
+    """
+
+    def __init__(self, failures=None):
+        self.inner = httpx.ASGITransport(app=eutils.app)
+        self.failures = {path: list(statuses) for path, statuses in (failures or {}).items()}
+        self.requests = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append((time.monotonic(), request.url.path, dict(httpx.QueryParams(request.content.decode()))))
+        if self.failures.get(request.url.path):
+            return httpx.Response(self.failures[request.url.path].pop(0), json={"error": "injected"})
+        return await self.inner.handle_async_request(request)
+
+    def forms(self, path: str) -> list:
+        return [form for _, requested, form in self.requests if requested == path]
+
+
+@pytest.fixture(autouse=True)
+def fake_eutils(monkeypatch):
+    monkeypatch.setattr(eutils, "FAKE_EUTILS_TOTAL", 230)
+    monkeypatch.setattr(eutils, "FAKE_EUTILS_ERROR_RATE", 0.0)
+    # No backoff sleeps
+    monkeypatch.setattr(harvest_pubmed.random, "uniform", lambda low, high: 0)
+
+
+def harvester(transport, **kwargs) -> PubMedHarvester:
+    client = PubMedHarvester(base_url="http://eutils", transport=transport, **kwargs)
+    client.limiter = TokenBucket(rate=1000, capacity=1000)
+    return client
+
+
+async def test_harvest_pages_through_history_server():
+    transport = RecordingTransport()
+    async with harvester(transport, batch_size=50, concurrency=3) as client:
+        studies = await client.harvest("resistance training")
+
+    assert sorted(int(study["pmid"]) for study in studies) == eutils.matching_pmids("resistance training")
+    searches, fetches = transport.forms("/esearch.fcgi"), transport.forms("/efetch.fcgi")
+    assert len(searches) == 1 and searches[0]["usehistory"] == "y"
+    # Pages of the same WebEnv, never an id list
+    assert sorted(int(params["retstart"]) for params in fetches) == [0, 50, 100, 150, 200]
+    assert [int(params["retmax"]) for params in fetches if params["retstart"] == "200"] == [30]
+    assert len({params["WebEnv"] for params in fetches}) == 1
+    assert all("id" not in params for params in fetches)
+    assert client.requests_made == 6 and client.retries == 0
+
+
+async def test_harvest_respects_max_results_and_on_batch():
+    batches = []
+
+    async def on_batch(studies):
+        batches.append(len(studies))
+
+    async with harvester(RecordingTransport(), batch_size=40) as client:
+        assert await client.harvest("protein", max_results=100, on_batch=on_batch) == []
+    assert sorted(batches) == [20, 40, 40]
+
+
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=1)
+    started = time.monotonic()
+    for _ in range(11):
+        await bucket.acquire()
+    # The first token is free, the next ten take 1/20 s each
+    assert time.monotonic() - started >= 0.45
+
+
+async def test_token_bucket_allows_bursts_up_to_capacity():
+    bucket = TokenBucket(rate=1, capacity=5)
+    started = time.monotonic()
+    for _ in range(5):
+        await bucket.acquire()
+    assert time.monotonic() - started < 0.1
+
+
+async def test_harvester_requests_are_spaced_by_ncbi_limit():
+    transport = RecordingTransport()
+    client = PubMedHarvester(base_url="http://eutils", transport=transport, api_key="key", batch_size=100)
+    async with client:
+        await client.harvest("sleep")
+    times = [at for at, _, _ in transport.requests]
+    assert len(times) == 4
+    # 10 requests/second with an API key; allow for timer slack
+    assert all(later - earlier >= 0.09 for earlier, later in zip(times, times[1:]))
+    assert all(params["api_key"] == "key" for _, _, params in transport.requests)
+
+
+async def test_retries_429_and_5xx():
+    transport = RecordingTransport(failures={"/esearch.fcgi": [429], "/efetch.fcgi": [503]})
+    async with harvester(transport, batch_size=500) as client:
+        studies = await client.harvest("creatine")
+
+    assert len(studies) == 230
+    assert [path for _, path, _ in transport.requests] == [
+        "/esearch.fcgi", "/esearch.fcgi", "/efetch.fcgi", "/efetch.fcgi",
+    ]
+    assert client.retries == 2
+
+
+async def test_retries_injected_server_errors(monkeypatch):
+    monkeypatch.setattr(eutils, "FAKE_EUTILS_ERROR_RATE", 0.4)
+    monkeypatch.setattr(eutils, "_rng", random.Random(7))
+    async with harvester(RecordingTransport(), batch_size=25, max_retries=10) as client:
+        studies = await client.harvest("eccentric")
+    assert len({study["pmid"] for study in studies}) == 230
+    assert client.retries > 0
+
+
+async def test_gives_up_after_max_retries():
+    transport = RecordingTransport(failures={"/esearch.fcgi": [500, 502, 503]})
+    async with harvester(transport, max_retries=2) as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.harvest("hypertrophy")
+    assert len(transport.requests) == 3
@@ -0,0 +1,131 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import event, func, select, text
+from app.database import engine
+from app.models import Author, Bookmark, Study, StudyAuthor, StudyMeshTerm, Summary, SummaryJob
+from app.services.ingest import bulk_upsert_studies, delete_studies_by_pmid
+
+
+def study(title, **fields):
+    return {"title": title, **fields}
+
+
+def count(db, model) -> int:
+    return db.execute(select(func.count()).select_from(model)).scalar()
+
+
+def test_counts_and_dedup_within_a_chunk(db):
+    totals = bulk_upsert_studies(db, [
+        study("Creatine and strength", pmid="1", doi="10.1/a"),
+        study("Creatine and strength, a repeat", pmid="1"),
+        study("Same DOI, other title", doi="10.1/a"),
+        study("Protein timing"),
+        study("Protein timing", authors="Doe J"),
+        # Errata and letters can share a title with their own PMID
+        study("Creatine and strength", pmid="2"),
+        study("", pmid="3"),
+        study(None, pmid="4"),
+    ])
+
+    assert totals == {"added": 3, "updated": 0, "skipped": 5}
+    assert sorted(db.execute(select(Study.title, Study.pmid)).all()) == [
+        ("Creatine and strength", "1"), ("Creatine and strength", "2"), ("Protein timing", None),
+    ]
+
+
+def test_existing_studies_are_matched_by_pmid_doi_then_title(db):
+    bulk_upsert_studies(db, [
+        study("Creatine and strength", pmid="1"),
+        study("Protein timing", doi="10.1/b"),
+        study("Sleep and recovery"),
+    ])
+
+    # Across chunks too: the second chunk sees what the first wrote
+    totals = bulk_upsert_studies(db, [
+        study("Creatine and strength (revised)", pmid="1"),
+        study("Protein timing, corrected", doi="10.1/b"),
+        study("Sleep and recovery"),
+        study("Sleep and recovery", pmid="9"),
+        study("Caffeine and endurance"),
+        study("Caffeine and endurance"),
+    ], chunk_size=2)
+
+    assert totals == {"added": 1, "updated": 0, "skipped": 5}
+    assert count(db, Study) == 4
+
+
+def test_update_fills_in_and_refreshes_without_repointing_identifiers(db):
+    bulk_upsert_studies(db, [study(
+        "Creatine and strength", pmid="1", doi="10.1/a", abstract="Old abstract.", journal="J Strength",
+        authors="Doe J", mesh_terms=["Creatine"],
+    ), study("Protein timing", journal="Nutrients")])
+    before = db.execute(select(Study.id, Study.updated_at).where(Study.pmid == "1")).one()
+    db.commit()
+
+    totals = bulk_upsert_studies(db, [
+        # Matched by PMID: new values win, missing ones keep the stored value
+        study("Creatine and strength (revised)", pmid="1", doi="10.1/other", abstract=None, journal="JSCR",
+              authors="Doe J, Roe R", mesh_terms=["Creatine", "Muscle Strength"]),
+        # Matched by title: its empty identifiers are filled in
+        study("Protein timing", pmid="2", doi="10.1/b"),
+        study("Caffeine and endurance"),
+    ], on_conflict="update")
+
+    assert totals == {"added": 1, "updated": 2, "skipped": 0}
+    creatine = db.execute(select(Study).where(Study.id == before.id)).scalar_one()
+    assert (creatine.title, creatine.doi, creatine.abstract, creatine.journal) == (
+        "Creatine and strength (revised)", "10.1/a", "Old abstract.", "JSCR",
+    )
+    assert creatine.updated_at > before.updated_at
+    protein = db.execute(select(Study).where(Study.title == "Protein timing")).scalar_one()
+    assert (protein.pmid, protein.doi, protein.journal) == ("2", "10.1/b", "Nutrients")
+    # Links follow the refreshed fields
+    assert count(db, StudyAuthor) == 2 and count(db, StudyMeshTerm) == 2
+
+
+@pytest.fixture
+def linked_studies(db):
+    bulk_upsert_studies(db, [
+        study(f"Creatine study {pmid}", pmid=str(pmid), authors="Doe J, Roe R", mesh_terms=["Creatine"])
+        for pmid in range(1, 6)
+    ])
+    ids = dict(db.execute(select(Study.pmid, Study.id)).all())
+    for pmid in ("1", "2"):
+        db.add_all([
+            Bookmark(study_id=ids[pmid]),
+            Summary(study_id=ids[pmid], summary_text="Strength rose.", model_used="claude-test"),
+            SummaryJob(study_id=ids[pmid]),
+        ])
+    db.commit()
+    return ids
+
+
+def test_delete_removes_studies_and_everything_cascading_from_them(db, linked_studies):
+    assert delete_studies_by_pmid(db, ["1", "2", "3", "404"]) == 3
+
+    assert sorted(db.execute(select(Study.pmid)).scalars()) == ["4", "5"]
+    for model in (Bookmark, Summary, SummaryJob):
+        assert count(db, model) == 0
+    assert count(db, StudyAuthor) == 4 and count(db, StudyMeshTerm) == 2
+    # Shared author rows stay
+    assert count(db, Author) == 2
+    matches = db.execute(text("SELECT rowid FROM studies_fts WHERE studies_fts MATCH 'creatine'")).scalars()
+    assert sorted(matches) == sorted([linked_studies["4"], linked_studies["5"]])
+
+
+def test_delete_issues_one_statement_per_table_per_chunk(db, linked_studies):
+    deletes = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("DELETE"):
+            deletes.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        assert delete_studies_by_pmid(db, ["1", "2", "3", "4"], chunk_size=2) == 4
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    # studies plus its five cascaded tables, for each of the two chunks
+    assert len(deletes) == 12
+    assert sum(statement.startswith("DELETE FROM studies ") for statement in deletes) == 2
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import select
+from app.database import AsyncSessionLocal
+from app.models import Lease
+from app.services.leases import WORKER_ID, acquire_lease, release_lease
+
+
+@pytest.fixture
+async def session(db):
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+async def owner(session, key: str):
+    return (await session.execute(select(Lease.owner).filter(Lease.key == key))).scalar()
+
+
+async def test_lease_is_exclusive_until_released(session):
+    token = await acquire_lease(session, "summary:1", 60)
+    assert token.startswith(WORKER_ID)
+    assert await acquire_lease(session, "summary:1", 60) is None
+    # Other keys are independent
+    assert await acquire_lease(session, "summary:2", 60)
+
+    await release_lease(session, "summary:1", token)
+    assert await acquire_lease(session, "summary:1", 60) not in (None, token)
+
+
+async def test_expired_lease_is_taken_over(session):
+    stale = await acquire_lease(session, "summary:1", -1)
+
+    token = await acquire_lease(session, "summary:1", 60)
+    assert token and token != stale
+    assert await owner(session, "summary:1") == token
+
+
+async def test_release_by_a_former_holder_is_a_no_op(session):
+    stale = await acquire_lease(session, "summary:1", -1)
+    token = await acquire_lease(session, "summary:1", 60)
+
+    # The holder whose lease expired finishes late and releases
+    await release_lease(session, "summary:1", stale)
+    await release_lease(session, "summary:1", "someone-else")
+
+    assert await owner(session, "summary:1") == token
+    assert await acquire_lease(session, "summary:1", 60) is None
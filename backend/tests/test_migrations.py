@@ -0,0 +1,26 @@
+import pytest
+from sqlalchemy import text
+from app.database import engine
+from app.migrations import run_migrations
+
+INDEXES = ["ix_studies_browse_order", "ix_studies_updated_at", "ix_studies_journal_lower"]
+
+
+def study_indexes() -> set:
+    with engine.connect() as conn:
+        return set(conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'studies'"
+        )).scalars())
+
+
+@pytest.mark.skipif(engine.dialect.name != "sqlite", reason="reads sqlite_master")
+def test_migrations_add_indexes_missing_from_an_existing_table(db):
+    with engine.begin() as conn:
+        for name in INDEXES:
+            conn.execute(text(f"DROP INDEX {name}"))
+    assert not study_indexes() & set(INDEXES)
+
+    run_migrations(engine)
+    assert set(INDEXES) <= study_indexes()
+    # And again, as every worker does on start
+    run_migrations(engine)
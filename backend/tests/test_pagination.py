@@ -0,0 +1,137 @@
+import pytest
+from sqlalchemy import select
+from app.models import Study
+from app.services.pagination import CountCache, decode_cursor, encode_cursor, page_ranked
+
+YEARS = [2021, 2020, None, 2020, 2019]
+
+
+@pytest.fixture
+def studies(db):
+    # Repeated years (and missing ones) so the id tiebreak matters, and
+    # titles repeating "creatine" a varying number of times so ranks differ
+    db.add_all([
+        Study(
+            title=f"{'Creatine ' * (1 + number % 4)}and hypertrophy, cohort {number}",
+            abstract="Creatine loading before training." if number % 3 else "Protein timing.",
+            publication_year=YEARS[number % len(YEARS)],
+        )
+        for number in range(60)
+    ])
+    db.commit()
+    rows = db.execute(select(Study.id, Study.publication_year)).all()
+    db.commit()
+    return rows
+
+
+async def walk(api, query: str, limit: int) -> list:
+    """Every page of a listing, following next_cursor"""
+    pages = []
+    cursor = None
+    while True:
+        url = f"/api/studies/?limit={limit}&fields=id&{query}" + (f"&cursor={cursor}" if cursor else "")
+        response = await api.get(url)
+        assert response.status_code == 200
+        data = response.json()
+        pages.append(data)
+        assert data["page"] == len(pages)
+        cursor = data["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def ids(pages: list) -> list:
+    return [study["id"] for page in pages for study in page["studies"]]
+
+
+def test_cursor_round_trips_float_ranks():
+    for key in (2020, 0, -7.123456789012345, 1e-12, 3.0):
+        cursor = encode_cursor(key, 42, 3)
+        assert decode_cursor(cursor) == (key, 42, 3)
+        assert "=" not in cursor
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "bm90IGpzb24", "eyJrIjoxfQ", "eyJrIjoxLCJpZCI6Im5vIn0"])
+def test_decode_cursor_rejects_malformed_cursors(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_page_ranked_walks_ties_in_id_order():
+    ranked = sorted(
+        [(study_id, float(study_id % 3)) for study_id in range(1, 26)],
+        key=lambda item: (-item[1], -item[0]),
+    )
+    seen, cursor = [], None
+    while True:
+        items, page, cursor = page_ranked(ranked, 0, 4, cursor)
+        seen.extend(items)
+        if cursor is None:
+            break
+    assert seen == ranked
+
+
+@pytest.mark.parametrize("query", ["", "year_from=2020", "year_from=2020&year_to=2020"])
+async def test_browse_walks_every_page_in_order(api, studies, query):
+    pages = await walk(api, query, limit=7)
+
+    low, high = (2020, 2100) if "year_from" in query else (None, None)
+    if "year_to" in query:
+        high = 2020
+    expected = sorted(
+        (row for row in studies if low is None or (row.publication_year and low <= row.publication_year <= high)),
+        key=lambda row: (row.publication_year or 0, row.id), reverse=True,
+    )
+    assert ids(pages) == [row.id for row in expected]
+    assert all(page["total"] == len(expected) for page in pages)
+
+
+@pytest.mark.parametrize("query", ["search=creatine", "search=creatine&year_from=2020", "search=creatin*"])
+async def test_ranked_search_walks_every_page_in_rank_order(api, studies, query):
+    pages = await walk(api, query, limit=7)
+    single = await walk(api, query, limit=100)
+
+    assert len(single) == 1
+    assert ids(pages) == ids(single)
+    assert len(set(ids(pages))) == len(ids(pages)) == pages[0]["total"] > 7
+
+
+async def test_skip_and_cursor_agree(api, studies):
+    first = (await api.get("/api/studies/?limit=10&fields=id")).json()
+    second = (await api.get(f"/api/studies/?limit=10&fields=id&cursor={first['next_cursor']}")).json()
+    by_skip = (await api.get("/api/studies/?limit=10&skip=10&fields=id")).json()
+
+    assert second["studies"] == by_skip["studies"]
+    assert second["page"] == by_skip["page"] == 2
+
+
+async def test_invalid_cursor_is_a_400(api, studies):
+    for query in ("", "search=creatine", "search=creatine&mode=hybrid"):
+        response = await api.get(f"/api/studies/?cursor=not-a-cursor&{query}")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+
+
+async def test_count_cache_keeps_totals_until_invalidated(db, studies):
+    from app.database import AsyncSessionLocal
+    counts = CountCache(exact_threshold=10)
+    stmt = select(Study.id)
+    async with AsyncSessionLocal() as session:
+        # Above the exact threshold, so counted in full the slow way
+        assert await counts.count(session, "all", stmt) == (60, False)
+        db.add(Study(title="Another creatine study"))
+        db.commit()
+        assert await counts.count(session, "all", stmt) == (60, False)
+
+        counts.invalidate()
+        assert await counts.count(session, "all", stmt) == (61, False)
+
+
+async def test_writes_through_the_api_refresh_totals(api, studies):
+    assert (await api.get("/api/studies/?limit=1")).json()["total"] == 60
+
+    created = await api.post("/api/studies/", json={"title": "Creatine and sleep"})
+    assert (await api.get("/api/studies/?limit=1")).json()["total"] == 61
+
+    await api.delete(f"/api/studies/{created.json()['id']}")
+    assert (await api.get("/api/studies/?limit=1")).json()["total"] == 60
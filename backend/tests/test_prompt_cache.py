@@ -0,0 +1,70 @@
+import json
+import httpx
+import pytest
+from app.models import Study
+from app.services.ai_service import generate_summary
+from app.services.appraisal import APPRAISAL_GUIDE
+from app.services.claim_validator import validate_claim_against_studies
+from app.services.llm_client import PROMPT_CACHE_MIN_TOKENS, LLMClient, close_llm_client, set_llm_client
+from fakes import anthropic as fake
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """The fake Anthropic API, recording each request body and response usage"""
+
+    def __init__(self):
+        self.inner = httpx.ASGITransport(app=fake.app)
+        self.calls = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self.inner.handle_async_request(request)
+        body = json.loads(await response.aread())
+        self.calls.append((json.loads(request.content), body.get("usage")))
+        return httpx.Response(response.status_code, headers=response.headers, json=body)
+
+
+@pytest.fixture
+async def transport(monkeypatch):
+    monkeypatch.setattr(fake, "FAKE_ANTHROPIC_LATENCY", 0.0)
+    monkeypatch.setattr(fake, "FAKE_ANTHROPIC_ERROR_RATE", 0.0)
+    monkeypatch.setattr(fake, "_prompt_cache", {})
+    recording = RecordingTransport()
+    set_llm_client(LLMClient(api_key="fake", base_url="http://fake-anthropic", transport=recording))
+    yield recording
+    await close_llm_client()
+
+
+def assert_cacheable(payload: dict):
+    system = payload["system"]
+    assert system[0]["text"] == APPRAISAL_GUIDE
+    assert system[-1]["cache_control"] == {"type": "ephemeral"}
+    assert all("cache_control" not in block for block in system[:-1])
+    # Estimated at four characters a token, which undercounts English text
+    assert sum(len(block["text"]) for block in system) // 4 >= PROMPT_CACHE_MIN_TOKENS
+    # Nothing request-specific before the breakpoint
+    assert "Study Details" not in system[-1]["text"] and "CLAIM" not in system[-1]["text"]
+
+
+async def test_summary_prefix_is_cached_across_studies(transport):
+    await generate_summary("Protein timing and hypertrophy", "Timing did not matter.", "Doe J")
+    await generate_summary("Creatine and strength", "Creatine increased strength.", "Roe R")
+
+    (first, first_usage), (second, second_usage) = transport.calls
+    assert_cacheable(first)
+    assert first["system"] == second["system"]
+    assert first_usage["cache_creation_input_tokens"] >= PROMPT_CACHE_MIN_TOKENS
+    assert second_usage["cache_read_input_tokens"] == first_usage["cache_creation_input_tokens"]
+    assert second_usage["cache_creation_input_tokens"] == 0
+
+
+@pytest.mark.parametrize("mode, calls", [("single", 1), ("map_reduce", 3)])
+async def test_claim_prefixes_are_cacheable(transport, mode, calls):
+    studies = [
+        Study(id=number, title=f"Volume study {number}", abstract="More sets increased muscle thickness.")
+        for number in range(1, 13)
+    ]
+    await validate_claim_against_studies("Higher training volume builds more muscle", studies, mode=mode)
+
+    assert len(transport.calls) == calls
+    for payload, _ in transport.calls:
+        assert_cacheable(payload)
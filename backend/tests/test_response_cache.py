@@ -0,0 +1,121 @@
+import asyncio
+from datetime import datetime
+import pytest
+from starlette.requests import Request
+from app.api import studies as studies_api
+from app.models import Study
+from app.services.response_cache import CachedResponse, ResponseCache, make_etag, not_modified, response_cache
+
+ETAG = make_etag("/api/studies/1?", 1, datetime(2024, 5, 1, 12, 0, 30, 500000))
+ENTRY = CachedResponse(b"{}", ETAG, datetime(2024, 5, 1, 12, 0, 30, 500000), 0, 200, {})
+
+
+def request(**headers) -> Request:
+    return Request({
+        "type": "http", "method": "GET", "path": "/", "query_string": b"",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({}, False),
+    ({"if_none_match": ETAG}, True),
+    ({"if_none_match": f"W/{ETAG}"}, True),
+    ({"if_none_match": f'"other", {ETAG}'}, True),
+    ({"if_none_match": "*"}, True),
+    ({"if_none_match": '"other"'}, False),
+    ({"if_modified_since": "Wed, 01 May 2024 12:00:30 GMT"}, True),
+    ({"if_modified_since": "Wed, 01 May 2024 12:00:29 GMT"}, False),
+    ({"if_modified_since": "yesterday"}, False),
+    # If-None-Match takes precedence
+    ({"if_none_match": '"other"', "if_modified_since": "Wed, 01 May 2024 12:00:30 GMT"}, False),
+])
+def test_not_modified(headers, expected):
+    assert not_modified(request(**headers), ENTRY) is expected
+
+
+def test_etags_depend_on_every_part():
+    assert make_etag("/a?", 1, None) == make_etag("/a?", 1, None)
+    assert make_etag("/a?", 1, None) != make_etag("/a?", 2, None)
+    assert make_etag("/a?", 1, None) != make_etag("/b?", 1, None)
+
+
+def test_a_response_read_before_a_write_is_not_cached_after_it():
+    cache = ResponseCache()
+    key = cache.key("studies", request())
+    # The write lands while the handler is still reading
+    cache.invalidate_studies()
+    cache.set(key, b"{}", ETAG, None, 0)
+
+    assert cache.get(cache.key("studies", request())) is None
+    assert cache.get(cache.key("summaries", request())) is None
+
+
+@pytest.fixture
+def study_id(db):
+    study = Study(title="Creatine and strength", abstract="Strength rose.", publication_year=2020)
+    db.add(study)
+    db.commit()
+    study_id = study.id
+    db.commit()
+    return study_id
+
+
+async def test_unchanged_study_revalidates_with_304(api, study_id):
+    first = await api.get(f"/api/studies/{study_id}")
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+    assert first.headers["cache-control"] == "no-cache"
+
+    by_etag = await api.get(f"/api/studies/{study_id}", headers={"If-None-Match": etag})
+    by_date = await api.get(f"/api/studies/{study_id}", headers={"If-Modified-Since": last_modified})
+    assert by_etag.status_code == by_date.status_code == 304
+    assert by_etag.content == b"" and by_etag.headers["etag"] == etag
+
+    stats = (await api.get("/api/stats/response-cache")).json()
+    assert stats["hits"] >= 2 and stats["not_modified"] >= 2
+
+
+async def test_writes_through_the_api_change_the_etag(api, study_id):
+    study = await api.get(f"/api/studies/{study_id}")
+    listing = await api.get("/api/studies/")
+
+    await api.patch(f"/api/studies/{study_id}", json={"title": "Creatine and power"})
+
+    changed = await api.get(f"/api/studies/{study_id}", headers={"If-None-Match": study.headers["etag"]})
+    assert changed.status_code == 200 and changed.json()["title"] == "Creatine and power"
+    assert changed.headers["etag"] != study.headers["etag"]
+    relisted = await api.get("/api/studies/", headers={"If-None-Match": listing.headers["etag"]})
+    assert relisted.status_code == 200 and relisted.json()["studies"][0]["title"] == "Creatine and power"
+
+
+async def test_writes_elsewhere_show_up_after_the_ttl(api, study_id, db, monkeypatch):
+    cache = ResponseCache(ttl=0.2)
+    monkeypatch.setattr(studies_api, "response_cache", cache)
+    first = await api.get(f"/api/studies/{study_id}")
+
+    # Written by another worker: this process's cache doesn't know
+    db.query(Study).filter(Study.id == study_id).update({"title": "Creatine and power"})
+    db.commit()
+    stale = await api.get(f"/api/studies/{study_id}", headers={"If-None-Match": first.headers["etag"]})
+    assert stale.status_code == 304
+
+    await asyncio.sleep(0.25)
+    fresh = await api.get(f"/api/studies/{study_id}", headers={"If-None-Match": first.headers["etag"]})
+    assert fresh.status_code == 200 and fresh.json()["title"] == "Creatine and power"
+
+
+async def test_missing_summary_is_cached_until_one_is_stored(api, study_id):
+    from app.database import AsyncSessionLocal
+    from app.services.summary_store import store_summary
+
+    assert (await api.get(f"/api/summaries/{study_id}")).status_code == 404
+    async with AsyncSessionLocal() as session:
+        await store_summary(session, study_id, "Strength rose.", "claude-test")
+
+    summary = await api.get(f"/api/summaries/{study_id}")
+    assert summary.status_code == 200 and summary.json()["summary_text"] == "Strength rose."
+    assert summary.headers["cache-control"] == "public, max-age=3600"
+    revalidated = await api.get(
+        f"/api/summaries/{study_id}", headers={"If-Modified-Since": summary.headers["last-modified"]}
+    )
+    assert revalidated.status_code == 304
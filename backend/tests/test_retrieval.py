@@ -0,0 +1,95 @@
+import threading
+from datetime import timedelta
+from app.models import Study
+from app.services import retrieval
+from app.services.retrieval import BM25Index
+
+
+def test_refresh_picks_up_new_and_updated_studies(db):
+    db.add_all([
+        Study(title="Creatine and strength", keywords="Creatine"),
+        Study(title="Sleep restriction and recovery"),
+    ])
+    db.commit()
+    index = BM25Index()
+    index.refresh(db, force=True)
+    assert len(index) == 2
+
+    sleep = db.query(Study).filter(Study.title.like("Sleep%")).one()
+    sleep.title = "Protein timing"
+    db.add(Study(title="Protein dose and hypertrophy"))
+    db.commit()
+    index.refresh(db, force=True)
+
+    assert len(index) == 3
+    assert not index.search("sleep")
+    assert {study_id for study_id, _ in index.search("protein")} >= {sleep.id}
+
+
+def test_search_is_not_blocked_while_refresh_tokenizes(db, monkeypatch):
+    db.add_all([Study(title="Creatine and strength"), Study(title="Protein and hypertrophy")])
+    db.commit()
+    index = BM25Index()
+    index.add(999, "Creatine loading", None, None)
+
+    tokenizing, release = threading.Event(), threading.Event()
+    weigh = retrieval._weighted_tokens
+
+    def slow_weigh(*args):
+        tokenizing.set()
+        release.wait(5)
+        return weigh(*args)
+
+    monkeypatch.setattr(retrieval, "_weighted_tokens", slow_weigh)
+    refresh = threading.Thread(target=index.refresh, args=(db, True))
+    refresh.start()
+    try:
+        assert tokenizing.wait(5)
+        # Served from the current index while the refresh is stuck
+        assert [study_id for study_id, _ in index.search("creatine")] == [999]
+    finally:
+        release.set()
+        refresh.join(5)
+    assert len(index) == 3
+
+
+def test_refresh_catches_rows_committed_behind_the_watermark(db):
+    db.add(Study(title="Creatine and strength"))
+    db.commit()
+    index = BM25Index(refresh_interval=0, reconcile_interval=3600)
+    index.refresh(db)
+    watermark = index._watermark
+
+    # Stamped before an earlier-stamped row's transaction committed
+    db.add_all([
+        Study(title="Protein timing", updated_at=watermark - timedelta(seconds=5)),
+        Study(title="Sleep and recovery", updated_at=watermark - timedelta(hours=1)),
+    ])
+    db.commit()
+    index.refresh(db)
+    assert index.search("protein") and not index.search("sleep")
+    slots = len(index._slot_ids)
+    index.refresh(db)
+    # Rows already indexed at their timestamp aren't re-added
+    assert len(index._slot_ids) == slots
+
+    # Far older than the slack: left to reconciliation
+    index.refresh(db, force=True)
+    assert index.search("sleep") and len(index) == 3
+
+
+def test_reconcile_drops_studies_deleted_elsewhere(db):
+    db.add_all([Study(title="Creatine and strength"), Study(title="Creatine and sprinting")])
+    db.commit()
+    index = BM25Index(refresh_interval=0, reconcile_interval=0)
+    index.refresh(db)
+    assert len(index.search("creatine")) == 2
+
+    # Deleted by another process, so remove() was never called here
+    db.query(Study).filter(Study.title.like("%sprinting")).delete(synchronize_session=False)
+    db.commit()
+    index.refresh(db)
+
+    assert len(index) == 1
+    assert [title for title, in db.query(Study.title)] == ["Creatine and strength"]
+    assert [study_id for study_id, _ in index.search("creatine")] == [db.query(Study.id).scalar()]
@@ -0,0 +1,123 @@
+import io
+import sys
+from datetime import date, datetime
+from xml.etree import ElementTree as ET
+import pytest
+from fastapi.testclient import TestClient
+import scrape_pubmed
+from app.models import Study
+from app.services.sync_state import get_watermarks, set_watermarks
+from fakes import eutils
+from fakes.eutils import FIRST_PMID, article_set_xml, article_xml
+from scrape_pubmed import PubmedArticleStream, parse_pubmed_xml
+
+
+def test_stream_matches_whole_document_parse_and_detaches_articles():
+    pmids = list(range(FIRST_PMID, FIRST_PMID + 50))
+    xml = article_set_xml(pmids).encode()
+    stream = PubmedArticleStream()
+    studies = []
+    for offset in range(0, len(xml), 997):
+        studies.extend(stream.feed(xml[offset:offset + 997]))
+        # Finished articles don't pile up under PubmedArticleSet
+        assert stream._root is None or len(stream._root) <= 1
+    studies.extend(stream.close())
+
+    assert studies == parse_pubmed_xml(ET.fromstring(xml))
+    assert [study["pmid"] for study in studies] == [str(pmid) for pmid in pmids]
+    assert len(stream._root) == 0
+
+
+def test_stream_collects_deleted_citations():
+    xml = (
+        b"<PubmedArticleSet>" + article_xml(FIRST_PMID).encode()
+        + b"<DeleteCitation><PMID Version=\"1\">123</PMID><PMID Version=\"1\">456</PMID></DeleteCitation>"
+        b"</PubmedArticleSet>"
+    )
+    stream = PubmedArticleStream()
+    studies = stream.feed(xml) + stream.close()
+
+    assert [study["pmid"] for study in studies] == [str(FIRST_PMID)]
+    assert stream.deleted == ["123", "456"]
+    assert len(stream._root) == 0
+
+
+class RawBody(io.BytesIO):
+    decode_content = False
+
+
+def _path(url):
+    # The app serves /esearch.fcgi, not /entrez/eutils/esearch.fcgi
+    return "/" + url.rsplit("/", 1)[1]
+
+
+class FakeRequests:
+    """`requests.get`/`post` answered by the fake E-utilities app"""
+
+    def __init__(self):
+        self.client = TestClient(eutils.app)
+        self.searches = []
+
+    def get(self, url, params=None):
+        self.searches.append(params)
+        return self.client.get(_path(url), params=params)
+
+    def post(self, url, data=None, stream=False):
+        response = self.client.post(_path(url), data=data)
+        response.raw = RawBody(response.content)
+        return response
+
+
+@pytest.fixture
+def fake_pubmed(monkeypatch):
+    fake = FakeRequests()
+    monkeypatch.setattr(scrape_pubmed, "requests", fake)
+    monkeypatch.setattr(scrape_pubmed.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(eutils, "FAKE_EUTILS_TOTAL", 230)
+    monkeypatch.setattr(eutils, "FAKE_EUTILS_ERROR_RATE", 0.0)
+    monkeypatch.setattr(scrape_pubmed, "DEFAULT_QUERIES", ["creatine", "protein timing"])
+    monkeypatch.setattr(sys, "argv", ["scrape_pubmed.py", "--incremental"])
+    return fake
+
+
+def test_incremental_run_fetches_every_new_record(db, fake_pubmed, monkeypatch):
+    monkeypatch.setattr(scrape_pubmed, "ESEARCH_PAGE_SIZE", 40)
+    watermark = datetime(2012, 1, 2)
+    set_watermarks(db, ["pubmed:creatine", "pubmed:protein timing"], watermark)
+    expected = set()
+    for query in ("creatine", "protein timing"):
+        matches = eutils.matching_pmids(query, "2012/01/01")
+        assert len(matches) > 50
+        expected.update(str(pmid) for pmid in matches)
+
+    scrape_pubmed.main()
+
+    assert {pmid for (pmid,) in db.query(Study.pmid)} == expected
+    # Paged past the default --max-results of 50
+    assert {params["retstart"] for params in fake_pubmed.searches} >= {0, 40, 80}
+    assert all(value > watermark for value in get_watermarks(db, ["pubmed:creatine"]).values())
+
+
+def test_incremental_run_splits_searches_too_big_to_list(db, fake_pubmed, monkeypatch):
+    monkeypatch.setattr(scrape_pubmed, "ESEARCH_MAX_RESULTS", 30)
+    set_watermarks(db, ["pubmed:creatine", "pubmed:protein timing"], datetime(2012, 1, 2))
+
+    scrape_pubmed.main()
+
+    stored = {pmid for (pmid,) in db.query(Study.pmid)}
+    for query in ("creatine", "protein timing"):
+        assert {str(pmid) for pmid in eutils.matching_pmids(query, "2012/01/01")} <= stored
+    assert all(int(params["retmax"]) <= 30 for params in fake_pubmed.searches)
+    assert any(params["maxdate"] != "3000/12/31" for params in fake_pubmed.searches)
+
+
+def test_watermark_stays_put_when_a_day_has_too_many_records(db, fake_pubmed, monkeypatch):
+    monkeypatch.setattr(scrape_pubmed, "ESEARCH_MAX_RESULTS", 30)
+    # Every fake record shares one (future) date, so the range can't split
+    monkeypatch.setattr(eutils, "article_date", lambda pmid: date(2100, 1, 1))
+    watermark = datetime(2100, 1, 2)
+    set_watermarks(db, ["pubmed:creatine", "pubmed:protein timing"], watermark)
+
+    scrape_pubmed.main()
+
+    assert set(get_watermarks(db, ["pubmed:creatine", "pubmed:protein timing"]).values()) == {watermark}
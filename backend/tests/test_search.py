@@ -0,0 +1,125 @@
+import pytest
+from sqlalchemy import select, text
+from app.database import engine
+from app.models import Study
+from app.services.search import (
+    SearchTerm, apply_fulltext_search, install_search_index, parse_search_query, to_fts5_query, to_pg_tsquery,
+)
+
+
+def fts_ids(db, query: str) -> set:
+    rows = db.execute(text("SELECT rowid FROM studies_fts WHERE studies_fts MATCH :query"), {"query": query})
+    return {rowid for (rowid,) in rows}
+
+
+def test_parse_search_query_phrases_and_prefixes():
+    assert parse_search_query('"Protein synthesis" hypertroph* creatine') == [
+        SearchTerm(("protein", "synthesis")), SearchTerm(("hypertroph",), True), SearchTerm(("creatine",)),
+    ]
+    assert parse_search_query('"muscle growth"*') == [SearchTerm(("muscle", "growth"), True)]
+    assert parse_search_query("beta-alanine") == [SearchTerm(("beta", "alanine"))]
+
+
+@pytest.mark.parametrize("search", ["", "   ", '( ) " *', '"', "()", '""', "-- ;"])
+def test_parse_search_query_drops_operator_only_input(search):
+    assert parse_search_query(search) == []
+
+
+def test_operator_words_are_quoted_as_plain_terms():
+    terms = parse_search_query('AND OR NOT ( ) "')
+    assert terms == [SearchTerm(("and",)), SearchTerm(("or",)), SearchTerm(("not",))]
+    assert to_fts5_query(terms) == '"and" AND "or" AND "not"'
+    assert to_pg_tsquery(terms) == "(and) & (or) & (not)"
+
+
+def test_to_pg_tsquery():
+    terms = parse_search_query('"protein synthesis" hypertroph* creatine "whey protein"*')
+    assert to_pg_tsquery(terms) == "(protein <-> synthesis) & (hypertroph:*) & (creatine) & (whey <-> protein:*)"
+    assert to_fts5_query(terms) == '"protein synthesis" AND "hypertroph"* AND "creatine" AND "whey protein"*'
+
+
+def test_triggers_keep_the_fts_table_in_sync(db):
+    study = Study(title="Creatine loading", abstract="Muscle phosphocreatine rose.", authors="Doe J")
+    db.add(study)
+    db.commit()
+    assert fts_ids(db, "creatine") == {study.id}
+    assert fts_ids(db, "authors:doe") == {study.id}
+
+    study.title = "Beta-alanine loading"
+    db.commit()
+    assert fts_ids(db, "creatine") == set()
+    assert fts_ids(db, "alanine") == {study.id}
+
+    db.delete(study)
+    db.commit()
+    assert fts_ids(db, "alanine") == set()
+    # Would fail if a trigger had removed the wrong tokens from the index
+    db.execute(text("INSERT INTO studies_fts(studies_fts) VALUES ('integrity-check')"))
+
+
+def test_install_indexes_existing_rows_and_is_idempotent(db):
+    db.add_all([Study(title="Creatine and sprint performance"), Study(title="Caffeine and endurance")])
+    db.commit()
+    with engine.begin() as conn:
+        for trigger in ("ai", "ad", "au"):
+            conn.execute(text(f"DROP TRIGGER studies_fts_{trigger}"))
+        conn.execute(text("DROP TABLE studies_fts"))
+
+    install_search_index(engine)
+    install_search_index(engine)
+
+    assert len(fts_ids(db, "creatine OR caffeine")) == 2
+    triggers = db.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars().all()
+    assert sorted(triggers) == ["studies_fts_ad", "studies_fts_ai", "studies_fts_au"]
+
+
+@pytest.fixture
+def studies(db):
+    rows = {
+        "title": Study(title="Muscle hypertrophy after creatine", abstract="Twelve weeks of training."),
+        "abstract": Study(title="Twelve weeks of training", abstract="Creatine increased hypertrophy."),
+        "stemmed": Study(title="Hypertrophic responses to protein", abstract="Whey and casein."),
+        "other": Study(title="Caffeine and endurance", abstract="And or not, cycling time trials."),
+    }
+    db.add_all(rows.values())
+    db.commit()
+    ids = {name: study.id for name, study in rows.items()}
+    db.commit()
+    return ids
+
+
+async def search(api, query: str, mode: str = "fulltext") -> list:
+    response = await api.get("/api/studies/", params={"search": query, "mode": mode, "fields": "id"})
+    assert response.status_code == 200
+    return [study["id"] for study in response.json()["studies"]]
+
+
+async def test_fulltext_ranks_title_matches_first(api, studies):
+    assert await search(api, "creatine hypertrophy") == [studies["title"], studies["abstract"]]
+    assert await search(api, '"hypertrophy after"') == [studies["title"]]
+    assert set(await search(api, "hypertroph*")) == {studies["title"], studies["abstract"], studies["stemmed"]}
+
+
+@pytest.mark.parametrize("query", ['AND OR NOT ( ) "', "NOT", '"(', "creatine AND", "creatine NOT caffeine", "NEAR(a b)"])
+async def test_operator_input_never_reaches_fts5_as_syntax(api, studies, query):
+    # Matched as plain words rather than failing with an FTS5 syntax error
+    await search(api, query)
+
+
+async def test_operator_words_match_as_text(api, studies):
+    assert await search(api, 'AND OR NOT ( ) "') == [studies["other"]]
+    # Nothing searchable left: the unfiltered listing
+    assert len(await search(api, '( ) "')) == 4
+
+
+async def test_substring_mode_matches_inside_words(api, studies):
+    assert set(await search(api, "YPERTROPH", mode="substring")) == {
+        studies["title"], studies["abstract"], studies["stemmed"],
+    }
+    assert await search(api, "ypertroph", mode="fulltext") == []
+
+
+def test_fulltext_falls_back_to_ilike_without_a_backend(db, studies):
+    stmt, rank = apply_fulltext_search(select(Study.id), "CREATINE", "mysql")
+    assert rank is None
+    assert set(db.execute(stmt).scalars()) == {studies["title"], studies["abstract"]}
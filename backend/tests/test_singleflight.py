@@ -0,0 +1,72 @@
+import asyncio
+import pytest
+from app.services.singleflight import SingleFlight
+
+
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    release = asyncio.Event()
+
+    async def work():
+        calls.append(1)
+        await release.wait()
+        return object()
+
+    callers = [asyncio.create_task(flight.do("key", work)) for _ in range(5)]
+    other = asyncio.create_task(flight.do("other", work))
+    await asyncio.sleep(0)
+    assert flight.in_flight() == 2
+    release.set()
+
+    results = await asyncio.gather(*callers)
+    assert all(result is results[0] for result in results)
+    assert await other is not results[0]
+    assert len(calls) == 2 and flight.in_flight() == 0
+
+
+async def test_later_calls_start_a_new_execution():
+    flight = SingleFlight()
+    counter = iter(range(10))
+
+    async def work():
+        return next(counter)
+
+    assert [await flight.do("key", work), await flight.do("key", work)] == [0, 1]
+
+
+async def test_exceptions_reach_every_waiter():
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def fail():
+        started.set()
+        await asyncio.sleep(0.01)
+        raise LookupError("gone")
+
+    first = asyncio.create_task(flight.do("key", fail))
+    await started.wait()
+    waiters = [asyncio.create_task(flight.do("key", fail)) for _ in range(3)]
+
+    results = await asyncio.gather(first, *waiters, return_exceptions=True)
+    assert all(isinstance(result, LookupError) and result is results[0] for result in results)
+    assert flight.in_flight() == 0
+
+
+async def test_a_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "done"
+
+    leaver = asyncio.create_task(flight.do("key", work))
+    stayer = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    leaver.cancel()
+    release.set()
+
+    assert await stayer == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await leaver
@@ -0,0 +1,97 @@
+import pytest
+from app.models import Study
+from app.schemas import PartialStudy
+from app.services.compression import negotiate_encoding
+
+
+async def test_create_study_rejects_duplicate_pmid(api):
+    created = await api.post("/api/studies/", json={"title": "Protein timing and hypertrophy", "pmid": "12000001"})
+    assert created.status_code == 201
+
+    duplicate = await api.post("/api/studies/", json={"title": "A different title", "pmid": "12000001"})
+    assert duplicate.status_code == 400
+    assert duplicate.json()["detail"] == "Study with this PMID already exists"
+
+
+async def test_create_study_rejects_duplicate_doi(api):
+    created = await api.post("/api/studies/", json={"title": "Training volume", "doi": "10.5555/test.1"})
+    assert created.status_code == 201
+
+    duplicate = await api.post("/api/studies/", json={"title": "Training volume again", "doi": "10.5555/test.1"})
+    assert duplicate.status_code == 400
+
+
+@pytest.fixture
+def long_studies(db):
+    db.add_all([
+        Study(
+            title=f"Creatine and strength, cohort {number}", authors="Doe J; Roe R", publication_year=2000 + number,
+            abstract="Creatine monohydrate increased one-repetition maximum strength over placebo. " * 10,
+        )
+        for number in range(20)
+    ])
+    db.commit()
+
+
+async def test_fields_projects_each_study(api, long_studies):
+    response = await api.get("/api/studies/", params={"fields": " publication_year , title", "limit": 5})
+
+    assert response.status_code == 200
+    studies = response.json()["studies"]
+    # id always, then the requested fields in schema order
+    assert [list(study) for study in studies] == [["title", "publication_year", "id"]] * 5
+    assert studies[0]["publication_year"] == 2019
+    full = (await api.get("/api/studies/", params={"fields": "", "limit": 1})).json()["studies"][0]
+    assert set(full) == set(PartialStudy.model_fields)
+
+
+@pytest.mark.parametrize("fields, detail", [
+    ("title,bogus", "Unknown fields: bogus"),
+    ("mesh_terms,Title", "Unknown fields: Title, mesh_terms"),
+])
+async def test_unknown_fields_are_a_400(api, long_studies, fields, detail):
+    response = await api.get("/api/studies/", params={"fields": fields})
+    assert response.status_code == 400
+    assert response.json()["detail"] == detail
+
+
+async def test_openapi_documents_projected_studies(api):
+    spec = (await api.get("/openapi.json")).json()
+    ok = spec["paths"]["/api/studies/"]["get"]["responses"]["200"]
+    assert ok["content"]["application/json"]["schema"]["$ref"].endswith("/PartialStudyListResponse")
+    partial = spec["components"]["schemas"]["PartialStudy"]
+    assert partial["required"] == ["id"]
+
+
+@pytest.mark.parametrize("accept, encoding", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip;q=0.5", "gzip"),
+    ("*", "br"),
+    ("identity", None),
+    ("gzip;q=0, br;q=0", None),
+])
+def test_negotiate_encoding(accept, encoding):
+    assert negotiate_encoding(accept) == encoding
+
+
+@pytest.mark.parametrize("accept, encoding", [("gzip", "gzip"), ("br, gzip", "br"), ("identity", None)])
+async def test_study_pages_are_compressed_as_negotiated(api, long_studies, accept, encoding):
+    plain = await api.get("/api/studies/", headers={"Accept-Encoding": "identity"})
+    response = await api.get("/api/studies/", headers={"Accept-Encoding": accept})
+
+    assert response.headers.get("content-encoding") == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.json() == plain.json()
+    if encoding:
+        assert response.headers["etag"] == f"W/{plain.headers['etag']}"
+        assert int(response.headers["content-length"]) < len(plain.content) // 3
+        # Either form of the ETag revalidates
+        for etag in (response.headers["etag"], plain.headers["etag"]):
+            again = await api.get("/api/studies/", headers={"Accept-Encoding": accept, "If-None-Match": etag})
+            assert again.status_code == 304
+
+
+async def test_small_pages_are_not_compressed(api, long_studies):
+    response = await api.get("/api/studies/", params={"fields": "id", "limit": 2}, headers={"Accept-Encoding": "br, gzip"})
+    assert "content-encoding" not in response.headers and "vary" not in response.headers
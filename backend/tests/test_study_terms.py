@@ -0,0 +1,25 @@
+from sqlalchemy import func, select
+from app.models import Study, StudyAuthor, StudyMeshTerm
+from app.services.study_terms import backfill_study_terms, link_study
+
+
+def test_backfill_links_only_unlinked_studies(db):
+    db.add_all([
+        Study(title="Old study", authors="Schoenfeld BJ, Grgic J", keywords="Hypertrophy, Muscle, Skeletal"),
+        Study(title="No terms"),
+        Study(title="Already linked", authors="Morton RW", keywords="Dietary Proteins"),
+    ])
+    db.flush()
+    linked = db.execute(select(Study).where(Study.title == "Already linked")).scalar_one()
+    link_study(db, linked.id, {"authors": "Morton RW", "keywords": "Dietary Proteins"})
+    db.commit()
+
+    batches = []
+    assert backfill_study_terms(db, batch_size=1, progress=batches.append) == 1
+    assert batches == [1]
+    assert db.execute(select(func.count()).select_from(StudyAuthor)).scalar() == 3
+    # "Muscle, Skeletal" isn't known yet, so it splits at the comma
+    assert db.execute(select(func.count()).select_from(StudyMeshTerm)).scalar() == 4
+
+    # Nothing left to do on a second run
+    assert backfill_study_terms(db) == 0
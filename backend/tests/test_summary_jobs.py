@@ -0,0 +1,142 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import select, update
+from app.database import SessionLocal
+from app.models import Study, SummaryJob
+from app.services import summary_jobs
+from app.services.leases import WORKER_ID
+from app.services.summary_jobs import (
+    BATCH_WORKER_ID, claim_summary_jobs, enqueue_missing_summaries, fail_summary_job, unassigned_summary_jobs,
+)
+
+
+@pytest.fixture
+def queued(db):
+    db.add_all([Study(title=f"Study {number}", publication_year=2000 + number) for number in range(10)])
+    db.commit()
+    enqueue_missing_summaries(db)
+    return db
+
+
+def job(db, job_id) -> SummaryJob:
+    db.expire_all()
+    return db.get(SummaryJob, job_id)
+
+
+def test_claims_highest_priority_first_and_marks_the_worker(queued):
+    claimed = claim_summary_jobs(queued, limit=3)
+
+    years = queued.execute(
+        select(Study.publication_year).join(SummaryJob, SummaryJob.study_id == Study.id)
+        .where(SummaryJob.id.in_([claim.id for claim in claimed]))
+    ).scalars()
+    assert sorted(years) == [2007, 2008, 2009]
+    assert all(claim.attempts == 1 for claim in claimed)
+    assert all(job(queued, claim.id).worker == WORKER_ID for claim in claimed)
+
+
+class RacingSession:
+    """A session whose claim UPDATE runs only after `race()` has run"""
+
+    def __init__(self, session, race):
+        self.session = session
+        self.race = race
+
+    def execute(self, statement, *args, **kwargs):
+        if statement.is_dml and self.race:
+            race, self.race = self.race, None
+            race()
+        return self.session.execute(statement, *args, **kwargs)
+
+    def commit(self):
+        self.session.commit()
+
+
+def test_racing_workers_never_claim_the_same_job(queued):
+    other = SessionLocal()
+    rival = []
+    try:
+        # Both see the same five candidates; the rival's UPDATE lands first
+        mine = claim_summary_jobs(
+            RacingSession(queued, lambda: rival.extend(claim_summary_jobs(other, limit=3))), limit=5,
+        )
+    finally:
+        other.close()
+
+    assert len(rival) == 3 and len(mine) == 2
+    assert not {claim.id for claim in mine} & {claim.id for claim in rival}
+    assert len(claim_summary_jobs(queued, limit=10)) == 5
+
+
+def make_due(db, job_id):
+    db.execute(update(SummaryJob).where(SummaryJob.id == job_id).values(run_after=datetime.utcnow()))
+    db.commit()
+
+
+def test_failures_back_off_exponentially_then_give_up(queued, monkeypatch):
+    monkeypatch.setattr(summary_jobs, "SUMMARY_JOB_MAX_ATTEMPTS", 3)
+    [first] = claim_summary_jobs(queued)
+    delays = []
+    for attempt in (1, 2):
+        assert first.attempts == attempt
+        before = datetime.utcnow()
+        fail_summary_job(queued, first, "overloaded_error: busy")
+        retry = job(queued, first.id)
+        assert retry.status == "pending" and retry.locked_until is None
+        delays.append((retry.run_after - before).total_seconds())
+        # Not claimable until the backoff has passed
+        assert first.id not in {claim.id for claim in claim_summary_jobs(queued, limit=10)}
+        make_due(queued, first.id)
+        [first] = [claim for claim in claim_summary_jobs(queued, limit=10) if claim.id == first.id]
+
+    fail_summary_job(queued, first, "overloaded_error: busy")
+
+    # 30 s then 60 s, each with +-50% jitter
+    assert 15 <= delays[0] <= 45 and 30 <= delays[1] <= 90
+    failed = job(queued, first.id)
+    assert (failed.status, failed.last_error, failed.attempts) == ("failed", "overloaded_error: busy", 3)
+    make_due(queued, first.id)
+    assert first.id not in {claim.id for claim in claim_summary_jobs(queued, limit=10)}
+
+
+def test_backoff_is_capped(queued, monkeypatch):
+    monkeypatch.setattr(summary_jobs, "SUMMARY_JOB_BACKOFF_MAX", 100)
+    [claimed] = claim_summary_jobs(queued)
+    before = datetime.utcnow()
+    # Uncapped, the fourth retry would wait 240 s
+    fail_summary_job(queued, claimed._replace(attempts=4), "timeout")
+
+    assert 50 <= (job(queued, claimed.id).run_after - before).total_seconds() <= 150
+
+
+def test_permanent_failures_are_not_retried(queued):
+    [claimed] = claim_summary_jobs(queued)
+    fail_summary_job(queued, claimed, "Study not found", retry=False)
+
+    failed = job(queued, claimed.id)
+    assert failed.status == "failed" and failed.finished_at is not None
+
+
+def test_stale_running_jobs_are_reclaimed(queued):
+    # One worker that is still working
+    [alive] = claim_summary_jobs(queued, lease=600)
+    # And one that died part way through; its lease has run out
+    [dead] = claim_summary_jobs(queued, lease=-1)
+
+    reclaimed = claim_summary_jobs(queued, limit=10, worker="other-worker")
+
+    ids = {claim.id: claim for claim in reclaimed}
+    assert dead.id in ids and alive.id not in ids
+    assert ids[dead.id].attempts == 2
+    assert job(queued, dead.id).worker == "other-worker"
+
+
+def test_only_batch_claims_count_as_unassigned(queued):
+    worker_jobs = claim_summary_jobs(queued, limit=2)
+    batch_jobs = claim_summary_jobs(queued, limit=3, worker=BATCH_WORKER_ID)
+
+    unassigned, claimed_since = unassigned_summary_jobs(queued)
+
+    assert {claim.id for claim in unassigned} == {claim.id for claim in batch_jobs}
+    assert not {claim.id for claim in unassigned} & {claim.id for claim in worker_jobs}
+    assert abs((datetime.utcnow() - claimed_since).total_seconds()) < 60
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from sqlalchemy import func, select
+from app.database import AsyncSessionLocal
+from app.models import Lease, Study, Summary
+from app.services import summary_store
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.services.summary_store import get_or_create_summary, stream_summary_events, store_summary
+
+
+@pytest.fixture
+def study_id(db):
+    study = Study(title="Protein timing and hypertrophy", abstract="Timing did not matter.", authors="Doe J")
+    db.add(study)
+    db.commit()
+    study_id = study.id
+    # End the read transaction, or SQLite blocks the app's writes
+    db.commit()
+    return study_id
+
+
+async def events_for(study_id: int) -> list:
+    events = [event async for event in stream_summary_events(study_id)]
+    # Generation releases its lease after handing over the summary
+    await asyncio.gather(*summary_store._background_tasks)
+    return events
+
+
+async def test_stream_relays_deltas_and_stores_their_text(db, study_id, fake_anthropic):
+    events = await events_for(study_id)
+
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "status" and kinds[-1] == "summary" and "delta" in kinds
+    streamed = "".join(value for kind, value in events if kind == "delta")
+    assert events[-1][1].summary_text == streamed
+    assert db.execute(select(Summary.summary_text)).scalar_one() == streamed
+    assert db.execute(select(func.count()).select_from(Lease)).scalar() == 0
+
+
+async def test_stream_serves_a_summary_stored_while_taking_the_lease(db, study_id, monkeypatch):
+    acquire_lease = summary_store.acquire_lease
+
+    async def finish_elsewhere_then_acquire(session, key, ttl):
+        # Another worker stores its summary and releases the lease just
+        # after this caller found no summary
+        async with AsyncSessionLocal() as other:
+            await store_summary(other, study_id, "Written elsewhere", "claude-test")
+        return await acquire_lease(session, key, ttl)
+
+    async def no_generation(**kwargs):
+        raise AssertionError("generated a second summary")
+        yield
+
+    monkeypatch.setattr(summary_store, "acquire_lease", finish_elsewhere_then_acquire)
+    monkeypatch.setattr(summary_store, "stream_summary", no_generation)
+
+    events = await events_for(study_id)
+
+    assert [(kind, value.summary_text) for kind, value in events] == [("summary", "Written elsewhere")]
+    assert db.execute(select(func.count()).select_from(Lease)).scalar() == 0
+
+
+async def test_callers_joining_a_rejected_generation_are_admitted_on_their_own(db, study_id, monkeypatch):
+    admission = AdmissionController(max_concurrent=4, max_per_client=1)
+    monkeypatch.setattr(summary_store, "llm_admission", admission)
+    generated = []
+
+    async def generate_summary(**kwargs):
+        generated.append(kwargs["title"])
+        return "Timing did not matter.", "claude-test", {}
+
+    monkeypatch.setattr(summary_store, "generate_summary", generate_summary)
+    # Client "busy" already has its one request running
+    ticket = await admission.acquire("busy")
+
+    busy, other = await asyncio.gather(
+        get_or_create_summary(study_id, "busy"), get_or_create_summary(study_id, "other"),
+        return_exceptions=True,
+    )
+    admission.release("busy", ticket)
+
+    assert isinstance(busy, AdmissionRejected) and busy.status_code == 429
+    assert other.summary_text == "Timing did not matter."
+    assert len(generated) == 1
+
+
+async def test_capacity_rejections_reach_every_coalesced_caller(db, study_id, monkeypatch):
+    admission = AdmissionController(max_concurrent=1, max_queue=0)
+    monkeypatch.setattr(summary_store, "llm_admission", admission)
+    ticket = await admission.acquire(None)
+
+    results = await asyncio.gather(
+        get_or_create_summary(study_id, "first"), get_or_create_summary(study_id, "second"),
+        return_exceptions=True,
+    )
+    admission.release(None, ticket)
+
+    assert [result.status_code for result in results] == [503, 503]
+    assert admission.rejected["queue_full"] == 1
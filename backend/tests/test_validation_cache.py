@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import httpx
+import pytest
+from sqlalchemy import select, update
+from app.api import claims
+from app.database import AsyncSessionLocal
+from app.models import ClaimValidation, Study
+from app.services.llm_client import LLMClient, set_llm_client
+from app.services.retrieval import refresh_study_index
+from app.services.validation_cache import ValidationCache, cache_key
+
+CLAIM = "Creatine supplementation increases strength"
+WRITTEN = datetime(2024, 5, 1, 12, 0)
+
+
+def evidence(*ids, updated_at=WRITTEN):
+    return [SimpleNamespace(id=study_id, updated_at=updated_at) for study_id in ids]
+
+
+def test_key_ignores_case_punctuation_and_spacing():
+    key = cache_key(CLAIM, evidence(1, 2))
+    assert key == cache_key("  creatine SUPPLEMENTATION increases strength!!", evidence(1, 2))
+    assert key == cache_key("Creatine supplementation, increases   strength.", evidence(1, 2))
+    assert len(key) == 64 and key == cache_key(CLAIM, evidence(1, 2))
+
+
+def test_key_changes_with_the_claim_or_its_evidence():
+    key = cache_key(CLAIM, evidence(1, 2))
+    assert key != cache_key("Creatine supplementation increases endurance", evidence(1, 2))
+    assert key != cache_key(CLAIM, evidence(1, 2, 3))
+    assert key != cache_key(CLAIM, evidence(1, 3))
+    assert key != cache_key(CLAIM, evidence(1, 2, updated_at=WRITTEN + timedelta(seconds=1)))
+    assert key != cache_key(CLAIM, evidence(1, 2, updated_at=None))
+
+
+async def test_stored_results_expire_after_the_db_ttl(db):
+    async with AsyncSessionLocal() as session:
+        await ValidationCache().set(session, "key", CLAIM, {"verdict": "SUPPORTED"}, {"llm_calls": 1})
+        fresh = ValidationCache()
+        assert await fresh.get(session, "key") == {"verdict": "SUPPORTED"}
+        assert fresh.stats()["db_hits"] == 1
+
+        await session.execute(update(ClaimValidation).values(created_at=datetime.utcnow() - timedelta(days=31)))
+        await session.commit()
+        expired = ValidationCache()
+        assert await expired.get(session, "key") is None
+        assert expired.stats()["misses"] == 1
+
+
+@pytest.fixture
+def creatine_studies(db, monkeypatch):
+    monkeypatch.setattr(claims, "CLAIM_RETRIEVAL", "bm25")
+    monkeypatch.setattr(claims, "validation_cache", ValidationCache())
+    db.add_all([
+        Study(title=f"Creatine supplementation and strength in cohort {number}", abstract="Strength rose.")
+        for number in range(5)
+    ])
+    db.commit()
+    refresh_study_index(force=True)
+    db.commit()
+
+
+async def validate(api) -> dict:
+    response = await api.post("/api/claims/validate", json={"claim": CLAIM})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_repeated_claims_are_served_from_the_cache(api, creatine_studies, fake_anthropic):
+    first = await validate(api)
+    again = await validate(api)
+
+    assert first["usage"]["llm_calls"] == 1
+    # Replayed without a model call, so without usage
+    assert again["usage"] is None
+    assert {**again, "usage": first["usage"]} == first
+    assert claims.validation_cache.stats()["memory_hits"] == 1
+
+
+async def test_stored_rows_are_served_without_a_model_call(api, creatine_studies, fake_anthropic, db, monkeypatch):
+    first = await validate(api)
+    stored = db.execute(select(ClaimValidation.llm_calls, ClaimValidation.claim)).one()
+    db.commit()
+    assert stored == (1, "creatine supplementation increases strength")
+
+    # Another worker (or a restart): nothing in memory, and no model to call
+    monkeypatch.setattr(claims, "validation_cache", ValidationCache())
+
+    def no_model(request):
+        raise AssertionError("called the model for a stored validation")
+
+    set_llm_client(LLMClient(api_key="test", base_url="http://anthropic", transport=httpx.MockTransport(no_model)))
+    again = await validate(api)
+
+    assert again["usage"] is None and again["verdict"] == first["verdict"]
+    assert claims.validation_cache.stats()["db_hits"] == 1
+
+
+async def test_editing_an_evidence_study_invalidates_the_result(api, creatine_studies, fake_anthropic, db):
+    await validate(api)
+    study_id = db.execute(select(Study.id)).scalars().first()
+    db.commit()
+
+    patched = await api.patch(f"/api/studies/{study_id}", json={"abstract": "Strength rose, lean mass did not."})
+    assert patched.status_code == 200
+    again = await validate(api)
+
+    assert again["usage"]["llm_calls"] == 1
+    assert len(db.execute(select(ClaimValidation.cache_key)).all()) == 2
@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+from sqlalchemy import select
+from app.api import studies as studies_api
+from app.models import Study
+from app.services import vector_index as vector_index_module
+from app.services.vector_index import VectorIndex
+
+# "hypertrophy" and "muscle growth" share contexts in the bridging studies,
+# so LSA puts them close together; the target studies only say hypertrophy
+CORPUS = {
+    "bridge": [
+        "Muscle growth and hypertrophy after resistance training",
+        "Resistance training volume, muscle growth and hypertrophy",
+        "Hypertrophy and muscle growth with protein supplementation",
+        "Muscle growth, hypertrophy and training frequency",
+    ],
+    "target": [
+        "Quadriceps hypertrophy after eight weeks of resistance training",
+        "Hypertrophy of the biceps with high and low loads",
+    ],
+    "other": [
+        "Caffeine ingestion improves cycling endurance performance",
+        "Caffeine dose and endurance time trial performance",
+        "Sleep deprivation impairs recovery and mood",
+        "Sleep duration and recovery in athletes",
+        "Creatine supplementation and sprint power output",
+        "Creatine loading and repeated sprint power",
+    ],
+}
+
+
+def rows(db):
+    return db.execute(select(Study.id, Study.title, Study.abstract, Study.keywords)).all()
+
+
+@pytest.fixture
+def corpus(db):
+    ids = {}
+    for group, titles in CORPUS.items():
+        studies = [Study(title=title) for title in titles]
+        db.add_all(studies)
+        db.flush()
+        ids[group] = {study.id for study in studies}
+    db.commit()
+    return ids
+
+
+@pytest.fixture
+def index(db, tmp_path):
+    return VectorIndex(path=str(tmp_path / "vectors"), dim=4, refresh_interval=0)
+
+
+def test_semantic_search_matches_different_wording(db, corpus, index):
+    index.refresh(db)
+    found = [study_id for study_id, _ in index.search("muscle growth", limit=6, min_score=0.3)]
+
+    assert set(found) == corpus["bridge"] | corpus["target"]
+
+
+def test_snapshot_reloads_memory_mapped(db, corpus, index):
+    index.refresh(db)
+    expected = index.search("muscle growth")
+
+    reloaded = VectorIndex(path=index.path, dim=4, refresh_interval=0)
+    reloaded.refresh(db)
+
+    assert isinstance(reloaded._vectors, np.memmap)
+    assert reloaded._fitted_docs == len(reloaded) == 12
+    assert [study_id for study_id, _ in reloaded.search("muscle growth")] == [study_id for study_id, _ in expected]
+    assert np.allclose([score for _, score in reloaded.search("muscle growth")], [score for _, score in expected])
+
+
+def test_changes_are_folded_in_without_a_refit(db, corpus, index):
+    index.refresh(db)
+    components = index._components
+    db.add(Study(title="Hypertrophy of the triceps with resistance training"))
+    target = db.execute(select(Study).where(Study.id == min(corpus["target"]))).scalar_one()
+    target.title = "Caffeine and endurance cycling performance"
+    db.commit()
+
+    index.refresh(db)
+    found = {study_id for study_id, _ in index.search("muscle growth", limit=12, min_score=0.3)}
+
+    assert index._components is components and index._fitted_docs == 12 and len(index) == 13
+    new_id = db.execute(select(Study.id).where(Study.title.like("%triceps%"))).scalar()
+    assert new_id in found and target.id not in found
+
+    index.remove(new_id)
+    assert new_id not in {study_id for study_id, _ in index.search("muscle growth", limit=12)}
+    # Still in the snapshot written by the last refresh
+    snapshot = VectorIndex(path=index.path)
+    assert snapshot.load(index.path)
+    assert new_id in {study_id for study_id, _ in snapshot.search("hypertrophy triceps", limit=13)}
+
+
+def test_refits_once_the_corpus_outgrows_the_growth_factor(db, corpus, index):
+    index.refit_growth = 1.5
+    index.refresh(db)
+    # Up to 12 * 1.5 studies are folded in
+    db.add_all([Study(title=f"Resistance training study {number}") for number in range(6)])
+    db.commit()
+    index.refresh(db)
+    assert index._fitted_docs == 12 and len(index) == 18
+
+    db.add(Study(title="Resistance training study 6"))
+    db.commit()
+    index.refresh(db)
+    assert index._fitted_docs == len(index) == 19
+
+
+@pytest.fixture
+def api_index(corpus, tmp_path, monkeypatch):
+    # The process-wide index still holds earlier tests' studies
+    index = VectorIndex(path=str(tmp_path / "api-vectors"), dim=4, refresh_interval=0)
+    monkeypatch.setattr(vector_index_module, "vector_index", index)
+    monkeypatch.setattr(studies_api, "vector_index", index)
+    monkeypatch.setattr(studies_api, "RANKED_SEARCH_LIMIT", 8)
+    return index
+
+
+async def ranked_ids(api, mode: str) -> list:
+    response = await api.get("/api/studies/", params={"search": "muscle growth", "mode": mode, "fields": "id"})
+    assert response.status_code == 200
+    return [study["id"] for study in response.json()["studies"]]
+
+
+async def test_api_modes_order_muscle_growth_results(api, corpus, api_index):
+    fulltext = await ranked_ids(api, "fulltext")
+    semantic = await ranked_ids(api, "semantic")
+    hybrid = await ranked_ids(api, "hybrid")
+
+    assert set(fulltext) == corpus["bridge"]
+    assert set(semantic) >= corpus["bridge"] | corpus["target"]
+    # Unrelated studies, if they make the cut at all, rank last
+    assert set(semantic[:6]) == corpus["bridge"] | corpus["target"]
+    # Hybrid ranks studies found by both retrievers above the semantic-only ones
+    assert set(hybrid[:4]) == corpus["bridge"]
+    assert corpus["target"] <= set(hybrid[4:])
@@ -17,6 +17,7 @@ export interface Study {
   publication_year?: number;
   journal?: string;
   doi?: string;
+  pmid?: string;
   pdf_url?: string;
   keywords?: string;
   created_at: string;
@@ -28,6 +29,8 @@ export interface StudyListResponse {
   studies: Study[];
   page: number;
   page_size: number;
+  next_cursor?: string | null;
+  total_estimated?: boolean;
 }
 
 export interface Summary {
@@ -39,7 +42,13 @@ export interface Summary {
 }
 
 export const studiesApi = {
-  list: async (params: { skip?: number; limit?: number; search?: string }) => {
+  list: async (params: {
+    skip?: number;
+    limit?: number;
+    search?: string;
+    cursor?: string;
+    mode?: 'fulltext' | 'substring' | 'semantic' | 'hybrid';
+  }) => {
     const response = await apiClient.get<StudyListResponse>('/api/studies/', { params });
     return response.data;
   },
@@ -62,6 +71,31 @@ export const summariesApi = {
     const response = await apiClient.get<Summary>(`/api/summaries/${studyId}`);
     return response.data;
   },
+
+  // Streams the summary over SSE; returns a function that closes the stream
+  stream: (
+    studyId: number,
+    handlers: {
+      onDelta: (text: string) => void;
+      onDone: (summary: Summary) => void;
+      onError?: (detail: string) => void;
+    }
+  ) => {
+    const source = new EventSource(`${API_BASE_URL}/api/summaries/${studyId}/stream`);
+    source.addEventListener('delta', (e) => {
+      handlers.onDelta(JSON.parse((e as MessageEvent).data).text);
+    });
+    source.addEventListener('summary', (e) => {
+      source.close();
+      handlers.onDone(JSON.parse((e as MessageEvent).data));
+    });
+    source.addEventListener('error', (e) => {
+      source.close();
+      const data = (e as MessageEvent).data;
+      handlers.onError?.(data ? JSON.parse(data).detail : 'Connection lost');
+    });
+    return () => source.close();
+  },
 };
 
 export default apiClient;
\ No newline at end of file